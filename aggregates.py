@@ -0,0 +1,305 @@
+import argparse
+import sys
+import time
+import pandas as pd
+import dbconnection
+import loadstate
+import loadjournal
+import queries
+import loadmetrics
+
+# Precomputed summary tables so the app's common questions (a team's record in a
+# tournament season, head to head between two clubs, recent form) read a handful
+# of rows instead of aggregating all of Matches.
+# They are kept up to date from the matches inserted since the last run: every
+# Match_ID above the stored watermark is folded into the running totals.
+
+LAST_MATCH_STATE = "aggregates.last_match_id"
+
+# Matches read from Matches per query while catching up
+READ_BATCH_ROWS = 200000
+
+# Recent matches that make up a team's form
+FORM_MATCHES = 5
+
+# Seasons run from July to June, a match in March 2016 belongs to season 2015
+SEASON_START_MONTH = 7
+
+# Team_IDs per query when recomputing form
+FORM_TEAMS_PER_QUERY = 1000
+
+AGGREGATE_TABLE_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS Team_Standings (
+        Team_ID INT,
+        Season INT,
+        Match_Tournament VARCHAR(255),
+        Played INT,
+        Won INT,
+        Drawn INT,
+        Lost INT,
+        Goals_For INT,
+        Goals_Against INT,
+        Points INT,
+        PRIMARY KEY (Team_ID, Season, Match_Tournament),
+        INDEX Standings_Tournament_Season (Match_Tournament, Season, Points),
+        FOREIGN KEY (Team_ID) REFERENCES Teams(Team_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Head_To_Head (
+        Team_A INT,
+        Team_B INT,
+        Played INT,
+        Team_A_Wins INT,
+        Team_B_Wins INT,
+        Draws INT,
+        Team_A_Goals INT,
+        Team_B_Goals INT,
+        PRIMARY KEY (Team_A, Team_B),
+        FOREIGN KEY (Team_A) REFERENCES Teams(Team_ID),
+        FOREIGN KEY (Team_B) REFERENCES Teams(Team_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Team_Form (
+        Team_ID INT PRIMARY KEY,
+        Form VARCHAR(16),
+        Form_Points INT,
+        Goals_For INT,
+        Goals_Against INT,
+        Last_Match_Date DATE,
+        FOREIGN KEY (Team_ID) REFERENCES Teams(Team_ID)
+    )
+    """,
+]
+
+STANDINGS_COLUMNS = ['Team_ID', 'Season', 'Match_Tournament', 'Played', 'Won', 'Drawn', 'Lost',
+                     'Goals_For', 'Goals_Against', 'Points']
+HEAD_TO_HEAD_COLUMNS = ['Team_A', 'Team_B', 'Played', 'Team_A_Wins', 'Team_B_Wins', 'Draws',
+                        'Team_A_Goals', 'Team_B_Goals']
+FORM_COLUMNS = ['Team_ID', 'Form', 'Form_Points', 'Goals_For', 'Goals_Against', 'Last_Match_Date']
+
+def add_to_existing(columns, key_columns):
+    #ON DUPLICATE KEY UPDATE clause adding the new counts onto the stored ones
+    updates = ", ".join(f"{col} = {col} + VALUES({col})" for col in columns if col not in key_columns)
+    return f"ON DUPLICATE KEY UPDATE {updates}"
+
+def replace_existing(columns, key_columns):
+    updates = ", ".join(f"{col} = VALUES({col})" for col in columns if col not in key_columns)
+    return f"ON DUPLICATE KEY UPDATE {updates}"
+
+def create_tables(conn):
+    cursor = conn.cursor()
+    for query in AGGREGATE_TABLE_QUERIES:
+        cursor.execute(query)
+    cursor.close()
+
+def team_results(matches):
+    #Every match twice, once from each team's side, with goals for/against and the result
+    home = pd.DataFrame({
+        'Team_ID': matches['Home_Team'], 'Match_Date': matches['Match_Date'],
+        'Match_Tournament': matches['Match_Tournament'],
+        'Goals_For': matches['Home_Goals'], 'Goals_Against': matches['Away_Goals'],
+    })
+    away = pd.DataFrame({
+        'Team_ID': matches['Away_Team'], 'Match_Date': matches['Match_Date'],
+        'Match_Tournament': matches['Match_Tournament'],
+        'Goals_For': matches['Away_Goals'], 'Goals_Against': matches['Home_Goals'],
+    })
+    results = pd.concat([home, away], ignore_index=True)
+    results['Won'] = (results['Goals_For'] > results['Goals_Against']).astype('int64')
+    results['Drawn'] = (results['Goals_For'] == results['Goals_Against']).astype('int64')
+    results['Lost'] = (results['Goals_For'] < results['Goals_Against']).astype('int64')
+    return results
+
+def standings_deltas(matches):
+    """Played/W/D/L/goals/points per team, season and tournament for the given matches.
+
+    Matches without a date can't be placed in a season and are left out.
+    """
+    results = team_results(matches)
+    dates = pd.to_datetime(results['Match_Date'], errors='coerce')
+    results = results[dates.notna()]
+    dates = dates[dates.notna()]
+    results = results.assign(
+        Season=(dates.dt.year - (dates.dt.month < SEASON_START_MONTH)).astype('int64'),
+        Played=1,
+    )
+    standings = results.groupby(['Team_ID', 'Season', 'Match_Tournament'], as_index=False)[
+        ['Played', 'Won', 'Drawn', 'Lost', 'Goals_For', 'Goals_Against']
+    ].sum()
+    standings['Points'] = 3 * standings['Won'] + standings['Drawn']
+    return standings[STANDINGS_COLUMNS]
+
+def head_to_head_deltas(matches):
+    #Pairwise totals, always keyed with the lower Team_ID as Team_A
+    home_is_a = matches['Home_Team'] < matches['Away_Team']
+    team_a_goals = matches['Home_Goals'].where(home_is_a, matches['Away_Goals'])
+    team_b_goals = matches['Away_Goals'].where(home_is_a, matches['Home_Goals'])
+    pairs = pd.DataFrame({
+        'Team_A': matches['Home_Team'].where(home_is_a, matches['Away_Team']),
+        'Team_B': matches['Away_Team'].where(home_is_a, matches['Home_Team']),
+        'Played': 1,
+        'Team_A_Wins': (team_a_goals > team_b_goals).astype('int64'),
+        'Team_B_Wins': (team_a_goals < team_b_goals).astype('int64'),
+        'Draws': (team_a_goals == team_b_goals).astype('int64'),
+        'Team_A_Goals': team_a_goals,
+        'Team_B_Goals': team_b_goals,
+    })
+    return pairs.groupby(['Team_A', 'Team_B'], as_index=False)[HEAD_TO_HEAD_COLUMNS[2:]].sum()
+
+def read_new_matches(conn, after_id, up_to_id):
+    #Matches with after_id < Match_ID <= up_to_id, in frames of READ_BATCH_ROWS
+    cursor = conn.cursor()
+    start = after_id
+    while start < up_to_id:
+        end = min(start + READ_BATCH_ROWS, up_to_id)
+        cursor.execute("""
+            SELECT Match_ID, Match_Date, Match_Tournament, Home_Goals, Away_Goals, Home_Team, Away_Team
+            FROM Matches WHERE Match_ID > %s AND Match_ID <= %s
+        """, (start, end))
+        rows = cursor.fetchall()
+        if rows:
+            yield pd.DataFrame(rows, columns=[d[0] for d in cursor.description])
+        start = end
+    cursor.close()
+
+def refresh_form(conn, team_ids):
+    """Recompute Team_Form for the given teams from their last FORM_MATCHES matches.
+
+    Form can't be updated by adding deltas (the oldest match has to drop out),
+    so only the teams that played in the new matches are recomputed.
+    """
+    team_ids = sorted(team_ids)
+    cursor = conn.cursor()
+    write_cursor = dbconnection.prepared_cursor(conn)
+    for start in range(0, len(team_ids), FORM_TEAMS_PER_QUERY):
+        chunk = team_ids[start:start + FORM_TEAMS_PER_QUERY]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        # the (Home_Team, Match_Date) and (Away_Team, Match_Date) indexes serve both halves
+        cursor.execute(f"""
+            SELECT Team_ID, Match_Date, Goals_For, Goals_Against FROM (
+                SELECT Team_ID, Match_ID, Match_Date, Goals_For, Goals_Against,
+                       ROW_NUMBER() OVER (PARTITION BY Team_ID ORDER BY Match_Date DESC, Match_ID DESC) AS Recent
+                FROM (
+                    SELECT Home_Team AS Team_ID, Match_ID, Match_Date, Home_Goals AS Goals_For, Away_Goals AS Goals_Against
+                    FROM Matches WHERE Home_Team IN ({placeholders})
+                    UNION ALL
+                    SELECT Away_Team, Match_ID, Match_Date, Away_Goals, Home_Goals
+                    FROM Matches WHERE Away_Team IN ({placeholders})
+                ) AS Team_Matches
+            ) AS Ranked
+            WHERE Recent <= %s
+            ORDER BY Team_ID, Recent
+        """, chunk + chunk + [FORM_MATCHES])
+        recent = pd.DataFrame(cursor.fetchall(), columns=['Team_ID', 'Match_Date', 'Goals_For', 'Goals_Against'])
+        if recent.empty:
+            continue
+
+        # newest first, e.g. "WWDLW"
+        recent['Result'] = 'D'
+        recent.loc[recent['Goals_For'] > recent['Goals_Against'], 'Result'] = 'W'
+        recent.loc[recent['Goals_For'] < recent['Goals_Against'], 'Result'] = 'L'
+        recent['Points'] = recent['Result'].map({'W': 3, 'D': 1, 'L': 0})
+        form = recent.groupby('Team_ID', sort=False).agg(
+            Form=('Result', ''.join), Form_Points=('Points', 'sum'),
+            Goals_For=('Goals_For', 'sum'), Goals_Against=('Goals_Against', 'sum'),
+            Last_Match_Date=('Match_Date', 'first'),
+        ).reset_index()
+        dbconnection.insert_rows(write_cursor, 'Team_Form', FORM_COLUMNS, dbconnection.frame_rows(form, FORM_COLUMNS),
+                                 replace_existing(FORM_COLUMNS, ['Team_ID']))
+    write_cursor.close()
+    cursor.close()
+
+def update_aggregates(conn):
+    """Fold every match inserted since the last run into the aggregate tables.
+
+    Standings and head to head totals are increased with INSERT ... ON
+    DUPLICATE KEY UPDATE col = col + VALUES(col), form is recomputed for the
+    teams involved. The totals and the new watermark are committed together,
+    so a failed run leaves the tables as they were and the next run retries.
+    Returns the number of matches folded in.
+    """
+    with loadmetrics.stage('aggregates.update'):
+        added = fold_new_matches(conn)
+    loadmetrics.add_rows('aggregates.update', added)
+    return added
+
+def fold_new_matches(conn):
+    started = time.perf_counter()
+    create_tables(conn)
+    last_id = int(loadstate.get_state(conn, LAST_MATCH_STATE, 0))
+
+    # Match_ID ranges commit out of order, so only up to the first one still being inserted
+    # (matchesloader --resume may also delete parts of an interrupted one)
+    max_id = loadjournal.committed_until(conn)
+    if max_id <= last_id:
+        print("Aggregates are up to date.")
+        return 0
+
+    write_cursor = dbconnection.prepared_cursor(conn)
+    matches_added = 0
+    teams = set()
+    try:
+        for matches in read_new_matches(conn, last_id, max_id):
+            dbconnection.insert_rows(write_cursor, 'Team_Standings', STANDINGS_COLUMNS,
+                                     dbconnection.frame_rows(standings_deltas(matches), STANDINGS_COLUMNS),
+                                     add_to_existing(STANDINGS_COLUMNS, STANDINGS_COLUMNS[:3]))
+            dbconnection.insert_rows(write_cursor, 'Head_To_Head', HEAD_TO_HEAD_COLUMNS,
+                                     dbconnection.frame_rows(head_to_head_deltas(matches), HEAD_TO_HEAD_COLUMNS),
+                                     add_to_existing(HEAD_TO_HEAD_COLUMNS, HEAD_TO_HEAD_COLUMNS[:2]))
+            teams.update(matches['Home_Team'].tolist())
+            teams.update(matches['Away_Team'].tolist())
+            matches_added += len(matches)
+
+        refresh_form(conn, teams)
+        loadstate.set_state(conn, LAST_MATCH_STATE, max_id, commit=False)
+        conn.commit()
+        queries.invalidate_cache(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        write_cursor.close()
+
+    print(f"Aggregates: folded in {matches_added} matches, form refreshed for {len(teams)} teams "
+          f"in {time.perf_counter() - started:.1f}s")
+    return matches_added
+
+def rebuild_aggregates(conn):
+    #Empty the aggregate tables and fold in every match again
+    create_tables(conn)
+    cursor = conn.cursor()
+    for table in ('Team_Standings', 'Head_To_Head', 'Team_Form'):
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.close()
+    loadstate.set_state(conn, LAST_MATCH_STATE, 0, commit=False)
+    conn.commit()
+    return update_aggregates(conn)
+
+def run(args):
+    conn = dbconnection.get_connection()
+    try:
+        if args.rebuild:
+            rebuild_aggregates(conn)
+        else:
+            update_aggregates(conn)
+    finally:
+        conn.close()
+
+def add_arguments(parser):
+    parser.add_argument("--rebuild", action="store_true",
+                        help="empty the aggregate tables and recompute them from all of Matches")
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the standings, head to head and form tables from new matches")
+    add_arguments(parser)
+    try:
+        run(parser.parse_args())
+    except Exception as e:
+        print(f"Error updating aggregates: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
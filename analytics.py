@@ -0,0 +1,200 @@
+import argparse
+import os
+import sys
+import time
+import pandas as pd
+import dbconnection
+
+# Analytics mode: heavy aggregate reports run in-process on DuckDB instead of
+# on the MySQL Matches table. DuckDB reads games.parquet directly (the full
+# match history, also the matches whose teams never made it into Teams) plus
+# parquet exports of Teams, Players, Stadiums and Team_Aliases, so the
+# transactional database is only touched by the export.
+#
+#   python analytics.py export                  # refresh the table exports
+#   python analytics.py report goals-by-decade
+#   python analytics.py sql "SELECT COUNT(*) FROM games"
+#
+# Needs "pip install duckdb".
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+EXPORT_DIR = os.path.join(project_dir, 'data', 'analytics')
+
+# Tables exported from MySQL, exposed in DuckDB under the lowercase name
+EXPORT_TABLES = ['Teams', 'Players', 'Stadiums', 'Team_Aliases']
+
+def export_tables(conn, export_dir=EXPORT_DIR):
+    #Write each table in EXPORT_TABLES to <table>.parquet
+    os.makedirs(export_dir, exist_ok=True)
+    for table in EXPORT_TABLES:
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {table}")
+        frame = pd.DataFrame(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+        cursor.close()
+        frame.to_parquet(os.path.join(export_dir, f"{table.lower()}.parquet"), index=False)
+        print(f"Exported {table}: {len(frame)} rows in {time.perf_counter() - started:.1f}s")
+
+def connect(games_path=None, export_dir=EXPORT_DIR):
+    """In-memory DuckDB connection with games, teams, players, stadiums and aliases views.
+
+    games.parquet comes from the dataset cache (downloaded if needed) unless
+    a path is given. team_games is games with the resolved Team_IDs joined on.
+    """
+    try:
+        import duckdb
+    except ImportError:
+        raise RuntimeError("analytics mode needs duckdb, install it with: pip install duckdb")
+
+    if games_path is None:
+        import matchesloader
+        games_path = matchesloader.download_games()
+
+    con = duckdb.connect()
+    con.execute(f"CREATE VIEW games AS SELECT * FROM read_parquet('{parquet_path(games_path)}')")
+    for table in EXPORT_TABLES:
+        path = os.path.join(export_dir, f"{table.lower()}.parquet")
+        if not os.path.exists(path):
+            raise RuntimeError(f"{path} is missing, run: python analytics.py export")
+        con.execute(f"CREATE VIEW {table.lower()} AS SELECT * FROM read_parquet('{parquet_path(path)}')")
+
+    con.execute("""
+        CREATE VIEW team_games AS
+        SELECT g.*, TRY_CAST(g.date AS DATE) AS match_date, home.Team_ID AS home_team_id, away.Team_ID AS away_team_id
+        FROM games g
+        LEFT JOIN team_aliases home ON home.Alias_Name = g.home AND home.Team_ID IS NOT NULL
+        LEFT JOIN team_aliases away ON away.Alias_Name = g.away AND away.Team_ID IS NOT NULL
+    """)
+    return con
+
+def parquet_path(path):
+    #Forward slashes and escaped quotes so the path works inside a DuckDB string literal
+    return str(path).replace('\\', '/').replace("'", "''")
+
+def goals_by_decade(con):
+    #Matches, average goals and home win share per tournament and decade, over the whole history
+    return con.execute("""
+        SELECT competition, (YEAR(TRY_CAST(date AS DATE)) // 10) * 10 AS decade, COUNT(*) AS matches,
+               ROUND(AVG(gh + ga), 2) AS avg_goals, ROUND(AVG(CASE WHEN gh > ga THEN 1 ELSE 0 END), 3) AS home_win_share
+        FROM games
+        WHERE TRY_CAST(date AS DATE) IS NOT NULL
+        GROUP BY ALL
+        ORDER BY competition, decade
+    """).df()
+
+def goal_distribution(con):
+    #How often each total number of goals happens per tournament
+    return con.execute("""
+        SELECT competition, gh + ga AS goals, COUNT(*) AS matches
+        FROM games GROUP BY ALL ORDER BY competition, goals
+    """).df()
+
+def team_matches(con, team_id, limit=10):
+    #Latest matches of a database team, found through its aliases in the full history
+    return con.execute("""
+        SELECT match_date, competition, home, away, gh, ga FROM team_games
+        WHERE home_team_id = ? OR away_team_id = ?
+        ORDER BY match_date DESC LIMIT ?
+    """, [team_id, team_id, limit]).df()
+
+def head_to_head(con, team_a, team_b):
+    #Record of team_a against team_b over the full history
+    return con.execute("""
+        SELECT COUNT(*) AS played,
+               SUM(CASE WHEN (home_team_id = ? AND gh > ga) OR (away_team_id = ? AND ga > gh) THEN 1 ELSE 0 END) AS wins,
+               SUM(CASE WHEN gh = ga THEN 1 ELSE 0 END) AS draws,
+               SUM(CASE WHEN (home_team_id = ? AND gh < ga) OR (away_team_id = ? AND ga < gh) THEN 1 ELSE 0 END) AS losses
+        FROM team_games
+        WHERE (home_team_id = ? AND away_team_id = ?) OR (home_team_id = ? AND away_team_id = ?)
+    """, [team_a, team_a, team_a, team_a, team_a, team_b, team_b, team_a]).df()
+
+def team_records(con):
+    #Played/won/drawn/lost and goals for every database team over the full history
+    return con.execute("""
+        WITH sides AS (
+            SELECT home_team_id AS team_id, gh AS goals_for, ga AS goals_against FROM team_games WHERE home_team_id IS NOT NULL
+            UNION ALL
+            SELECT away_team_id, ga, gh FROM team_games WHERE away_team_id IS NOT NULL
+        )
+        SELECT t.Team_Name, s.team_id, COUNT(*) AS played,
+               SUM(CASE WHEN goals_for > goals_against THEN 1 ELSE 0 END) AS won,
+               SUM(CASE WHEN goals_for = goals_against THEN 1 ELSE 0 END) AS drawn,
+               SUM(CASE WHEN goals_for < goals_against THEN 1 ELSE 0 END) AS lost,
+               SUM(goals_for) AS goals_for, SUM(goals_against) AS goals_against
+        FROM sides s JOIN teams t ON t.Team_ID = s.team_id
+        GROUP BY ALL ORDER BY played DESC
+    """).df()
+
+def squad(con, team_id):
+    return con.execute("SELECT * FROM players WHERE Team_ID = ? ORDER BY Overall_Rating DESC", [team_id]).df()
+
+def top_players(con, limit=10, position=None):
+    if position is None:
+        return con.execute("SELECT * FROM players ORDER BY Overall_Rating DESC LIMIT ?", [limit]).df()
+    return con.execute("SELECT * FROM players WHERE Position = ? ORDER BY Overall_Rating DESC LIMIT ?",
+                       [position, limit]).df()
+
+def team_with_stadium(con, team_id):
+    return con.execute("""
+        SELECT t.*, s.Stadium_Name, s.Stadium_Country, s.Stadium_Confederation, s.Stadium_City
+        FROM teams t LEFT JOIN stadiums s ON s.Stadium_ID = t.Home_Stadium
+        WHERE t.Team_ID = ?
+    """, [team_id]).df()
+
+def unmatched_share(con):
+    #Share of the history with an unresolved team on at least one side, i.e. never loaded into Matches
+    return con.execute("""
+        SELECT COUNT(*) AS matches,
+               ROUND(AVG(CASE WHEN home_team_id IS NULL OR away_team_id IS NULL THEN 1 ELSE 0 END), 3) AS unmatched_share
+        FROM team_games
+    """).df()
+
+REPORTS = {
+    'goals-by-decade': goals_by_decade,
+    'goal-distribution': goal_distribution,
+    'team-records': team_records,
+    'unmatched-share': unmatched_share,
+}
+
+def run(args):
+    if args.action == "export":
+        conn = dbconnection.get_connection()
+        try:
+            export_tables(conn)
+        finally:
+            conn.close()
+        return
+
+    if not args.query:
+        raise ValueError("report and sql need a query")
+    if args.action == "report" and args.query not in REPORTS:
+        raise ValueError(f"unknown report '{args.query}', choose from {', '.join(REPORTS)}")
+
+    con = connect(args.games)
+    started = time.perf_counter()
+    if args.action == "report":
+        result = REPORTS[args.query](con)
+    else:
+        result = con.execute(args.query).df()
+    with pd.option_context('display.max_rows', args.rows, 'display.width', 200):
+        print(result)
+    print(f"{len(result)} rows in {time.perf_counter() - started:.2f}s")
+
+def add_arguments(parser):
+    parser.add_argument("action", choices=["export", "report", "sql"],
+                        help="export the tables to parquet, run a named report or run SQL")
+    parser.add_argument("query", nargs="?", help=f"report name ({', '.join(REPORTS)}) or SQL text")
+    parser.add_argument("--games", help="games.parquet to read (default the cached download)")
+    parser.add_argument("--rows", type=int, default=50, help="rows to print (default 50)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytical queries on DuckDB over games.parquet and table exports")
+    add_arguments(parser)
+    try:
+        run(parser.parse_args())
+    except Exception as e:
+        print(f"Analytics error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import mysql.connector
+import loadmetrics
+
+# Loader benchmark: generates synthetic source files (synthdata.py), loads them
+# into a separate benchmark database stage by stage and records rows/sec,
+# statements sent to the server and the peak memory so far (of this process and of
+# its largest worker) after each stage. Results can be
+# saved as a baseline and later runs are compared against it, a stage that got
+# more than TOLERANCE worse makes the run exit with status 1.
+#
+#   python benchmark.py --scale 10 --save-baseline
+#   python benchmark.py --scale 10 --bulk
+#
+# The benchmark database is dropped and recreated from naturaljoin.session.sql
+# on every run, never point --database at the real one. Round trips are read
+# from the server's global Questions counter, so nothing else should be using
+# the server while the benchmark runs.
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_PATH = os.path.join(project_dir, 'naturaljoin.session.sql')
+DEFAULT_BASELINE_PATH = os.path.join(project_dir, 'benchmark_baseline.json')
+DEFAULT_DATABASE = 'soccer_bench'
+
+# Allowed slowdown / extra round trips / extra memory before a stage counts as a regression
+TOLERANCE = 0.2
+
+def peak_rss_mb(children=False):
+    #Peak of the whole run so far, not of one stage: ru_maxrss never goes down
+    peak = loadmetrics.peak_rss_bytes(children)
+    return None if peak is None else peak / (1024 * 1024)
+
+def schema_statements():
+    #The CREATE TABLE blocks of naturaljoin.session.sql
+    with open(SCHEMA_PATH) as f:
+        blocks = f.read().split('-- @block')
+    return [block.strip().rstrip(';') for block in blocks if block.strip().startswith('CREATE TABLE')]
+
+def reset_database(database):
+    """Drop and recreate the benchmark database with the tables from naturaljoin."""
+    import dbconnection
+    settings = dbconnection.connection_settings()
+    settings.pop('database', None)
+    conn = mysql.connector.connect(**settings)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.execute(f"CREATE DATABASE `{database}`")
+    cursor.execute(f"USE `{database}`")
+    for statement in schema_statements():
+        cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def questions(conn):
+    #Statements the server received so far, from all clients
+    cursor = conn.cursor()
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+    value = int(cursor.fetchone()[1])
+    cursor.close()
+    return value
+
+def run_stage(results, name, monitor, work):
+    """Run one stage and record its time, rows/sec, round trips and peak memory so far.
+
+    work returns (result, rows), the result is handed back to the caller.
+    """
+    before = questions(monitor)
+    started = time.perf_counter()
+    result, rows = work()
+    seconds = time.perf_counter() - started
+    # minus the SHOW STATUS statement that read the starting value
+    round_trips = questions(monitor) - before - 1
+    peak = peak_rss_mb()
+    children_peak = peak_rss_mb(children=True)
+    results[name] = {
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+        'round_trips': round_trips,
+        'peak_rss_mb': None if peak is None else round(peak, 1),
+        'children_peak_rss_mb': None if children_peak is None else round(children_peak, 1),
+    }
+    print(f"[{name}] {rows} rows in {seconds:.2f}s, {round_trips} round trips")
+    return result
+
+def run_benchmark(args, paths):
+    # imported here so SOCCERDB_DATABASE is set before the pool is created
+    import dbconnection
+    import playerteamloader
+    import stadiumloader
+    import matchesloader
+    import aggregates
+
+    def players_source():
+        frames = playerteamloader.load_source(paths['players'])
+        return frames, len(frames[1])
+
+    def teams_players():
+        # the index of the synthetic players goes next to them, not over the real one in data/
+        index_path = os.path.join(os.path.dirname(paths['players']), 'similar_players.npz')
+        return playerteamloader.import_players(conn, teams_df, players, index_path), len(players)
+
+    def stadiums_source():
+        frames = stadiumloader.load_source(paths['stadiums'])
+        return frames, len(frames[0])
+
+    def stadium_assignment():
+        return stadiumloader.import_stadiums(conn, stadiums, home_teams_col, args.fallback), len(stadiums)
+
+    def matches():
+        inserted = matchesloader.import_matches(conn, batch_size=args.batch_size, bulk=args.bulk, stream=args.stream,
+                                                workers=args.workers, parquet_file_path=paths['matches'])
+        return inserted, inserted
+
+    def aggregate_tables():
+        added = aggregates.update_aggregates(conn)
+        return added, added
+
+    results = {}
+    monitor = dbconnection.connect()
+    conn = dbconnection.get_connection(allow_local_infile=args.bulk)
+    try:
+        teams_df, players = run_stage(results, 'players_source', monitor, players_source)
+        run_stage(results, 'teams_players', monitor, teams_players)
+        stadiums, home_teams_col = run_stage(results, 'stadiums_source', monitor, stadiums_source)
+        run_stage(results, 'stadiums', monitor, stadium_assignment)
+        run_stage(results, 'matches', monitor, matches)
+        run_stage(results, 'aggregates', monitor, aggregate_tables)
+    finally:
+        conn.close()
+        monitor.close()
+    return results
+
+def compare(results, baseline):
+    #Stages that got worse than the baseline by more than TOLERANCE, as printable lines
+    regressions = []
+    for stage, current in results.items():
+        previous = baseline.get('stages', {}).get(stage)
+        if previous is None:
+            continue
+        checks = [
+            ('rows/sec', current['rows_per_sec'], previous['rows_per_sec'], -1),
+            ('round trips', current['round_trips'], previous['round_trips'], 1),
+            ('process peak so far MB', current['peak_rss_mb'], previous['peak_rss_mb'], 1),
+            ('children peak so far MB', current.get('children_peak_rss_mb'), previous.get('children_peak_rss_mb'), 1),
+        ]
+        for label, now, before, worse_direction in checks:
+            if now is None or not before:
+                continue
+            change = (now - before) / before
+            marker = ""
+            if change * worse_direction > TOLERANCE:
+                marker = "  <-- regression"
+                regressions.append(f"{stage} {label}: {before} -> {now}")
+            print(f"{stage:<16} {label:<24} {before:>12} -> {now:>12} ({change:+.0%}){marker}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the loaders on synthetic data")
+    parser.add_argument("--scale", type=int, default=1, help="synthetic data size relative to the real datasets (default 1)")
+    parser.add_argument("--matches", type=int, help="number of synthetic matches (default synthdata's per scale count)")
+    parser.add_argument("--data-dir", help="use already generated files from this directory")
+    parser.add_argument("--database", default=DEFAULT_DATABASE,
+                        help=f"benchmark database, dropped and recreated every run (default {DEFAULT_DATABASE})")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--bulk", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--workers", type=int, default=1, help="match insert worker processes")
+    parser.add_argument("--fallback", default='hash')
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="baseline file to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--output", help="also write this run's results to a JSON file")
+    args = parser.parse_args()
+
+    if not re.fullmatch(r'\w+', args.database) or args.database == 'soccer':
+        print(f"Refusing to use '{args.database}' as the benchmark database")
+        sys.exit(1)
+    os.environ['SOCCERDB_DATABASE'] = args.database
+
+    import synthdata
+    data_dir = args.data_dir or os.path.join(synthdata.DEFAULT_OUT_DIR, f"{args.scale}x")
+    paths = {
+        'players': os.path.join(data_dir, 'FullData.csv'),
+        'stadiums': os.path.join(data_dir, 'Football Stadiums.csv'),
+        'matches': os.path.join(data_dir, 'games.parquet'),
+    }
+    if not all(os.path.exists(path) for path in paths.values()):
+        paths = synthdata.generate(data_dir, args.scale, matches=args.matches)
+
+    reset_database(args.database)
+    results = run_benchmark(args, paths)
+    run = {
+        'scale': args.scale,
+        'options': {'batch_size': args.batch_size, 'bulk': args.bulk, 'stream': args.stream, 'workers': args.workers},
+        'stages': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != run['scale'] or baseline.get('options') != run['options']:
+            print("Warning: baseline was recorded with a different scale or options")
+        print("\nCompared with baseline:")
+        regressions = compare(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions:")
+        for regression in regressions:
+            print(f"- {regression}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
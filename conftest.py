@@ -0,0 +1,122 @@
+import re
+import mysql.connector
+import pytest
+
+# A stand-in for the MySQL tables the load bookkeeping uses (Matches IDs,
+# Load_State, Load_Journal, Load_Rejects), so it can be tested without a server. Writes
+# only show up for other connections once committed, like InnoDB.
+
+class FakeDatabase:
+    def __init__(self):
+        self.match_ids = set()
+        self.state = {}
+        self.journal = {}
+        self.next_load_id = 1
+        self.locks = {}
+        self.rejects = []
+        # INSERTs of these Match_IDs fail like a lost connection would
+        self.fail_match_ids = set()
+
+    def connect(self):
+        return FakeConnection(self)
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.pending = []
+        self.commits = 0
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        for apply in self.pending:
+            apply()
+        self.pending = []
+        self.commits += 1
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        #Named locks go away with the session
+        for name in [name for name, holder in self.db.locks.items() if holder is self]:
+            del self.db.locks[name]
+
+    def insert_matches(self, ids):
+        #Rows of Matches written on this connection, visible after commit()
+        self.pending.append(lambda: self.db.match_ids.update(ids))
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.db = conn.db
+        self.rows = []
+        self.lastrowid = None
+
+    def execute(self, query, params=()):
+        query = " ".join(query.split())
+        db, pending = self.db, self.conn.pending
+        self.rows = []
+        if query.startswith("CREATE TABLE"):
+            return
+        if query.startswith("SELECT GET_LOCK"):
+            free = db.locks.get(params[0], self.conn) is self.conn
+            if free:
+                db.locks[params[0]] = self.conn
+            self.rows = [(int(free),)]
+        elif query.startswith("SELECT RELEASE_LOCK"):
+            db.locks.pop(params[0], None)
+            self.rows = [(1,)]
+        elif query.startswith("SELECT IS_FREE_LOCK"):
+            self.rows = [(int(params[0] not in db.locks),)]
+        elif query.startswith("INSERT INTO Matches"):
+            ids = list(params[::len(query.split(") VALUES")[0].split(","))])
+            if db.fail_match_ids.intersection(ids):
+                raise mysql.connector.Error("Lost connection to MySQL server")
+            self.conn.insert_matches(ids)
+        elif query.startswith("INSERT INTO Load_Rejects"):
+            rows = params[1::4]
+            pending.append(lambda: db.rejects.extend(rows))
+        elif query == "SELECT MAX(Match_ID) FROM Matches":
+            self.rows = [(max(db.match_ids, default=None),)]
+        elif query.startswith("SELECT State_Value FROM Load_State"):
+            self.rows = [(db.state[params[0]],)] if params[0] in db.state else []
+        elif query.startswith("INSERT INTO Load_State"):
+            key, value = params
+            pending.append(lambda: db.state.__setitem__(key, value))
+        elif query.startswith("INSERT INTO Load_Journal"):
+            load_id = self.lastrowid = db.next_load_id
+            db.next_load_id += 1
+            entry = {'Load_ID': load_id, 'Source': params[0], 'Fingerprint': params[1], 'Status': 'running',
+                     'Rows_Done': 0, 'Next_Match_ID': None, 'Range_End': None}
+            pending.append(lambda: db.journal.__setitem__(load_id, entry))
+        elif query.startswith("UPDATE Load_Journal SET"):
+            assignments = re.findall(r"(\w+) = (%s|'[^']*')", query.split(" WHERE ")[0])
+            params_left = iter(params)
+            values = {column: next(params_left) if value == '%s' else value.strip("'")
+                      for column, value in assignments}
+            load_id = params[-1]
+            pending.append(lambda: db.journal[load_id].update(values))
+        elif query.startswith("SELECT Load_ID, Source"):
+            self.rows = [tuple(entry.values()) for load_id, entry in sorted(db.journal.items(), reverse=True)
+                         if entry['Source'] == params[0] and entry['Status'] == 'running']
+        elif query.startswith("SELECT Next_Match_ID FROM Load_Journal"):
+            self.rows = [(entry['Next_Match_ID'],) for entry in db.journal.values()
+                         if entry['Source'] == params[0] and entry['Status'] == 'running'
+                         and entry['Range_End'] is not None and entry['Next_Match_ID'] < entry['Range_End']]
+        else:
+            raise NotImplementedError(query)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def fake_db():
+    return FakeDatabase()
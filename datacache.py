@@ -0,0 +1,233 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+import loadstate
+
+# Local cache for the source datasets, so a run only touches the network when
+# a dataset actually changed.
+# Every dataset is stored under data/cache/<dataset>/<content sha256>/ and
+# data/cache/index.json remembers, per dataset, which content is current, the
+# sha256 of each file and the freshness token it was downloaded with (the
+# HTTP ETag for plain URLs, the file list with sizes and dates for Kaggle).
+# Cached files are checked against their sha256 before they are used.
+#
+# Offline mode (SOCCERDB_OFFLINE=1 or --offline) never contacts the network and
+# uses the cached copy, files can be put into the cache by hand with
+#   python datacache.py add football-data/games path/to/games.parquet
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(project_dir, 'data', 'cache')
+INDEX_PATH = os.path.join(CACHE_DIR, 'index.json')
+
+OFFLINE_ENV = 'SOCCERDB_OFFLINE'
+
+# Seconds before an HTTP freshness check gives up
+HTTP_TIMEOUT = 60
+
+_index_lock = threading.Lock()
+_offline = None
+
+def set_offline(offline=True):
+    global _offline
+    _offline = offline
+
+def is_offline():
+    if _offline is not None:
+        return _offline
+    return os.environ.get(OFFLINE_ENV, '').lower() in ('1', 'true', 'yes')
+
+def read_index():
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    with open(INDEX_PATH) as f:
+        return json.load(f)
+
+def update_index(dataset, entry):
+    #Replace one dataset's entry, written to a temp file first so a crash never leaves half an index
+    with _index_lock:
+        index = read_index()
+        index[dataset] = entry
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, INDEX_PATH)
+
+def dataset_dir(dataset):
+    return os.path.join(CACHE_DIR, dataset.replace('/', '__'))
+
+def hash_files(directory):
+    #{relative path: sha256} for every file in a directory
+    hashes = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            hashes[os.path.relpath(path, directory).replace(os.sep, '/')] = loadstate.file_fingerprint(path)
+    return hashes
+
+def content_hash(file_hashes):
+    #One hash for a whole download, independent of file order
+    digest = hashlib.sha256()
+    for name, file_hash in sorted(file_hashes.items()):
+        digest.update(f"{name}\0{file_hash}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def cached_path(dataset, verify=True):
+    """Directory with the current cached content of a dataset, None if there is none.
+
+    With verify every file is hashed again and compared to the index, a
+    modified or missing file means the cache entry isn't used.
+    """
+    entry = read_index().get(dataset)
+    if entry is None:
+        return None
+    path = os.path.join(dataset_dir(dataset), entry['sha256'])
+    if not os.path.isdir(path):
+        return None
+    if verify and hash_files(path) != entry['files']:
+        print(f"Cached copy of {dataset} failed its checksum check")
+        return None
+    return path
+
+def store(dataset, download_dir, version):
+    """Move a finished download into the cache and make it the current content.
+
+    Older contents of the same dataset are removed. Returns the cached directory.
+    """
+    file_hashes = hash_files(download_dir)
+    digest = content_hash(file_hashes)
+    target = os.path.join(dataset_dir(dataset), digest)
+    if os.path.isdir(target):
+        shutil.rmtree(download_dir)
+    else:
+        os.replace(download_dir, target)
+
+    update_index(dataset, {
+        'sha256': digest,
+        'version': version,
+        'files': file_hashes,
+        'fetched_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    })
+    for old in os.listdir(dataset_dir(dataset)):
+        if old != digest and not old.startswith('.'):
+            shutil.rmtree(os.path.join(dataset_dir(dataset), old), ignore_errors=True)
+    return target
+
+def new_download_dir(dataset):
+    #Downloads land next to their final place so moving them in is a rename
+    os.makedirs(dataset_dir(dataset), exist_ok=True)
+    return tempfile.mkdtemp(prefix='.download-', dir=dataset_dir(dataset))
+
+def offline_copy(dataset):
+    path = cached_path(dataset)
+    if path is None:
+        raise RuntimeError(f"Offline mode and no verified cached copy of {dataset}, "
+                           f"add one with: python datacache.py add {dataset} <files>")
+    print(f"Offline, using cached {dataset}")
+    return path
+
+def kaggle_version(api, dataset):
+    #Freshness token for a Kaggle dataset: its file list with sizes and dates, one small API call
+    result = api.dataset_list_files(dataset)
+    files = getattr(result, 'files', None) or []
+    described = sorted(
+        f"{getattr(f, 'name', '')}|{getattr(f, 'totalBytes', getattr(f, 'size', ''))}|{getattr(f, 'creationDate', '')}"
+        for f in files
+    )
+    return hashlib.sha256("\n".join(described).encode('utf-8')).hexdigest()
+
+def fetch_kaggle(dataset):
+    """Directory with the files of a Kaggle dataset (unzipped), downloaded only when it changed."""
+    if is_offline():
+        return offline_copy(dataset)
+
+    # kaggle reads kaggle.json from here as soon as it is imported
+    os.environ['KAGGLE_CONFIG_DIR'] = project_dir
+    import kaggle
+    try:
+        version = kaggle_version(kaggle.api, dataset)
+    except Exception as e:
+        # no network or API trouble, a verified cached copy is still good enough
+        if cached_path(dataset) is None:
+            raise
+        print(f"Could not check {dataset} for updates ({e}), using cached copy")
+        return cached_path(dataset)
+    entry = read_index().get(dataset)
+    if entry is not None and entry['version'] == version:
+        path = cached_path(dataset)
+        if path is not None:
+            print(f"{dataset} unchanged, using cached copy")
+            return path
+
+    print(f"Downloading {dataset} from Kaggle...")
+    download_dir = new_download_dir(dataset)
+    kaggle.api.dataset_download_files(dataset, path=download_dir, unzip=True)
+    return store(dataset, download_dir, version)
+
+def fetch_url(dataset, url, file_name):
+    """Path of a single file downloaded from url, re-downloaded only when its ETag changed."""
+    if is_offline():
+        return os.path.join(offline_copy(dataset), file_name)
+
+    entry = read_index().get(dataset)
+    path = cached_path(dataset)
+    request = urllib.request.Request(url)
+    if entry is not None and path is not None and entry.get('version'):
+        request.add_header('If-None-Match', entry['version'])
+
+    try:
+        response = urllib.request.urlopen(request, timeout=HTTP_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            print(f"{dataset} unchanged (ETag), using cached copy")
+            return os.path.join(path, file_name)
+        raise
+    except urllib.error.URLError as e:
+        if path is None:
+            raise
+        print(f"Could not check {dataset} for updates ({e.reason}), using cached copy")
+        return os.path.join(path, file_name)
+
+    print(f"Downloading {url}...")
+    download_dir = new_download_dir(dataset)
+    with response, open(os.path.join(download_dir, file_name), 'wb') as f:
+        shutil.copyfileobj(response, f)
+    return os.path.join(store(dataset, download_dir, response.headers.get('ETag')), file_name)
+
+def add_local_files(dataset, paths):
+    #Pin local files as the cached content of a dataset, e.g. for machines without network access
+    download_dir = new_download_dir(dataset)
+    for path in paths:
+        shutil.copy2(path, os.path.join(download_dir, os.path.basename(path)))
+    return store(dataset, download_dir, None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the local source dataset cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show cached datasets and check their files")
+    add_parser = commands.add_parser("add", help="put local files into the cache as a dataset's content")
+    add_parser.add_argument("dataset", help="dataset name the loader looks up: football-data/games, antoinekrajnc/soccer-players-statistics or imtkaggleteam/football-stadiums")
+    add_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        print(f"Cached {args.dataset} at {add_local_files(args.dataset, args.paths)}")
+        return
+    for dataset, entry in sorted(read_index().items()):
+        status = "ok" if cached_path(dataset) is not None else "FAILED checksum"
+        print(f"{dataset}: {len(entry['files'])} files, sha256 {entry['sha256'][:12]}, fetched {entry['fetched_at']}, {status}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+from functools import lru_cache
+import mysql.connector
+from mysql.connector import pooling
+
+# Shared database access for all the loaders.
+# Settings come from the defaults below, then db_config.json next to this file
+# (or the file in SOCCERDB_CONFIG), then SOCCERDB_* environment variables.
+# Connections are checked out of one pool and go back to it on close().
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CONFIG = {
+    'host': 'localhost',
+    'port': 3306,
+    'user': 'root',
+    'password': 'uiuc',
+    'database': 'soccer',
+    'pool_size': 5,
+    'allow_local_infile': False,
+}
+
+# Environment variable for every setting, e.g. SOCCERDB_PASSWORD
+ENV_PREFIX = 'SOCCERDB_'
+
+# MySQL allows at most this many placeholders in one prepared statement
+MAX_PLACEHOLDERS = 65535
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def load_config():
+    #Defaults, overridden by the config file, overridden by environment variables
+    config = dict(DEFAULT_CONFIG)
+
+    config_path = os.environ.get(ENV_PREFIX + 'CONFIG', os.path.join(project_dir, 'db_config.json'))
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config.update(json.load(f))
+
+    for key, default in DEFAULT_CONFIG.items():
+        value = os.environ.get(ENV_PREFIX + key.upper())
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            config[key] = value.lower() in ('1', 'true', 'yes')
+        elif isinstance(default, int):
+            config[key] = int(value)
+        else:
+            config[key] = value
+    return config
+
+def connection_settings(config=None):
+    #Only the arguments mysql.connector.connect understands
+    config = config or load_config()
+    return {key: value for key, value in config.items() if key != 'pool_size'}
+
+def get_pool():
+    #Create the pool on first use, shared by every thread of the process
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = load_config()
+            _pool = pooling.MySQLConnectionPool(
+                pool_name='soccerdb',
+                pool_size=config['pool_size'],
+                **connection_settings(config)
+            )
+        return _pool
+
+def get_connection(allow_local_infile=False):
+    """Check a connection out of the pool, close() hands it back.
+
+    LOAD DATA LOCAL INFILE needs a client side flag, when the pool wasn't
+    configured with it a separate connection with the flag is opened instead.
+    """
+    config = load_config()
+    if allow_local_infile and not config['allow_local_infile']:
+        return mysql.connector.connect(**dict(connection_settings(config), allow_local_infile=True))
+    return get_pool().get_connection()
+
+def connect(allow_local_infile=False):
+    #A connection outside the pool, for workers that can't share the parent's pool or would run it dry
+    settings = connection_settings()
+    if allow_local_infile:
+        settings['allow_local_infile'] = True
+    return mysql.connector.connect(**settings)
+
+def prepared_cursor(conn):
+    #Server side prepared statements, parsed once and reused while the statement text stays the same
+    return conn.cursor(prepared=True)
+
+def tune_session_for_bulk(cursor):
+    #Skip per row unique and foreign key checks for the rest of the session
+    cursor.execute("SET SESSION unique_checks = 0")
+    cursor.execute("SET SESSION foreign_key_checks = 0")
+
+def restore_session(cursor):
+    cursor.execute("SET SESSION foreign_key_checks = 1")
+    cursor.execute("SET SESSION unique_checks = 1")
+
+# Cached so the same arguments give the very same string object, the prepared
+# cursor only reuses its statement when it is handed the identical string
+@lru_cache(maxsize=64)
+def insert_query(table, columns, row_count, suffix=""):
+    #INSERT with row_count rows of placeholders, suffix is e.g. an ON DUPLICATE KEY UPDATE clause
+    row = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([row] * row_count)
+    return f"{query} {suffix}" if suffix else query
+
+def frame_rows(frame, columns):
+    """A frame's columns as plain python tuples in column order, for insert_rows.
+
+    Missing values (None, NaN, NaT, pd.NA) become None and numpy scalars
+    python ones, the connector doesn't accept numpy integers everywhere.
+    """
+    def plain(values):
+        values = values.astype(object).where(values.notna(), None).tolist()
+        return [value.item() if hasattr(value, 'item') else value for value in values]
+    return list(zip(*(plain(frame[col]) for col in columns)))
+
+def insert_rows(cursor, table, columns, rows, suffix=""):
+    """Insert rows with as few multi-row statements as the placeholder limit allows.
+
+    With a prepared cursor every full size statement has the same text, so
+    the server parses it once and only the last, shorter one is prepared again.
+    """
+    columns = tuple(columns)
+    rows_per_statement = max(1, MAX_PLACEHOLDERS // len(columns))
+    for start in range(0, len(rows), rows_per_statement):
+        batch = rows[start:start + rows_per_statement]
+        cursor.execute(insert_query(table, columns, len(batch), suffix),
+                       [value for row in batch for value in row])
+    return len(rows)
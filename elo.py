@@ -0,0 +1,246 @@
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+import dbconnection
+import loadstate
+import loadjournal
+import aggregates
+import queries
+import loadmetrics
+
+# Elo strength ratings for the teams, from the match results in date order.
+# Team_Ratings has every team's rating before and after each of its matches
+# (so the rating on any date is one indexed read), Team_Elo the current one.
+# Like the aggregate tables only the matches inserted since the last run are
+# rated, starting from the stored current ratings. A full rebuild replays all
+# of Matches with the ratings held in one array indexed by Team_ID.
+#
+# Ratings follow the World Football Elo formula: K scaled up for wins by 2 or
+# more goals and a home advantage added to the home team's rating.
+
+LAST_MATCH_STATE = "elo.last_match_id"
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 20.0
+HOME_ADVANTAGE = 100.0
+
+RATING_TABLE_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS Team_Ratings (
+        Team_ID INT,
+        Match_ID INT,
+        Match_Date DATE,
+        Rating_Before DECIMAL(7, 2),
+        Rating_After DECIMAL(7, 2),
+        PRIMARY KEY (Team_ID, Match_ID),
+        INDEX Team_Ratings_Team_Date (Team_ID, Match_Date),
+        FOREIGN KEY (Team_ID) REFERENCES Teams(Team_ID)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Team_Elo (
+        Team_ID INT PRIMARY KEY,
+        Rating DECIMAL(7, 2),
+        Matches_Rated INT,
+        Last_Match_Date DATE,
+        INDEX Team_Elo_Rating (Rating),
+        FOREIGN KEY (Team_ID) REFERENCES Teams(Team_ID)
+    )
+    """,
+]
+
+MATCH_COLUMNS = ['Match_ID', 'Match_Date', 'Match_Tournament', 'Home_Goals', 'Away_Goals', 'Home_Team', 'Away_Team']
+RATING_COLUMNS = ['Team_ID', 'Match_ID', 'Match_Date', 'Rating_Before', 'Rating_After']
+ELO_COLUMNS = ['Team_ID', 'Rating', 'Matches_Rated', 'Last_Match_Date']
+
+def create_tables(conn):
+    cursor = conn.cursor()
+    for query in RATING_TABLE_QUERIES:
+        cursor.execute(query)
+    cursor.close()
+
+def goal_multiplier(goal_difference):
+    #K is worth more for clear wins: x1 up to one goal, x1.5 for two, (11 + N) / 8 for three and more
+    difference = np.abs(goal_difference).astype(np.float64)
+    return np.where(difference <= 1, 1.0, np.where(difference == 2, 1.5, (11 + difference) / 8))
+
+def load_ratings(conn, size):
+    """Current ratings as arrays indexed by Team_ID: rating, matches rated and last match date."""
+    ratings = np.full(size, INITIAL_RATING)
+    counts = np.zeros(size, dtype=np.int64)
+    last_dates = np.full(size, None, dtype=object)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(ELO_COLUMNS)} FROM Team_Elo")
+    for team_id, rating, matches_rated, last_date in cursor.fetchall():
+        if team_id < size:
+            ratings[team_id] = float(rating)
+            counts[team_id] = matches_rated
+            last_dates[team_id] = last_date
+    cursor.close()
+    return ratings, counts, last_dates
+
+def rate_matches(matches, ratings, counts):
+    """Replay matches (already in date order) on the rating arrays, returns the Team_Ratings rows.
+
+    The arrays are updated in place. Every match depends on the ratings after
+    the ones before it, so this is one pass over plain arrays; results and K
+    factors don't depend on the order and are computed up front.
+    """
+    home = matches['Home_Team'].to_numpy(dtype=np.int64)
+    away = matches['Away_Team'].to_numpy(dtype=np.int64)
+    home_goals = matches['Home_Goals'].to_numpy(dtype=np.int64)
+    away_goals = matches['Away_Goals'].to_numpy(dtype=np.int64)
+    # 1 home win, 0.5 draw, 0 away win
+    results = np.sign(home_goals - away_goals) / 2 + 0.5
+    k_factors = K_FACTOR * goal_multiplier(home_goals - away_goals)
+
+    # python floats in a list are much quicker to index one by one than numpy scalars
+    current = ratings.tolist()
+    home_before = []
+    away_before = []
+    changes = []
+    for home_id, away_id, result, k_factor in zip(home.tolist(), away.tolist(), results.tolist(), k_factors.tolist()):
+        home_rating = current[home_id]
+        away_rating = current[away_id]
+        expected = 1 / (1 + 10 ** ((away_rating - home_rating - HOME_ADVANTAGE) / 400))
+        change = k_factor * (result - expected)
+        current[home_id] = home_rating + change
+        current[away_id] = away_rating - change
+        home_before.append(home_rating)
+        away_before.append(away_rating)
+        changes.append(change)
+    ratings[:] = current
+    home_before = np.array(home_before)
+    away_before = np.array(away_before)
+    changes = np.array(changes)
+    np.add.at(counts, home, 1)
+    np.add.at(counts, away, 1)
+
+    return pd.DataFrame({
+        'Team_ID': np.concatenate([home, away]),
+        'Match_ID': np.tile(matches['Match_ID'].to_numpy(dtype=np.int64), 2),
+        'Match_Date': np.tile(matches['Match_Date'].to_numpy(), 2),
+        'Rating_Before': np.round(np.concatenate([home_before, away_before]), 2),
+        'Rating_After': np.round(np.concatenate([home_before + changes, away_before - changes]), 2),
+    })
+
+def update_ratings(conn):
+    """Rate every match inserted since the last run and store the new ratings.
+
+    New matches are rated in date order from the stored current ratings. The
+    history rows, the current ratings and the watermark are committed
+    together. Returns the number of matches rated.
+    """
+    with loadmetrics.stage('ratings.update'):
+        rated = rate_new_matches(conn)
+    loadmetrics.add_rows('ratings.update', rated)
+    return rated
+
+def rate_new_matches(conn):
+    started = time.perf_counter()
+    create_tables(conn)
+    last_id = int(loadstate.get_state(conn, LAST_MATCH_STATE, 0))
+
+    # Match_ID ranges commit out of order, so only up to the first one still being inserted
+    # (matchesloader --resume may also delete parts of an interrupted one)
+    max_id = loadjournal.committed_until(conn)
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(Team_ID) FROM Teams")
+    max_team_id = cursor.fetchone()[0] or 0
+    cursor.close()
+    if max_id <= last_id:
+        print("Team ratings are up to date.")
+        return 0
+
+    frames = list(aggregates.read_new_matches(conn, last_id, max_id))
+    matches = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=MATCH_COLUMNS)
+    # Match_Date is a string until migration 1 has run, dates compare with Team_Elo's either way
+    matches['Match_Date'] = pd.to_datetime(matches['Match_Date'], errors='coerce').dt.date
+    # Matches without a date (or an unreadable one) can't be put in order and aren't rated
+    undated = int(matches['Match_Date'].isna().sum())
+    matches = matches[matches['Match_Date'].notna()].sort_values(['Match_Date', 'Match_ID'], kind='stable')
+
+    ratings, counts, last_dates = load_ratings(conn, max_team_id + 1)
+    if len(matches):
+        rated_until = max((date for date in last_dates if date is not None), default=None)
+        if rated_until is not None:
+            late = int((matches['Match_Date'] < rated_until).sum())
+            if late:
+                print(f"Warning: {late} new matches are dated before {rated_until}, they are rated from today's ratings. "
+                      "Run with --rebuild to replay everything in date order")
+
+    write_cursor = dbconnection.prepared_cursor(conn)
+    try:
+        if len(matches):
+            history = rate_matches(matches, ratings, counts)
+            dbconnection.insert_rows(write_cursor, 'Team_Ratings', RATING_COLUMNS,
+                                     dbconnection.frame_rows(history, RATING_COLUMNS),
+                                     aggregates.replace_existing(RATING_COLUMNS, RATING_COLUMNS[:2]))
+
+            # current ratings of the teams that played
+            latest = history.sort_values(['Match_Date', 'Match_ID'], kind='stable').groupby('Team_ID').tail(1)
+            current = pd.DataFrame({
+                'Team_ID': latest['Team_ID'],
+                'Rating': np.round(ratings[latest['Team_ID'].to_numpy()], 2),
+                'Matches_Rated': counts[latest['Team_ID'].to_numpy()],
+                'Last_Match_Date': latest['Match_Date'],
+            })
+            # late matches don't move a team's last match date back
+            stored = last_dates[current['Team_ID'].to_numpy()]
+            current['Last_Match_Date'] = [date if before is None or date > before else before
+                                          for date, before in zip(current['Last_Match_Date'], stored)]
+            dbconnection.insert_rows(write_cursor, 'Team_Elo', ELO_COLUMNS,
+                                     dbconnection.frame_rows(current, ELO_COLUMNS),
+                                     aggregates.replace_existing(ELO_COLUMNS, ['Team_ID']))
+        loadstate.set_state(conn, LAST_MATCH_STATE, max_id, commit=False)
+        conn.commit()
+        queries.invalidate_cache(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        write_cursor.close()
+
+    print(f"Team ratings: rated {len(matches)} matches ({undated} without a date skipped) "
+          f"in {time.perf_counter() - started:.1f}s")
+    return len(matches)
+
+def rebuild_ratings(conn):
+    #Empty the rating tables and replay every match from the initial ratings
+    create_tables(conn)
+    cursor = conn.cursor()
+    for table in ('Team_Ratings', 'Team_Elo'):
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.close()
+    loadstate.set_state(conn, LAST_MATCH_STATE, 0, commit=False)
+    conn.commit()
+    return update_ratings(conn)
+
+def run(args):
+    conn = dbconnection.get_connection()
+    try:
+        if args.rebuild:
+            rebuild_ratings(conn)
+        else:
+            update_ratings(conn)
+    finally:
+        conn.close()
+
+def add_arguments(parser):
+    parser.add_argument("--rebuild", action="store_true",
+                        help="empty the rating tables and replay all of Matches in date order")
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the teams' Elo ratings from new matches")
+    add_arguments(parser)
+    try:
+        run(parser.parse_args())
+    except Exception as e:
+        print(f"Error updating team ratings: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
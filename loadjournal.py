@@ -0,0 +1,164 @@
+# Journal of the imports that are in progress, one row per run of a loader. It
+# holds the source fingerprint, how many source rows are committed and the
+# Match_ID range being inserted. The loader updates it in the same transaction
+# as every batch it commits, so after a crash the journal says exactly where to
+# go on from ("python matchesloader.py --resume").
+#
+# Status is running until the loader finishes (complete), a new run that
+# doesn't resume sets the old one to abandoned. A running import holds a named
+# lock for its entry (released when its connection closes), so entries of an
+# import that is still alive are never abandoned or resumed by another one.
+#
+# Match_ID ranges are reserved up front and can commit out of order (parallel
+# shards, two importers at once), so the tables folded from Matches by
+# watermark (aggregates, elo, userfeed) only read up to committed_until(),
+# below the first uncommitted Match_ID of every running import.
+
+# Named lock importers hold while reserving a Match_ID range and journaling it
+MATCH_ID_LOCK = "soccerdb.match_ids"
+
+LOAD_JOURNAL_QUERY = """
+    CREATE TABLE IF NOT EXISTS Load_Journal (
+        Load_ID INT PRIMARY KEY AUTO_INCREMENT,
+        Source VARCHAR(64),
+        Fingerprint VARCHAR(64),
+        Status VARCHAR(16),
+        Rows_Done BIGINT DEFAULT 0,
+        Next_Match_ID INT NULL,
+        Range_End INT NULL,
+        Started_At TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        Updated_At TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX Load_Journal_Source_Status (Source, Status)
+    )
+"""
+
+ENTRY_COLUMNS = ['Load_ID', 'Source', 'Fingerprint', 'Status', 'Rows_Done', 'Next_Match_ID', 'Range_End']
+
+# CREATE TABLE commits implicitly, so only the first time per process (like loadstate)
+_table_ready = False
+
+def ensure_table(cursor):
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(LOAD_JOURNAL_QUERY)
+        _table_ready = True
+
+def entry_lock(load_id):
+    return f"soccerdb.load.{load_id}"
+
+def lock_entry(conn, entry):
+    #Mark the entry's import as alive for as long as conn is open
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, 0)", (entry_lock(entry['Load_ID']),))
+    locked = cursor.fetchone()[0] == 1
+    cursor.close()
+    if not locked:
+        raise RuntimeError(f"load {entry['Load_ID']} is still running in another process")
+
+def orphaned(cursor, source):
+    #Running entries of a source whose import isn't alive any more, newest first
+    cursor.execute(f"""
+        SELECT {', '.join(ENTRY_COLUMNS)} FROM Load_Journal
+        WHERE Source = %s AND Status = 'running' ORDER BY Load_ID DESC
+    """, (source,))
+    entries = [dict(zip(ENTRY_COLUMNS, row)) for row in cursor.fetchall()]
+    orphans = []
+    for entry in entries:
+        cursor.execute("SELECT IS_FREE_LOCK(%s)", (entry_lock(entry['Load_ID']),))
+        if cursor.fetchone()[0] == 1:
+            orphans.append(entry)
+    return orphans
+
+def unfinished(conn, source):
+    #The latest running entry of a source that no live import holds, as a dict, None if there is none
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    orphans = orphaned(cursor, source)
+    cursor.close()
+    return orphans[0] if orphans else None
+
+def start(conn, source, fingerprint):
+    """Start a new journal entry for a source and return it.
+
+    Earlier running entries whose import isn't alive are abandoned.
+    """
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    for entry in orphaned(cursor, source):
+        cursor.execute("UPDATE Load_Journal SET Status = 'abandoned' WHERE Load_ID = %s", (entry['Load_ID'],))
+    cursor.execute("INSERT INTO Load_Journal (Source, Fingerprint, Status) VALUES (%s, %s, 'running')",
+                   (source, fingerprint))
+    load_id = cursor.lastrowid
+    cursor.close()
+    conn.commit()
+    entry = {'Load_ID': load_id, 'Source': source, 'Fingerprint': fingerprint, 'Status': 'running',
+             'Rows_Done': 0, 'Next_Match_ID': None, 'Range_End': None}
+    lock_entry(conn, entry)
+    return entry
+
+def reserve(conn, entry, first_id, end_id):
+    #Record the Match_ID range about to be inserted, committed before any of it is (and while holding MATCH_ID_LOCK)
+    entry.update(Next_Match_ID=first_id, Range_End=end_id)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE Load_Journal SET Next_Match_ID = %s, Range_End = %s WHERE Load_ID = %s",
+                   (first_id, end_id, entry['Load_ID']))
+    cursor.close()
+    conn.commit()
+
+def advance(conn, entry, rows_done, next_match_id):
+    """Move the entry past a committed batch, not committed here.
+
+    Call it right before the commit of the batch's rows, so both are
+    committed or neither is.
+    """
+    entry.update(Rows_Done=rows_done, Next_Match_ID=next_match_id)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE Load_Journal SET Rows_Done = %s, Next_Match_ID = %s WHERE Load_ID = %s",
+                   (rows_done, next_match_id, entry['Load_ID']))
+    cursor.close()
+
+def finish(conn, entry):
+    entry['Status'] = 'complete'
+    cursor = conn.cursor()
+    cursor.execute("UPDATE Load_Journal SET Status = 'complete' WHERE Load_ID = %s", (entry['Load_ID'],))
+    conn.commit()
+    cursor.execute("SELECT RELEASE_LOCK(%s)", (entry_lock(entry['Load_ID']),))
+    cursor.fetchone()
+    cursor.close()
+
+def safe_match_id(max_id, open_ids):
+    #MAX(Match_ID) capped below the first uncommitted Match_ID of every running import
+    return min([max_id] + [next_id - 1 for next_id in open_ids])
+
+def committed_until(conn, source='matches'):
+    """Highest Match_ID up to which every reserved match is committed (or given up).
+
+    Importers journal a Match_ID range under MATCH_ID_LOCK before inserting
+    any of it, so reading MAX(Match_ID) and the open ranges under the lock
+    can't miss a range that is reserved but not committed yet.
+    """
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.execute("SELECT GET_LOCK(%s, 30)", (MATCH_ID_LOCK,))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise RuntimeError("Timed out waiting for the Match_ID lock")
+    try:
+        cursor.execute("SELECT MAX(Match_ID) FROM Matches")
+        max_id = cursor.fetchone()[0] or 0
+        cursor.execute("""
+            SELECT Next_Match_ID FROM Load_Journal
+            WHERE Source = %s AND Status = 'running' AND Range_End IS NOT NULL AND Next_Match_ID < Range_End
+        """, (source,))
+        open_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MATCH_ID_LOCK,))
+        cursor.fetchone()
+        cursor.close()
+    if open_ids:
+        print(f"Matches from Match_ID {min(open_ids)} on are still being imported, they are left for a later run")
+    return safe_match_id(max_id, open_ids)
+
+def in_flight(entry):
+    #Whether a Match_ID range was reserved but not all of it is journaled as committed
+    return entry['Range_End'] is not None and entry['Next_Match_ID'] < entry['Range_End']
@@ -0,0 +1,219 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Timers and counters for the loaders, written out at the end of a run as a JSON
+# report and a Prometheus textfile (for node_exporter's textfile collector), so
+# it's visible where the time goes and throughput drops can be alerted on.
+#
+#   with loadmetrics.stage('matches.resolve'):
+#       ...
+#   loadmetrics.add_rows('matches.resolve', len(resolved))
+#   loadmetrics.skip('matches', 'team_not_found', skipped)
+#   loadmetrics.write_report('matches')
+#
+# Stage names are "<loader>.<stage>", e.g. players.download, matches.insert,
+# stadiums.assignment. Everything is process wide and thread safe, so one
+# soccerdb load run collects all loaders in one report.
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+METRICS_DIR = os.environ.get('SOCCERDB_METRICS_DIR', os.path.join(project_dir, 'data', 'metrics'))
+
+# Progress lines are printed at most this often per stage
+PROGRESS_SECONDS = 5
+
+_lock = threading.Lock()
+_stages = {}
+_skipped = {}
+_connections = {}
+_round_trips = {}
+_progress_printed = {}
+_started = time.time()
+
+def reset():
+    global _started
+    with _lock:
+        _stages.clear()
+        _skipped.clear()
+        _connections.clear()
+        _round_trips.clear()
+        _progress_printed.clear()
+        _started = time.time()
+
+def _stage_entry(name):
+    return _stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'rows': 0})
+
+@contextmanager
+def stage(name):
+    #Time a block of work, repeated blocks of the same stage add up
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            entry = _stage_entry(name)
+            entry['seconds'] += elapsed
+            entry['calls'] += 1
+
+def add_rows(name, rows):
+    with _lock:
+        _stage_entry(name)['rows'] += int(rows)
+
+def skip(loader, reason, rows):
+    #Rows a loader left out, by reason (team_not_found, insert_error, ...)
+    if rows:
+        with _lock:
+            key = (loader, reason)
+            _skipped[key] = _skipped.get(key, 0) + int(rows)
+
+def progress(name, rows, total=None):
+    #Progress line for long stages, throttled to one every PROGRESS_SECONDS
+    now = time.monotonic()
+    with _lock:
+        if now - _progress_printed.get(name, 0) < PROGRESS_SECONDS:
+            return
+        _progress_printed[name] = now
+    print(f"[{name}] {rows}" + (f" of {total}" if total is not None else "") + " rows so far...")
+
+def session_questions(conn):
+    cursor = conn.cursor()
+    cursor.execute("SHOW SESSION STATUS LIKE 'Questions'")
+    value = int(cursor.fetchone()[1])
+    cursor.close()
+    return value
+
+def track_connection(conn, loader):
+    """Count the statements a connection sends from now on as the loader's round trips.
+
+    Uses the session's Questions counter, read again by untrack_connection or
+    when the report is written.
+    """
+    try:
+        start = session_questions(conn)
+    except Exception:
+        return
+    with _lock:
+        _connections[id(conn)] = (loader, conn, start)
+
+def _questions_since(conn, start):
+    # minus the SHOW STATUS statement that read the start value
+    return session_questions(conn) - start - 1
+
+def untrack_connection(conn):
+    #Add the statements sent since track_connection to the loader's total, call before the connection goes back to the pool
+    with _lock:
+        tracked = _connections.pop(id(conn), None)
+    if tracked is None:
+        return
+    loader, conn, start = tracked
+    try:
+        sent = _questions_since(conn, start)
+    except Exception:
+        return
+    with _lock:
+        _round_trips[loader] = _round_trips.get(loader, 0) + sent
+
+def round_trips():
+    #{loader: statements sent}, finished connections plus the ones still tracked
+    with _lock:
+        counts = dict(_round_trips)
+        connections = list(_connections.values())
+    for loader, conn, start in connections:
+        try:
+            counts[loader] = counts.get(loader, 0) + _questions_since(conn, start)
+        except Exception:
+            continue
+    return counts
+
+def peak_rss_bytes(children=False):
+    #Peak resident memory of this process so far, with children of its largest finished child
+    #(ru_maxrss is a maximum, the two don't add up). None where resource is missing (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def snapshot():
+    #Everything collected so far as a plain dict
+    trips = round_trips()
+    with _lock:
+        stages = {
+            name: dict(entry, rows_per_sec=round(entry['rows'] / entry['seconds'], 1) if entry['seconds'] > 0 else None,
+                       seconds=round(entry['seconds'], 3))
+            for name, entry in sorted(_stages.items())
+        }
+        skipped = {}
+        for (loader, reason), rows in sorted(_skipped.items()):
+            skipped.setdefault(loader, {})[reason] = rows
+        started = _started
+    return {
+        'started_at': started,
+        'finished_at': time.time(),
+        'stages': stages,
+        'rows_skipped': skipped,
+        'round_trips': trips,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'children_peak_rss_bytes': peak_rss_bytes(children=True),
+    }
+
+def prometheus_text(run, report):
+    #Prometheus text exposition format of a snapshot
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{value_}"' for key, value_ in [('run', run)] + labels)
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    stages = report['stages']
+    metric('soccerdb_stage_seconds', 'gauge', 'Time spent in a loader stage during the last run',
+           [([('stage', name)], entry['seconds']) for name, entry in stages.items()])
+    metric('soccerdb_stage_rows', 'gauge', 'Rows handled by a loader stage during the last run',
+           [([('stage', name)], entry['rows']) for name, entry in stages.items()])
+    metric('soccerdb_stage_rows_per_second', 'gauge', 'Throughput of a loader stage during the last run',
+           [([('stage', name)], entry['rows_per_sec']) for name, entry in stages.items() if entry['rows_per_sec'] is not None])
+    metric('soccerdb_rows_skipped', 'gauge', 'Rows a loader skipped during the last run, by reason',
+           [([('loader', loader), ('reason', reason)], rows)
+            for loader, reasons in report['rows_skipped'].items() for reason, rows in reasons.items()])
+    metric('soccerdb_db_round_trips', 'gauge', 'Statements sent to MySQL during the last run',
+           [([('loader', loader)], count) for loader, count in report['round_trips'].items()])
+    if report['peak_rss_bytes'] is not None:
+        metric('soccerdb_peak_rss_bytes', 'gauge', 'Peak resident memory of the loader process in the last run',
+               [([], report['peak_rss_bytes'])])
+    if report.get('children_peak_rss_bytes') is not None:
+        metric('soccerdb_children_peak_rss_bytes', 'gauge', 'Peak resident memory of the largest worker process in the last run',
+               [([], report['children_peak_rss_bytes'])])
+    metric('soccerdb_last_run_timestamp_seconds', 'gauge', 'When the last run finished', [([], report['finished_at'])])
+    return "\n".join(lines) + "\n"
+
+def write_atomically(path, text):
+    #Scrapers never see half a file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def write_report(run, metrics_dir=None):
+    """Write <run>-report.json and <run>.prom into the metrics directory, returns the report."""
+    metrics_dir = metrics_dir or METRICS_DIR
+    os.makedirs(metrics_dir, exist_ok=True)
+    report = snapshot()
+    write_atomically(os.path.join(metrics_dir, f"{run}-report.json"), json.dumps(report, indent=2))
+    write_atomically(os.path.join(metrics_dir, f"{run}.prom"), prometheus_text(run, report))
+
+    print(f"\nStage timings ({run}):")
+    for name, entry in report['stages'].items():
+        rate = f", {entry['rows_per_sec']} rows/s" if entry['rows_per_sec'] else ""
+        print(f"  {name:<24} {entry['seconds']:>8.2f}s  {entry['rows']} rows{rate}")
+    print(f"Metrics written to {metrics_dir}")
+    return report
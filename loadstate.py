@@ -0,0 +1,51 @@
+import hashlib
+
+# Small key/value table where the loaders remember what they did last run
+# (source fingerprints, watermarks), so the next run can skip or narrow its work.
+
+LOAD_STATE_QUERY = """
+    CREATE TABLE IF NOT EXISTS Load_State (
+        State_Key VARCHAR(64) PRIMARY KEY,
+        State_Value VARCHAR(255),
+        Updated_At TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+# CREATE TABLE commits implicitly, so it only runs the first time per process
+# and never in the middle of a caller's transaction after that
+_table_ready = False
+
+def ensure_table(cursor):
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(LOAD_STATE_QUERY)
+        _table_ready = True
+
+def get_state(conn, key, default=None):
+    #Read one stored value, default if it was never set
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.execute("SELECT State_Value FROM Load_State WHERE State_Key = %s", (key,))
+    row = cursor.fetchone()
+    cursor.close()
+    return default if row is None else row[0]
+
+def set_state(conn, key, value, commit=True):
+    #Store one value, pass commit=False to make it part of the caller's transaction
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.execute("""
+        INSERT INTO Load_State (State_Key, State_Value) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE State_Value = VALUES(State_Value)
+    """, (key, None if value is None else str(value)))
+    cursor.close()
+    if commit:
+        conn.commit()
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    #SHA-256 of a file's content, read in chunks so big files don't need to fit in memory
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,258 +1,371 @@
+import argparse
 import pandas as pd
+import pyarrow.parquet as pq
 import mysql.connector
-import subprocess
 import sys
+import tempfile
+import time
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
+import teamresolver
+import loadstate
+import aggregates
+import elo
+import userfeed
+import queries
+import dbconnection
+import datacache
+import loadmetrics
+import validation
+import loadjournal
 
 
-# Database Connection
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "uiuc",
-    "database": "soccer"
-}
+# games.parquet from the football-data GitHub repository, downloaded on its own
+# instead of cloning the whole repository, HEAD is the default branch
+GAMES_URL = "https://github.com/schochastics/football-data/raw/HEAD/data/results/games.parquet"
+GAMES_DATASET = "football-data/games"
+GAMES_FILE = "games.parquet"
 
-# GitHub repository information
-REPO_URL = "https://github.com/schochastics/football-data.git"
-REPO_PATH = Path("./football-data")
-PARQUET_FILE_PATH = REPO_PATH / "data" / "results" / "games.parquet"
+# Source dataset recorded with the team aliases resolved here
+ALIAS_SOURCE = "games"
 
-def connect_to_db():
+# Load_Journal source name of match imports
+JOURNAL_SOURCE = "matches"
+
+# Load_State keys for incremental imports
+FINGERPRINT_STATE = "matches.fingerprint"
+WATERMARK_DATE_STATE = "matches.watermark_date"
+WATERMARK_KEY_STATE = "matches.watermark_key"
+
+# Load_State key holding the next Match_ID nobody has reserved yet, and the named lock
+# importers take while reserving a range of IDs
+NEXT_MATCH_ID_STATE = "matches.next_id"
+MATCH_ID_LOCK = loadjournal.MATCH_ID_LOCK
+
+# Parallel mode: rows per shard sent to a worker process, and retries per failed shard
+SHARD_ROWS = 20000
+SHARD_RETRIES = 3
+
+# Columns identifying a match when deciding if it was already loaded
+NATURAL_KEY_COLUMNS = ['Match_Date', 'Home_Team', 'Away_Team', 'Match_Tournament']
+
+# Only these columns are read from games.parquet
+SOURCE_COLUMNS = ['home', 'away', 'date', 'competition', 'gh', 'ga']
+
+# Rows per pyarrow record batch in streaming mode
+STREAM_BATCH_ROWS = 50000
+
+# Number of matches sent per INSERT statement and commit
+BATCH_SIZE = 1000
+
+MATCH_COLUMNS = ['Match_ID', 'Match_Date', 'Match_Tournament', 'Home_Goals', 'Away_Goals', 'Home_Team', 'Away_Team']
+
+LOAD_DATA_QUERY = """
+    LOAD DATA LOCAL INFILE '{path}' INTO TABLE Matches
+    FIELDS TERMINATED BY '\\t' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+    LINES TERMINATED BY '\\n'
+    (Match_ID, Match_Date, Match_Tournament, Home_Goals, Away_Goals, Home_Team, Away_Team)
+"""
+
+def connect_to_db(allow_local_infile=False):
     """Establish connection to the MySQL database"""
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+        conn = dbconnection.get_connection(allow_local_infile=allow_local_infile)
         print("Successfully connected to the database")
         return conn
     except mysql.connector.Error as err:
         print(f"Error connecting to the database: {err}")
         sys.exit(1)
 
-def get_team_mapping(conn):
-    """Create a mapping of team names to team IDs from the database"""
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT Team_ID, Team_Name FROM Teams")
-    teams = cursor.fetchall()
-    cursor.close()
-    
-    # mapping from team name to team ID
-    team_mapping = {team['Team_Name']: team['Team_ID'] for team in teams}
-    return team_mapping
-
-def clone_repository():
-    """Clone the GitHub repository and return the path to the parquet file"""
+def download_games():
+    """Return the path to games.parquet, downloaded only when it changed since the last run"""
     try:
-        # checking if repository already exists
-        if not REPO_PATH.exists():
-            print(f"Cloning repository {REPO_URL}...")
-            subprocess.run(["git", "clone", REPO_URL], check=True)
-        else:
-            print(f"Repository already exists, pulling latest changes...")
-            subprocess.run(["git", "-C", str(REPO_PATH), "pull"], check=True)
-        
-        # checking if file exists
-        if not PARQUET_FILE_PATH.exists():
-            print(f"Error: Parquet file not found at {PARQUET_FILE_PATH}")
+        with loadmetrics.stage('matches.download'):
+            parquet_file_path = Path(datacache.fetch_url(GAMES_DATASET, GAMES_URL, GAMES_FILE))
+        if not parquet_file_path.exists():
+            print(f"Error: Parquet file not found at {parquet_file_path}")
             sys.exit(1)
-            
-        print(f"Successfully located parquet file at {PARQUET_FILE_PATH}")
-        return PARQUET_FILE_PATH
-    
-    except subprocess.CalledProcessError as e:
-        print(f"Error with git operation: {e}")
-        sys.exit(1)
+
+        print(f"Successfully located parquet file at {parquet_file_path}")
+        return parquet_file_path
+
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        print(f"Error getting games.parquet: {e}")
         sys.exit(1)
 
-def normalize_team_name(name):
-    #Normalizing team names to help matching
-    if name is None:
-        return ""
-    
+def clean_matches(matches_df, row_offset=0):
+    #Coerce the columns with the matches schema, rows without team names or with bad
+    #dates/goals are set aside for Load_Rejects. row_offset is the first row's position in the file
+    matches_df, _ = validation.validate(matches_df, validation.MATCHES_SCHEMA, 'matches', row_offset)
+    return matches_df
+
+def resolve_matches(conn, matches_df, threshold=teamresolver.DEFAULT_THRESHOLD, aliases=None):
+    """Map home/away names to Team_IDs for the whole frame.
+
+    Each distinct name is looked up once in the Team_Aliases cache, names not
+    seen before are resolved with teamresolver (exact normalized match first,
+    then trigram similarity above the threshold), then the IDs are joined back
+    onto every row. Returns the resolved rows, the number of skipped rows and
+    the set of team names that could not be matched. The frame has to be
+    cleaned with clean_matches first.
+    """
+    # One lookup per distinct name instead of two per row
+    names = pd.unique(pd.concat([matches_df['home'], matches_df['away']], ignore_index=True))
+    resolved_names = teamresolver.resolve_cached(conn, names, ALIAS_SOURCE, threshold, aliases)
+    name_to_id = {name: team_id for name, (team_id, score) in resolved_names.items()}
+    print(f"Resolved {sum(team_id is not None for team_id in name_to_id.values())} of {len(names)} distinct team names")
+
+    home_ids = matches_df['home'].map(name_to_id)
+    away_ids = matches_df['away'].map(name_to_id)
+    found = home_ids.notna() & away_ids.notna()
+
+    # Track team names that couldn't be matched
+    team_not_found = {str(name) for name, team_id in name_to_id.items() if team_id is None}
+
+    resolved = pd.DataFrame({
+        # Match_Date is a DATE column, missing dates are None and stored as NULL
+        'Match_Date': matches_df['date'],
+        'Match_Tournament': matches_df['competition'].astype(str),
+        # goals were already checked by validation, missing ones are 0
+        'Home_Goals': matches_df['gh'].astype('int64'),
+        'Away_Goals': matches_df['ga'].astype('int64'),
+        'Home_Team': home_ids,
+        'Away_Team': away_ids,
+        # row number in games.parquet, for the load journal
+        'Source_Row': matches_df.index,
+    })[found]
+    resolved['Home_Team'] = resolved['Home_Team'].astype('int64')
+    resolved['Away_Team'] = resolved['Away_Team'].astype('int64')
+    resolved = resolved.reset_index(drop=True)
+
+    loadmetrics.skip('matches', 'team_not_found', int((~found).sum()))
+    matches_skipped = int((~found).sum())
+    return resolved, matches_skipped, team_not_found
+
+def reserve_match_ids(conn, count, journal=None):
+    """Reserve count consecutive Match_IDs and return the first one.
+
+    Doing AUTO_INCREMENT here through python. Importers take turns through a
+    named lock, and the next free ID is stored in Load_State, so a range is
+    never handed out twice, even when its rows were never inserted. The range
+    goes into the journal in the same commit, still under the lock, so
+    loadjournal.committed_until always sees it.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, 30)", (MATCH_ID_LOCK,))
+    if cursor.fetchone()[0] != 1:
+        cursor.close()
+        raise RuntimeError("Timed out waiting for the Match_ID lock")
     try:
-        return str(name).lower().strip()
-    except Exception as e:
-        print(f"Error normalizing team name '{name}': {e}")
-        return ""
+        cursor.execute("SELECT MAX(Match_ID) FROM Matches")
+        max_id = cursor.fetchone()[0]
+        stored_next = int(loadstate.get_state(conn, NEXT_MATCH_ID_STATE, 1))
+        first_id = max(1 if max_id is None else max_id + 1, stored_next)
+        loadstate.set_state(conn, NEXT_MATCH_ID_STATE, first_id + count, commit=False)
+        if journal is not None:
+            loadjournal.reserve(conn, journal, first_id, first_id + count)
+        else:
+            conn.commit()
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MATCH_ID_LOCK,))
+        cursor.fetchone()
+        cursor.close()
+    return first_id
+
+def match_rows(resolved):
+    #Convert the frame into plain python tuples in the INSERT column order
+    return list(zip(*(resolved[col].tolist() for col in MATCH_COLUMNS)))
 
-def find_best_match(team_name, team_mapping):
-    #Finding the best match for team name in the mapping with error handling
+def report_rate(label, rows, started):
+    elapsed = time.perf_counter() - started
+    rate = rows / elapsed if elapsed > 0 else 0
+    print(f"{label}: {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+
+def commit_batch(conn, journal, rows_done, next_match_id):
+    #Commit the batch together with the journal's new position and the rejects of the
+    #source rows it moves past, so a resume neither loses nor repeats them
+    if journal is not None:
+        validation.save_rejects(conn, 'matches', commit=False, before_row=rows_done)
+        loadjournal.advance(conn, journal, rows_done, next_match_id)
+    conn.commit()
+
+def insert_matches(conn, resolved, batch_size=BATCH_SIZE, journal=None):
+    #Insert resolved matches with one prepared multi-row INSERT per batch, committing once per batch
+    #together with the load journal's new position
+    started = time.perf_counter()
+    cursor = dbconnection.prepared_cursor(conn)
+    rows = match_rows(resolved)
+    source_rows = resolved['Source_Row'].tolist()
+    matches_inserted = 0
+    matches_skipped = 0
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            dbconnection.insert_rows(cursor, 'Matches', MATCH_COLUMNS, batch)
+            with loadmetrics.stage('matches.commit'):
+                commit_batch(conn, journal, source_rows[start + len(batch) - 1] + 1, batch[-1][0] + 1)
+            matches_inserted += len(batch)
+            loadmetrics.progress('matches.insert', matches_inserted, len(rows))
+        except mysql.connector.Error as err:
+            print(f"Error inserting batch starting at row {start}: {err}")
+            conn.rollback()
+            # The first failed batch ends the import: a later batch would move the
+            # journal past this one and --resume would never retry it
+            matches_skipped += len(rows) - start
+            break
+
+    cursor.close()
+    report_rate(f"Batched insert ({batch_size} rows per commit)", matches_inserted, started)
+    return matches_inserted, matches_skipped
+
+def load_data_infile(cursor, resolved):
+    #Stage the frame to a temporary TSV file and load it in one statement
+    fd, tsv_path = tempfile.mkstemp(suffix=".tsv")
+    os.close(fd)
     try:
-        normalized_name = normalize_team_name(team_name)
-        
-        # First try exact match with normalized names
-        normalized_mapping = {normalize_team_name(k): v for k, v in team_mapping.items()}
-        if normalized_name in normalized_mapping:
-            return normalized_mapping[normalized_name]
-        
-        # Not completely implemented, instead of returning none, this is where we could make a better matching system. With current system we lose out on over 7,000 teams, but another reason is the dataset from where we pull teams from (kaggle) only gives us 634 teams.
-        return None
-    
-    except Exception as e:
-        print(f"Error finding match for team name '{team_name}': {e}")
-        return None
+        resolved[MATCH_COLUMNS].to_csv(tsv_path, sep="\t", header=False, index=False, lineterminator="\n", na_rep="NULL")
+        # forward slashes so the path also works inside the SQL string on Windows
+        cursor.execute(LOAD_DATA_QUERY.format(path=Path(tsv_path).as_posix()))
+        return cursor.rowcount
+    finally:
+        os.remove(tsv_path)
 
-def import_matches(conn):
-    #Import matches from parquet file to the database
-    # Get team mapping
-    team_mapping = get_team_mapping(conn)
-    
-    # Clone repository and get parquet file path
-    parquet_file_path = clone_repository()
-    
-    # Reading parquet
+def multi_row_insert(conn, resolved):
+    #Fallback when local infile is disabled, prepared multi-row VALUES statements as big as MySQL allows
+    cursor = dbconnection.prepared_cursor(conn)
     try:
-        matches_df = pd.read_parquet(parquet_file_path)
-        print(f"Successfully read {len(matches_df)} matches from {parquet_file_path}")
-        
-        # NA values check
-        for col in ['home', 'away', 'date', 'competition', 'gh', 'ga']:
-            if col in matches_df.columns:
-                null_count = matches_df[col].isna().sum()
-                if null_count > 0:
-                    print(f"Warning: Column '{col}' contains {null_count} null values")
-                    # Fill NA values with empty string or 0
-                    if col in ['home', 'away', 'date', 'competition']:
-                        matches_df[col] = matches_df[col].fillna("")
-                    else:
-                        matches_df[col] = matches_df[col].fillna(0)
-        
-    except Exception as e:
-        print(f"Error reading parquet file: {e}")
-        return
-    
-    # Prepare cursor for insertion
+        return dbconnection.insert_rows(cursor, 'Matches', MATCH_COLUMNS, match_rows(resolved))
+    finally:
+        cursor.close()
+
+def bulk_load_matches(conn, resolved, journal=None):
+    """Load all resolved matches in bulk.
+
+    Tries LOAD DATA LOCAL INFILE first and falls back to multi-row INSERT
+    statements when the server or client has local infile disabled. Unique
+    and foreign key checks are switched off for the session during the load
+    (the team IDs come straight from Teams) and switched back on afterwards.
+    Everything is committed once at the end, so a failure loads nothing.
+    """
+    started = time.perf_counter()
     cursor = conn.cursor()
-    
-    # First, check if the AUTO_INCREMENT is working correctly
-    cursor.execute("SHOW CREATE TABLE Matches")
-    result = cursor.fetchone()
-    create_table_stmt = result[1] if len(result) > 1 else result[0]
-    
-    print("Doing AUTO_INCREMENT here through python")
-    cursor.execute("SELECT MAX(Match_ID) FROM Matches")
-    max_id = cursor.fetchone()[0]
-    next_id = 1 if max_id is None else max_id + 1
-    print(f"Starting with Match_ID: {next_id}")
-    
-    insert_query = """
-    INSERT INTO Matches (Match_ID, Match_Date, Match_Tournament, Home_Goals, Away_Goals, Home_Team, Away_Team)
-    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    dbconnection.tune_session_for_bulk(cursor)
+    try:
+        try:
+            loaded = load_data_infile(cursor, resolved)
+            method = "LOAD DATA LOCAL INFILE"
+        except mysql.connector.Error as err:
+            print(f"LOAD DATA LOCAL INFILE not available ({err}), falling back to multi-row INSERT")
+            conn.rollback()
+            loaded = multi_row_insert(conn, resolved)
+            method = "Multi-row INSERT"
+        with loadmetrics.stage('matches.commit'):
+            if len(resolved):
+                commit_batch(conn, journal, int(resolved['Source_Row'].iloc[-1]) + 1,
+                             int(resolved['Match_ID'].iloc[-1]) + 1)
+            else:
+                conn.commit()
+    except mysql.connector.Error as err:
+        print(f"Error during bulk load, rolling back: {err}")
+        conn.rollback()
+        loaded = 0
+        method = "Bulk load (failed)"
+    finally:
+        dbconnection.restore_session(cursor)
+        cursor.close()
+
+    report_rate(method, loaded, started)
+    return loaded, len(resolved) - loaded
+
+# Worker process state for parallel inserts, every process has its own connection
+_worker_conn = None
+
+def init_worker():
+    global _worker_conn
+    _worker_conn = dbconnection.connect()
+
+def shard_committed(cursor, rows):
+    #A shard's IDs are contiguous, if they are all in Matches the shard was committed
+    cursor.execute("SELECT COUNT(*) FROM Matches WHERE Match_ID BETWEEN %s AND %s", (rows[0][0], rows[-1][0]))
+    return cursor.fetchone()[0] == len(rows)
+
+def insert_shard(rows, attempt=0):
+    """Insert one shard in a single transaction on this worker's connection.
+
+    Runs in a worker process. A duplicate key error on a retry means the
+    earlier attempt's commit went through (only its reply was lost), so the
+    shard counts as done when all of its IDs are there.
     """
-    
-    # Process and insert matches
+    if attempt:
+        time.sleep(attempt)  # back off a little before retrying
+    if not _worker_conn.is_connected():
+        _worker_conn.reconnect(attempts=3, delay=1)
+
+    cursor = dbconnection.prepared_cursor(_worker_conn)
+    try:
+        dbconnection.insert_rows(cursor, 'Matches', MATCH_COLUMNS, rows)
+        _worker_conn.commit()
+    except mysql.connector.IntegrityError:
+        _worker_conn.rollback()
+        check_cursor = _worker_conn.cursor()
+        committed = shard_committed(check_cursor, rows)
+        check_cursor.close()
+        if not committed:
+            raise
+    finally:
+        cursor.close()
+    return len(rows)
+
+def parallel_insert_matches(pool, resolved, shard_rows=SHARD_ROWS, conn=None, journal=None):
+    """Split resolved matches (IDs already assigned) into shards and insert them on the worker pool.
+
+    Each shard is inserted and committed by one worker, a failed shard is
+    retried on its own up to SHARD_RETRIES times before it is counted as
+    skipped. Shards commit in any order, the journal (committed on conn) is
+    moved past every shard once all shards before it are committed too, so
+    it never counts a shard that isn't.
+    """
+    started = time.perf_counter()
+    rows = match_rows(resolved)
+    source_rows = resolved['Source_Row'].tolist()
+    futures = {}
+    for start in range(0, len(rows), shard_rows):
+        shard = rows[start:start + shard_rows]
+        futures[pool.submit(insert_shard, shard)] = (start, shard, 0)
+
     matches_inserted = 0
     matches_skipped = 0
-    errors_count = 0
-    team_not_found = set()
-    
-    # For the manual ID approach if needed
-    current_id = next_id if 'next_id' in locals() else None
-    
-    # Loop with error handling
-    for index, match in matches_df.iterrows():
-        try:
-            # safety checks
-            home_team_name = match.get('home', None)
-            away_team_name = match.get('away', None)
-            
-            # Skip if either team name is missing or empty
-            if not home_team_name or not away_team_name:
-                matches_skipped += 1
-                continue
-                
-            # Look up team IDs, still to be implemented if the current matching is not good enough (line 79)
-            home_team_id = find_best_match(home_team_name, team_mapping)
-            away_team_id = find_best_match(away_team_name, team_mapping)
-            
-            # Skip if either team ID is not found
-            if not home_team_id or not away_team_id:
-                matches_skipped += 1
-                # Track team names that couldn't be matched
-                if not home_team_id:
-                    team_not_found.add(str(home_team_name))
-                if not away_team_id:
-                    team_not_found.add(str(away_team_name))
-                continue
-            
-            # Extract match details with mapping and safety checks
-            match_date = str(match.get('date', ''))
-            match_tournament = str(match.get('competition', ''))
-            
-            # Handle numeric fields safely
-            try:
-                home_goals = int(match.get('gh', 0))
-            except (ValueError, TypeError):
-                home_goals = 0
-                
-            try:
-                away_goals = int(match.get('ga', 0))
-            except (ValueError, TypeError):
-                away_goals = 0
-            
-            # Insert match into database
+    committed = set()
+    next_start = 0
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            start, shard, attempt = futures.pop(future)
             try:
-                if current_id is not None:
-                    # Using manual ID approach
-                    cursor.execute(insert_query, (
-                        current_id,
-                        match_date, 
-                        match_tournament, 
-                        home_goals, 
-                        away_goals, 
-                        home_team_id, 
-                        away_team_id
-                    ))
-                    current_id += 1
+                matches_inserted += future.result()
+            except Exception as err:
+                if attempt < SHARD_RETRIES:
+                    print(f"Shard starting at Match_ID {shard[0][0]} failed ({err}), retrying")
+                    futures[pool.submit(insert_shard, shard, attempt + 1)] = (start, shard, attempt + 1)
                 else:
-                    # Using AUTO_INCREMENT with NULL
-                    cursor.execute(insert_query, (
-                        match_date, 
-                        match_tournament, 
-                        home_goals, 
-                        away_goals, 
-                        home_team_id, 
-                        away_team_id
-                    ))
-                    
-                matches_inserted += 1
-                errors_count = 0  # Reset consecutive errors
-                
-                # Print progress every 1000 matches, total with current settings is 57,347 matches (being input) and missing 1,118,588 matches
-                if matches_inserted % 1000 == 0:
-                    print(f"Inserted {matches_inserted} matches so far...")
-                    conn.commit()
-                    
-            except mysql.connector.Error as err:
-                print(f"Error inserting match at index {index}: {err}")
-                matches_skipped += 1
-                errors_count += 1
-                
-                # stop infinite loop if it occurs
-                if errors_count > 10:
-                    print("Too many consecutive errors, stopping import.")
-                    break
-                    
-        except Exception as e:
-            print(f"Unexpected error processing match at index {index}: {e}")
-            matches_skipped += 1
-            errors_count += 1
-            
-            if errors_count > 10:
-                print("Too many consecutive errors, stopping import.")
-                break
-    
-    # Final commit for any remaining changes
-    try:
-        conn.commit()
-    except mysql.connector.Error as err:
-        print(f"Error on final commit: {err}")
-    
-    cursor.close()
-    
-    print(f"Import complete. Inserted {matches_inserted} matches. Skipped {matches_skipped} matches.")
-    
+                    print(f"Shard starting at Match_ID {shard[0][0]} failed {attempt + 1} times, skipping it: {err}")
+                    matches_skipped += len(shard)
+                continue
+            loadmetrics.progress('matches.insert', matches_inserted, len(rows))
+
+            committed.add(start)
+            if journal is not None and next_start in committed:
+                while next_start in committed:
+                    next_start += shard_rows
+                end = min(next_start, len(rows))
+                commit_batch(conn, journal, source_rows[end - 1] + 1, rows[end - 1][0] + 1)
+
+    report_rate(f"Parallel insert ({shard_rows} rows per shard)", matches_inserted, started)
+    return matches_inserted, matches_skipped
+
+def report_unmatched(team_not_found):
     if team_not_found:
         print(f"\nCould not find {len(team_not_found)} teams in the database:")
         team_list = sorted(list(team_not_found))
@@ -261,12 +374,333 @@ def import_matches(conn):
         if len(team_not_found) > 10:
             print(f"... and {len(team_not_found) - 10} more.")
 
+def natural_keys(frame):
+    #Hash of date/home/away/competition, computed the same way for new rows and rows read back from Matches
+    return pd.util.hash_pandas_object(frame[NATURAL_KEY_COLUMNS].astype(str), index=False)
+
+def load_watermark(conn):
+    """Return the incremental import watermark, or None for an empty Matches table.
+
+    The watermark is the date of the last imported match plus the natural
+    keys of the matches already in Matches on that date, so matches added to
+    the source on the boundary date are still picked up. When no watermark
+    was stored yet (tables loaded before incremental mode) the latest
+    Match_Date in Matches is used.
+    """
+    watermark_date = loadstate.get_state(conn, WATERMARK_DATE_STATE)
+    watermark_key = loadstate.get_state(conn, WATERMARK_KEY_STATE)
+
+    cursor = conn.cursor()
+    if watermark_date is None:
+        cursor.execute("SELECT MAX(Match_Date) FROM Matches")
+        max_date = cursor.fetchone()[0]
+        if max_date is None:
+            cursor.close()
+            return None
+        watermark_date = str(max_date)
+
+    cursor.execute(
+        f"SELECT {', '.join(NATURAL_KEY_COLUMNS)} FROM Matches WHERE Match_Date = %s", (watermark_date,)
+    )
+    boundary = pd.DataFrame(cursor.fetchall(), columns=NATURAL_KEY_COLUMNS)
+    cursor.close()
+    boundary_keys = set(natural_keys(boundary).tolist())
+
+    if watermark_key is not None and int(watermark_key) not in boundary_keys:
+        print(f"Warning: last imported match from {watermark_date} is no longer in Matches")
+
+    print(f"Importing matches after watermark {watermark_date} ({len(boundary_keys)} matches on that date already loaded)")
+    return {'date': watermark_date, 'keys': boundary_keys}
+
+def after_watermark(resolved, watermark):
+    #Keep only matches past the watermark, returns the new rows and how many were already loaded
+    keys = natural_keys(resolved)
+    is_new = (resolved['Match_Date'] > watermark['date']) | (
+        (resolved['Match_Date'] == watermark['date']) & ~keys.isin(watermark['keys'])
+    )
+    return resolved[is_new].reset_index(drop=True), int((~is_new).sum())
+
+def last_match(resolved):
+    #(date, natural key) of the latest match in the frame, used as the next watermark
+    dated = resolved[resolved['Match_Date'].notna()]
+    if dated.empty:
+        return None
+    keyed = pd.DataFrame({'date': dated['Match_Date'], 'key': natural_keys(dated)})
+    latest = keyed.sort_values(['date', 'key']).iloc[-1]
+    return latest['date'], int(latest['key'])
+
+def save_watermark(conn, fingerprint, latest):
+    #Remember the source fingerprint and the latest imported match for the next incremental run
+    if latest is not None:
+        loadstate.set_state(conn, WATERMARK_DATE_STATE, latest[0], commit=False)
+        loadstate.set_state(conn, WATERMARK_KEY_STATE, latest[1], commit=False)
+    loadstate.set_state(conn, FINGERPRINT_STATE, fingerprint, commit=False)
+    conn.commit()
+
+def read_matches(parquet_file_path, start_row=0):
+    #Read the whole parquet file at once, only the columns we load. The index is the
+    #row number in the file, rows before start_row are left out
+    with loadmetrics.stage('matches.parse'):
+        matches_df = pd.read_parquet(parquet_file_path, columns=SOURCE_COLUMNS)
+    loadmetrics.add_rows('matches.parse', len(matches_df))
+    print(f"Successfully read {len(matches_df)} matches from {parquet_file_path}")
+    with loadmetrics.stage('matches.normalize'):
+        return clean_matches(matches_df.iloc[start_row:], start_row)
+
+def stream_matches(parquet_file_path, batch_rows=STREAM_BATCH_ROWS, start_row=0):
+    """Yield (cleaned frame, row number after its last row) for batches of at most batch_rows matches.
+
+    Uses pyarrow record batches and only decodes the columns we load, so
+    memory stays bounded by the batch size and not by the file size. Frames
+    are indexed by row number in the file, rows before start_row are skipped.
+    """
+    parquet_file = pq.ParquetFile(parquet_file_path)
+    print(f"Streaming {parquet_file.metadata.num_rows} matches from {parquet_file_path} in batches of {batch_rows}")
+    batches = parquet_file.iter_batches(batch_size=batch_rows, columns=SOURCE_COLUMNS)
+    rows_read = 0
+    while True:
+        # batches are decoded when the next one is requested, so that is what's timed
+        with loadmetrics.stage('matches.parse'):
+            batch = next(batches, None)
+            matches_df = None if batch is None else batch.to_pandas()
+        if matches_df is None:
+            return
+        matches_df.index = pd.RangeIndex(rows_read, rows_read + len(matches_df))
+        rows_read += len(matches_df)
+        if rows_read <= start_row:
+            continue
+        matches_df = matches_df[matches_df.index >= start_row]
+        loadmetrics.add_rows('matches.parse', len(matches_df))
+        with loadmetrics.stage('matches.normalize'):
+            cleaned = clean_matches(matches_df, int(matches_df.index[0]))
+        yield cleaned, rows_read
+
+def discard_uncommitted(conn, journal):
+    """Delete the matches of the interrupted batch that the journal doesn't count as committed.
+
+    Only parallel inserts can leave such rows (their shards commit on other
+    connections), the IDs of the range were reserved for this load alone.
+    """
+    if not loadjournal.in_flight(journal):
+        return 0
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM Matches WHERE Match_ID >= %s AND Match_ID < %s",
+                   (journal['Next_Match_ID'], journal['Range_End']))
+    deleted = cursor.rowcount
+    cursor.close()
+    loadjournal.advance(conn, journal, journal['Rows_Done'], journal['Range_End'])
+    conn.commit()
+    if deleted:
+        print(f"Removed {deleted} matches of the interrupted batch, they are inserted again")
+    return deleted
+
+def latest_loaded(conn):
+    #(date, natural key) of the latest match in Matches, the watermark after a resumed import
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT {', '.join(NATURAL_KEY_COLUMNS)} FROM Matches
+        WHERE Match_Date = (SELECT MAX(Match_Date) FROM Matches)
+    """)
+    loaded = pd.DataFrame(cursor.fetchall(), columns=NATURAL_KEY_COLUMNS)
+    cursor.close()
+    loaded['Match_Date'] = loaded['Match_Date'].astype(str)
+    return last_match(loaded)
+
+def import_matches(conn, batch_size=BATCH_SIZE, bulk=False, threshold=teamresolver.DEFAULT_THRESHOLD,
+                   stream=False, stream_rows=STREAM_BATCH_ROWS, incremental=False,
+                   parquet_file_path=None, matches_df=None, workers=1, shard_rows=SHARD_ROWS, resume=False):
+    #Import matches from parquet file to the database, the file (or the frame read
+    #from it with read_matches) can be passed in when it was fetched ahead of time.
+    #With resume an interrupted import goes on after the last batch its journal has as committed
+    loadmetrics.track_connection(conn, 'matches')
+    # Download (or reuse the cached) parquet file
+    if parquet_file_path is None:
+        parquet_file_path = download_games()
+    fingerprint = loadstate.file_fingerprint(parquet_file_path)
+
+    # Incremental mode: skip an unchanged source entirely, otherwise only load past the watermark
+    watermark = None
+    if incremental:
+        if loadstate.get_state(conn, FINGERPRINT_STATE) == fingerprint:
+            print("games.parquet has not changed since the last import, nothing to do.")
+            return 0
+        watermark = load_watermark(conn)
+
+    # Every batch commit moves the journal along in the same transaction
+    if resume:
+        journal = loadjournal.unfinished(conn, JOURNAL_SOURCE)
+        if journal is None:
+            print("No interrupted match import to resume.")
+            return 0
+        if journal['Fingerprint'] != fingerprint:
+            print("games.parquet changed since the interrupted import, it can't be resumed. Run without --resume.")
+            return 0
+        loadjournal.lock_entry(conn, journal)
+        discard_uncommitted(conn, journal)
+        print(f"Resuming the match import after row {journal['Rows_Done']}")
+    else:
+        journal = loadjournal.start(conn, JOURNAL_SOURCE, fingerprint)
+    start_row = journal['Rows_Done']
+
+    # Rejects are saved in the batch commits, the CREATE TABLE would commit in the middle of one
+    cursor = conn.cursor()
+    validation.ensure_table(cursor)
+    cursor.close()
+
+    # Aliases are loaded once and extended as new names show up
+    aliases = teamresolver.load_aliases(conn)
+
+    # Parallel mode: a pool of worker processes, each with its own connection
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker) if workers > 1 else None
+
+    matches_inserted = 0
+    matches_skipped = 0
+    already_loaded = 0
+    team_not_found = set()
+    latest = None
+    complete = True
+
+    # Reading parquet, either all at once or batch by batch where each batch is
+    # cleaned, resolved and inserted before the next one is read. Batches come with
+    # the row number they end at, None for the rest of the file
+    try:
+        if matches_df is not None:
+            batches = [(matches_df[matches_df.index >= start_row], None)]
+        elif stream:
+            batches = stream_matches(parquet_file_path, stream_rows, start_row)
+        else:
+            batches = [(read_matches(parquet_file_path, start_row), None)]
+        for matches_df, end_row in batches:
+            # rows validation set aside while reading this batch, saved as the journal moves past them
+            matches_skipped += validation.pending_count('matches')
+
+            if watermark is not None:
+                # cheap date filter before resolving, the exact check needs the team IDs
+                is_recent = matches_df['date'].fillna('') >= watermark['date']
+                already_loaded += int((~is_recent).sum())
+                loadmetrics.skip('matches', 'already_loaded', int((~is_recent).sum()))
+                matches_df = matches_df[is_recent]
+
+            with loadmetrics.stage('matches.resolve'):
+                resolved, skipped, not_found = resolve_matches(conn, matches_df, threshold, aliases)
+            loadmetrics.add_rows('matches.resolve', len(matches_df))
+            matches_skipped += skipped
+            team_not_found |= not_found
+
+            if watermark is not None:
+                resolved, loaded_before = after_watermark(resolved, watermark)
+                already_loaded += loaded_before
+                loadmetrics.skip('matches', 'already_loaded', loaded_before)
+
+            # Match_IDs are reserved as one contiguous range per batch and noted in the journal
+            next_id = reserve_match_ids(conn, len(resolved), journal) if len(resolved) else 0
+            resolved.insert(0, 'Match_ID', range(next_id, next_id + len(resolved)))
+
+            with loadmetrics.stage('matches.insert'):
+                if bulk:
+                    inserted, insert_skipped = bulk_load_matches(conn, resolved, journal)
+                elif pool is not None:
+                    inserted, insert_skipped = parallel_insert_matches(pool, resolved, shard_rows, conn, journal)
+                else:
+                    inserted, insert_skipped = insert_matches(conn, resolved, batch_size, journal)
+            loadmetrics.add_rows('matches.insert', inserted)
+            loadmetrics.skip('matches', 'insert_error', insert_skipped)
+            matches_inserted += inserted
+            matches_skipped += insert_skipped
+            if insert_skipped:
+                # The journal stays at the last committed rows, so --resume retries the failed ones
+                complete = False
+                break
+            batch_latest = last_match(resolved)
+            if batch_latest is not None and (latest is None or batch_latest > latest):
+                latest = batch_latest
+
+            # The whole batch is done, with None the rest of the file and all of its rejects
+            if end_row is None:
+                validation.save_rejects(conn, 'matches', commit=False)
+                end_row = journal['Rows_Done']
+            commit_batch(conn, journal, end_row, journal['Range_End'])
+    except Exception as e:
+        print(f"Error reading or importing matches: {e}")
+        conn.rollback()
+        complete = False
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if complete:
+        loadjournal.finish(conn, journal)
+    else:
+        # rejects past the journal are found again by --resume
+        validation.discard_rejects('matches')
+        print(f"Import did not finish, run with --resume to go on after row {journal['Rows_Done']}.")
+
+    # Only a fully loaded source moves the watermark, otherwise the next run retries
+    if incremental:
+        if complete:
+            if resume:
+                # the rows loaded before the interruption count too
+                loaded = latest_loaded(conn)
+                if loaded is not None and (latest is None or loaded > latest):
+                    latest = loaded
+            save_watermark(conn, fingerprint, latest)
+        else:
+            print("Import had errors, watermark not updated.")
+        print(f"{already_loaded} matches were already loaded.")
+
+    # Cached application queries are stale once new matches are committed
+    if matches_inserted:
+        queries.invalidate_cache(conn)
+
+    print(f"Import complete. Inserted {matches_inserted} matches. Skipped {matches_skipped} matches.")
+    report_unmatched(team_not_found)
+    loadmetrics.untrack_connection(conn)
+    return matches_inserted
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import matches from football-data into the soccer database")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"matches per INSERT statement and commit (default {BATCH_SIZE})")
+    parser.add_argument("--bulk", action="store_true",
+                        help="load with LOAD DATA LOCAL INFILE (or multi-row INSERT) in one transaction")
+    parser.add_argument("--match-threshold", type=float, default=teamresolver.DEFAULT_THRESHOLD,
+                        help=f"minimum trigram similarity for fuzzy team name matches (default {teamresolver.DEFAULT_THRESHOLD})")
+    parser.add_argument("--refresh-aliases", action="store_true",
+                        help="forget the automatically resolved team aliases and resolve every name again (manual ones are kept)")
+    parser.add_argument("--stream", action="store_true",
+                        help="read games.parquet in record batches and insert each batch before reading the next")
+    parser.add_argument("--stream-rows", type=int, default=STREAM_BATCH_ROWS,
+                        help=f"rows per record batch in --stream mode (default {STREAM_BATCH_ROWS})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip the run if games.parquet is unchanged, otherwise only insert matches past the stored watermark")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="insert shards of matches in parallel on this many worker processes (default 1, no pool)")
+    parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS,
+                        help=f"matches per shard in --workers mode (default {SHARD_ROWS})")
+    parser.add_argument("--offline", action="store_true",
+                        help="don't download games.parquet, use the cached copy in data/cache")
+    parser.add_argument("--resume", action="store_true",
+                        help="go on with an interrupted import after its last committed batch (same games.parquet)")
+    return parser.parse_args()
+
 
 #Final mathces commit to database
 def main():
+    args = parse_args()
+    if args.offline:
+        datacache.set_offline()
     try:
-        conn = connect_to_db()
-        import_matches(conn)
+        conn = connect_to_db(allow_local_infile=args.bulk)
+        if args.refresh_aliases:
+            print(f"Removed {teamresolver.forget_aliases(conn)} cached team aliases")
+        import_matches(conn, batch_size=args.batch_size, bulk=args.bulk, threshold=args.match_threshold,
+                       stream=args.stream, stream_rows=args.stream_rows, incremental=args.incremental,
+                       workers=args.workers, shard_rows=args.shard_rows, resume=args.resume)
+        # Standings/head to head/form only need the matches that were just inserted
+        aggregates.update_aggregates(conn)
+        elo.update_ratings(conn)
+        userfeed.fan_out_matches(conn)
+        loadmetrics.write_report('matches')
         conn.close()
         print("Database connection closed.")
         
@@ -0,0 +1,184 @@
+import argparse
+import sys
+import time
+import dbconnection
+
+# Versioned schema migrations, applied in order and recorded in Schema_Migrations
+# so every database only runs each one once. Every step checks what is already
+# there first, MySQL DDL isn't transactional so a migration that died halfway
+# can simply be run again.
+
+MIGRATIONS_TABLE_QUERY = """
+    CREATE TABLE IF NOT EXISTS Schema_Migrations (
+        Version INT PRIMARY KEY,
+        Name VARCHAR(255),
+        Applied_At TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# (table, index name, columns) for the queries the app runs most
+QUERY_INDEXES = [
+    ('Matches', 'Matches_Home_Date', 'Home_Team, Match_Date'),
+    ('Matches', 'Matches_Away_Date', 'Away_Team, Match_Date'),
+    ('Matches', 'Matches_Tournament_Date', 'Match_Tournament, Match_Date'),
+    ('Players', 'Players_Team_Rating', 'Team_ID, Overall_Rating'),
+]
+
+# Queries used to compare plans and timings before and after migrating,
+# {team} is filled in with the team that played the most home matches
+CANONICAL_QUERIES = [
+    ("Matches in a date range", """
+        SELECT COUNT(*) FROM Matches
+        WHERE Match_Date BETWEEN '2010-01-01' AND '2010-12-31'
+    """),
+    ("Last 10 matches of a team", """
+        (SELECT * FROM Matches WHERE Home_Team = {team} ORDER BY Match_Date DESC LIMIT 10)
+        UNION ALL
+        (SELECT * FROM Matches WHERE Away_Team = {team} ORDER BY Match_Date DESC LIMIT 10)
+        ORDER BY Match_Date DESC LIMIT 10
+    """),
+    ("Tournament season", """
+        SELECT * FROM Matches
+        WHERE Match_Tournament = 'england' AND Match_Date BETWEEN '2015-07-01' AND '2016-06-30'
+        ORDER BY Match_Date
+    """),
+    ("Top rated players of a team", """
+        SELECT Player_Name, Overall_Rating FROM Players
+        WHERE Team_ID = {team} ORDER BY Overall_Rating DESC LIMIT 5
+    """),
+]
+
+# Times each canonical query is run, the fastest run is reported
+TIMING_RUNS = 3
+
+def column_type(cursor, table, column):
+    cursor.execute("""
+        SELECT DATA_TYPE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND LOWER(TABLE_NAME) = LOWER(%s) AND COLUMN_NAME = %s
+    """, (table, column))
+    row = cursor.fetchone()
+    return None if row is None else row[0].lower()
+
+def index_exists(cursor, table, index_name):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND LOWER(TABLE_NAME) = LOWER(%s) AND INDEX_NAME = %s
+    """, (table, index_name))
+    return cursor.fetchone()[0] > 0
+
+def match_date_to_date(cursor):
+    #Match_Date VARCHAR(255) -> DATE, values that aren't YYYY-MM-DD (empty strings) or no real
+    #day (2016-02-30) become NULL, the ALTER would fail on them in strict mode
+    if column_type(cursor, 'Matches', 'Match_Date') == 'date':
+        return
+    cursor.execute("""
+        UPDATE Matches SET Match_Date = NULL
+        WHERE Match_Date NOT REGEXP '^[0-9]{4}-[0-9]{2}-[0-9]{2}$'
+           OR STR_TO_DATE(Match_Date, '%Y-%m-%d') IS NULL
+    """)
+    print(f"  {cursor.rowcount} Match_Date values were not dates and are now NULL")
+    cursor.execute("ALTER TABLE Matches MODIFY Match_Date DATE NULL")
+
+def add_query_indexes(cursor):
+    for table, index_name, columns in QUERY_INDEXES:
+        if not index_exists(cursor, table, index_name):
+            print(f"  CREATE INDEX {index_name} ON {table} ({columns})")
+            cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+
+# (version, name, function doing the work), append new ones at the end
+MIGRATIONS = [
+    (1, "Match_Date as DATE", match_date_to_date),
+    (2, "Indexes for team, date range, tournament and squad queries", add_query_indexes),
+]
+
+def applied_versions(cursor):
+    cursor.execute(MIGRATIONS_TABLE_QUERY)
+    cursor.execute("SELECT Version FROM Schema_Migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+def pending_migrations(cursor):
+    applied = applied_versions(cursor)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+def apply_migrations(conn):
+    #Run every pending migration in version order, recording each one as it finishes
+    cursor = conn.cursor()
+    pending = pending_migrations(cursor)
+    if not pending:
+        print("Schema is up to date.")
+    for version, name, migration in pending:
+        print(f"Applying migration {version}: {name}")
+        started = time.perf_counter()
+        migration(cursor)
+        cursor.execute("INSERT INTO Schema_Migrations (Version, Name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        print(f"  done in {time.perf_counter() - started:.1f}s")
+    cursor.close()
+    return len(pending)
+
+def print_status(conn):
+    cursor = conn.cursor()
+    applied = applied_versions(cursor)
+    cursor.close()
+    for version, name, migration in MIGRATIONS:
+        print(f"{version:>3}  {'applied' if version in applied else 'pending':<8} {name}")
+
+def busiest_team(cursor):
+    cursor.execute("SELECT Home_Team FROM Matches GROUP BY Home_Team ORDER BY COUNT(*) DESC LIMIT 1")
+    row = cursor.fetchone()
+    return 1 if row is None else row[0]
+
+def explain_queries(conn, label):
+    """Print the EXPLAIN plan and best of TIMING_RUNS timings for every canonical query."""
+    cursor = conn.cursor()
+    team = busiest_team(cursor)
+    print(f"\n=== {label} ===")
+    for name, query in CANONICAL_QUERIES:
+        query = query.format(team=team)
+        cursor.execute("EXPLAIN " + query)
+        columns = [description[0] for description in cursor.description]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        timings = []
+        for _ in range(TIMING_RUNS):
+            started = time.perf_counter()
+            cursor.execute(query)
+            cursor.fetchall()
+            timings.append(time.perf_counter() - started)
+
+        print(f"{name}: {min(timings) * 1000:.1f} ms")
+        for step in plan:
+            print(f"    table={step.get('table')} type={step.get('type')} key={step.get('key')} "
+                  f"rows={step.get('rows')} extra={step.get('Extra')}")
+    cursor.close()
+
+def migrate(args):
+    conn = dbconnection.get_connection()
+    try:
+        if args.status:
+            print_status(conn)
+            return
+        if args.explain:
+            explain_queries(conn, "Before migrating")
+        applied = apply_migrations(conn)
+        if args.explain:
+            explain_queries(conn, "After migrating" if applied else "After migrating (nothing was pending)")
+    finally:
+        conn.close()
+
+def add_arguments(parser):
+    parser.add_argument("--status", action="store_true", help="list migrations and whether they are applied")
+    parser.add_argument("--explain", action="store_true",
+                        help="print EXPLAIN plans and timings of the canonical queries before and after migrating")
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to the soccer database")
+    add_arguments(parser)
+    try:
+        migrate(parser.parse_args())
+    except Exception as e:
+        print(f"Error migrating: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -28,12 +28,15 @@ CREATE TABLE Teams (
 -- @block
 CREATE TABLE Matches (
     Match_ID INT PRIMARY KEY,
-    Match_Date VARCHAR(255),
+    Match_Date DATE NULL,
     Match_Tournament VARCHAR(255),
     Away_Goals INT,
     Home_Goals INT,
     Home_Team INT,
     Away_Team INT,
+    INDEX Matches_Home_Date (Home_Team, Match_Date),
+    INDEX Matches_Away_Date (Away_Team, Match_Date),
+    INDEX Matches_Tournament_Date (Match_Tournament, Match_Date),
     FOREIGN KEY (Home_Team) REFERENCES Teams(Team_ID),
     FOREIGN KEY (Away_Team) REFERENCES Teams(Team_ID)
 );
@@ -54,6 +57,7 @@ CREATE TABLE Players (
     Penalties INT,
     Free_Kick_Accuracy INT,
     Strength INT,
+    INDEX Players_Team_Rating (Team_ID, Overall_Rating),
     FOREIGN KEY (Team_ID) REFERENCES Teams(Team_ID)
 );
 
@@ -75,3 +79,18 @@ CREATE TABLE Favorite_Players (
     FOREIGN KEY (Player_ID) REFERENCES Players(Player_ID)
 );
 
+-- @block
+CREATE TABLE Team_Aliases (
+    Alias_Name VARCHAR(255) COLLATE utf8mb4_bin PRIMARY KEY,
+    Team_ID INT NULL,
+    Score FLOAT,
+    Source VARCHAR(64),
+    Is_Manual BOOLEAN NOT NULL DEFAULT FALSE,
+    FOREIGN KEY (Team_ID) REFERENCES Teams(Team_ID)
+);
+
+-- @block
+-- Manual alias override, kept when the loaders run again
+INSERT INTO Team_Aliases (Alias_Name, Team_ID, Score, Source, Is_Manual)
+VALUES ('Bayern Munich', 3, 1, 'manual', TRUE)
+ON DUPLICATE KEY UPDATE Team_ID = VALUES(Team_ID), Score = VALUES(Score), Source = VALUES(Source), Is_Manual = TRUE;
@@ -1,47 +1,18 @@
 import os
+import argparse
 import pandas as pd
 import mysql.connector
-from tqdm import tqdm  
-
-# Directory setup
-project_dir = os.path.dirname(os.path.abspath(__file__))
-data_dir = os.path.join(project_dir, 'data')
-os.makedirs(data_dir, exist_ok=True)
-os.environ['KAGGLE_CONFIG_DIR'] = project_dir  
-
-import kaggle
-
-# Download the players/teams dataset
-print("Downloading soccer players dataset from Kaggle...")
-kaggle.api.dataset_download_files('antoinekrajnc/soccer-players-statistics', path=data_dir, unzip=True)
-player_csv_path = os.path.join(data_dir, "FullData.csv")
-print(f"Using player file: {player_csv_path}")
-players_df = pd.read_csv(player_csv_path)
-
-# Displaying column names 
-print("Columns in players dataset:", players_df.columns.tolist())
-
-# Extract teams (clubs) for the Teams table
-if 'Club' in players_df.columns:
-    teams_df = players_df[['Club']].drop_duplicates().reset_index(drop=True)
-    teams_df.rename(columns={'Club': 'Team_Name'}, inplace=True)
-    teams_df['Team_ID'] = teams_df.index + 1
-elif 'club' in players_df.columns:  # lower just in case
-    teams_df = players_df[['club']].drop_duplicates().reset_index(drop=True)
-    teams_df.rename(columns={'club': 'Team_Name'}, inplace=True)
-    teams_df['Team_ID'] = teams_df.index + 1
-else:
-    print("Warning: No Club column found, trying to find any column that might contain club info")
-    potential_cols = [col for col in players_df.columns if 'club' in col.lower() or 'team' in col.lower()]
-    if potential_cols:
-        teams_df = players_df[[potential_cols[0]]].drop_duplicates().reset_index(drop=True)
-        teams_df.rename(columns={potential_cols[0]: 'Team_Name'}, inplace=True)
-        teams_df['Team_ID'] = teams_df.index + 1
-    else:
-        # placeholder team if no club/team info is found
-        teams_df = pd.DataFrame({'Team_Name': ['Unknown'], 'Team_ID': [1]})
+import teamresolver
+import dbconnection
+import queries
+import datacache
+import loadmetrics
+import validation
+import similarplayers
+import userfeed
 
-print(f"Found {len(teams_df)} unique teams")
+# Kaggle dataset with the players and their clubs
+PLAYERS_DATASET = 'antoinekrajnc/soccer-players-statistics'
 
 # direct mappings, only problematic one is potential
 column_mapping = {
@@ -59,45 +30,6 @@ column_mapping = {
     'Strength': 'Strength'              # Strength = Strength
 }
 
-# Check available columns and select only those that exist
-available_columns = [col for col in column_mapping.keys() if col in players_df.columns]
-
-# Create the processed dataframe with renamed columns
-players_processed = players_df[available_columns].rename(columns={k: column_mapping[k] for k in available_columns})
-
-# Add Player_ID
-players_processed['Player_ID'] = players_processed.index + 1
-
-# Add Team_ID by merging with teams_df
-# Identify which column contains team/club information
-team_col = None
-if 'Club' in players_df.columns:
-    team_col = 'Club'
-elif 'club' in players_df.columns:
-    team_col = 'club'
-else:
-    potential_cols = [col for col in players_df.columns if 'club' in col.lower() or 'team' in col.lower()]
-    if potential_cols:
-        team_col = potential_cols[0]
-
-if team_col:
-    # Add the team info from the original dataframe 
-    players_processed['original_team'] = players_df[team_col]
-    # Merge to get Team_ID
-    players_processed = pd.merge(
-        players_processed,
-        teams_df[['Team_Name', 'Team_ID']],
-        left_on='original_team', right_on='Team_Name',
-        how='left'
-    )
-    # Clean up
-    players_processed.drop(['original_team'], axis=1, inplace=True)
-    if 'Team_Name' in players_processed.columns:
-        players_processed.drop('Team_Name', axis=1, inplace=True)
-else:
-    # If no team column found, assign all to team ID 1
-    players_processed['Team_ID'] = 1
-
 # To fill in for missing data
 numeric_columns = [
     'Overall_Rating', 'Ball_Control', 'Stamina', 'Potential',
@@ -105,105 +37,240 @@ numeric_columns = [
     'Free_Kick_Accuracy', 'Strength'
 ]
 
-for col in numeric_columns:
-    if col in players_processed.columns:
-        players_processed[col] = players_processed[col].fillna(50).astype(int)
+# Players columns in table order
+player_columns = ['Player_ID', 'Player_Name', 'Team_ID', 'Position'] + numeric_columns
+
+def download_players_dataset():
+    # Download the players/teams dataset, the cached copy is used when it hasn't changed
+    with loadmetrics.stage('players.download'):
+        dataset_path = datacache.fetch_kaggle(PLAYERS_DATASET)
+    player_csv_path = os.path.join(dataset_path, "FullData.csv")
+    print(f"Using player file: {player_csv_path}")
+    return player_csv_path
+
+def find_team_column(players_df):
+    # Identify which column contains team/club information
+    if 'Club' in players_df.columns:
+        return 'Club'
+    if 'club' in players_df.columns:  # lower just in case
+        return 'club'
+    print("Warning: No Club column found, trying to find any column that might contain club info")
+    potential_cols = [col for col in players_df.columns if 'club' in col.lower() or 'team' in col.lower()]
+    if potential_cols:
+        return potential_cols[0]
+    return None
+
+def build_teams(players_df, team_col):
+    # Extract teams (clubs) for the Teams table
+    if team_col:
+        teams_df = players_df[[team_col]].drop_duplicates().reset_index(drop=True)
+        teams_df.rename(columns={team_col: 'Team_Name'}, inplace=True)
+        teams_df['Team_ID'] = teams_df.index + 1
     else:
-        players_processed[col] = 50  # Is this better than null?
-
-if 'Position' in players_processed.columns:
-    players_processed['Position'] = players_processed['Position'].astype(str)
-else:
-    players_processed['Position'] = 'Unknown'  # no Preffered_Position
-
-# Sample of data
-print("\nProcessed player data sample:")
-print(players_processed.head(3))
-print(f"Total players: {len(players_processed)}")
-
-# Databse connection
-db_config = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'uiuc',
-    'database': 'soccer'
-}
+        # placeholder team if no club/team info is found
+        teams_df = pd.DataFrame({'Team_Name': ['Unknown'], 'Team_ID': [1]})
+
+    print(f"Found {len(teams_df)} unique teams")
+    return teams_df
+
+def build_players(players_df, teams_df, team_col):
+    # Check available columns and select only those that exist
+    available_columns = [col for col in column_mapping.keys() if col in players_df.columns]
+
+    # Create the processed dataframe with renamed columns
+    players_processed = players_df[available_columns].rename(columns={k: column_mapping[k] for k in available_columns})
+
+    # Add Player_ID
+    players_processed['Player_ID'] = players_processed.index + 1
+
+    # Add Team_ID by merging with teams_df
+    if team_col:
+        # Add the team info from the original dataframe
+        players_processed['original_team'] = players_df[team_col]
+        # Merge to get Team_ID
+        players_processed = pd.merge(
+            players_processed,
+            teams_df[['Team_Name', 'Team_ID']],
+            left_on='original_team', right_on='Team_Name',
+            how='left'
+        )
+        # Clean up
+        players_processed.drop(['original_team'], axis=1, inplace=True)
+        if 'Team_Name' in players_processed.columns:
+            players_processed.drop('Team_Name', axis=1, inplace=True)
+    else:
+        # If no team column found, assign all to team ID 1
+        players_processed['Team_ID'] = 1
 
-# Connect to MySQL
-try:
-    conn = mysql.connector.connect(**db_config)
+    # Ratings were range checked and missing ones set to 50 by validation, only
+    # columns the file doesn't have at all are filled in here
+    for col in numeric_columns:
+        if col in players_processed.columns:
+            players_processed[col] = players_processed[col].astype(int)
+        else:
+            players_processed[col] = 50  # Is this better than null?
+
+    if 'Position' not in players_processed.columns:
+        players_processed['Position'] = 'Unknown'  # no Preffered_Position
+
+    if 'Player_Name' not in players_processed.columns:
+        players_processed['Player_Name'] = "Unknown Player"
+    players_processed['Team_ID'] = players_processed['Team_ID'].astype('Int64')
+
+    # Sample of data
+    print("\nProcessed player data sample:")
+    print(players_processed.head(3))
+    print(f"Total players: {len(players_processed)}")
+    return players_processed
+
+def load_source(player_csv_path=None):
+    # Download (unless a local FullData.csv is given) and prepare the teams and players frames
+    if player_csv_path is None:
+        player_csv_path = download_players_dataset()
+    with loadmetrics.stage('players.parse'):
+        players_df = pd.read_csv(player_csv_path)
+    loadmetrics.add_rows('players.parse', len(players_df))
+
+    # Displaying column names
+    print("Columns in players dataset:", players_df.columns.tolist())
+
+    with loadmetrics.stage('players.normalize'):
+        team_col = find_team_column(players_df)
+        teams_df = build_teams(players_df, team_col)
+        # Rejected rows leave a gap in the Player_IDs, the other players keep theirs
+        valid_players, _ = validation.validate(players_df, validation.PLAYERS_SCHEMA, 'players')
+        players_processed = build_players(valid_players, teams_df, team_col)
+    return teams_df, players_processed
+
+def upsert(conn, table, columns, key, rows):
+    # Prepared multi-row INSERT ... ON DUPLICATE KEY UPDATE for every non key column
+    updates = ", ".join(f"{col} = VALUES({col})" for col in columns if col != key)
+    cursor = dbconnection.prepared_cursor(conn)
+    dbconnection.insert_rows(cursor, table, columns, rows, f"ON DUPLICATE KEY UPDATE {updates}")
+    cursor.close()
+
+def sync_teams(conn, teams_df):
+    """Insert teams that aren't in the database yet.
+
+    Existing teams are loaded in one query and matched by name, new ones get
+    IDs after the current maximum. Returns the teams frame with database
+    Team_IDs, a {source Team_ID: database Team_ID} mapping for the players
+    and the number of inserted teams.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT Team_ID, Team_Name FROM Teams")
+    existing = {team_name: team_id for team_id, team_name in cursor.fetchall()}
+    next_id = max(existing.values(), default=0) + 1
+
+    db_ids = []
+    new_teams = []
+    for team_name in teams_df['Team_Name'].tolist():
+        team_name = None if pd.isna(team_name) else team_name
+        if team_name in existing:
+            db_ids.append(existing[team_name])
+        else:
+            existing[team_name] = next_id
+            db_ids.append(next_id)
+            new_teams.append((next_id, team_name))
+            next_id += 1
+
+    cursor.close()
+    upsert(conn, "Teams", ['Team_ID', 'Team_Name'], 'Team_ID', new_teams)
+
+    id_mapping = dict(zip(teams_df['Team_ID'].tolist(), db_ids))
+    teams_df = teams_df.assign(Team_ID=db_ids)
+    print(f"Teams: {len(new_teams)} new, {len(teams_df) - len(new_teams)} already in the database")
+    return teams_df, id_mapping, len(new_teams)
+
+def sync_players(conn, players_processed):
+    """Insert new players and update the ones whose data changed.
+
+    All existing players are read in one query and compared in memory, only
+    new and changed rows are written, with prepared multi-row INSERT ... ON
+    DUPLICATE KEY UPDATE statements. Returns the Player_IDs of the inserted and updated players
+    and (Player_ID, Player_Name, Team_ID, old, new) for every Overall_Rating that changed.
+    """
     cursor = conn.cursor()
-    
-    # 1. Insert Teams data
+    cursor.execute(f"SELECT {', '.join(player_columns)} FROM Players")
+    existing = {row[0]: tuple(row) for row in cursor.fetchall()}
+
+    rows = dbconnection.frame_rows(players_processed, player_columns)
+    inserts = [row for row in rows if row[0] not in existing]
+    updates = [row for row in rows if row[0] in existing and row != existing[row[0]]]
+    unchanged = len(rows) - len(inserts) - len(updates)
+    rating = player_columns.index('Overall_Rating')
+    rating_changes = [(row[0], row[1], row[2], existing[row[0]][rating], row[rating])
+                      for row in updates if row[rating] != existing[row[0]][rating]]
+
+    cursor.close()
+    upsert(conn, "Players", player_columns, 'Player_ID', inserts + updates)
+
+    print(f"Players: {len(inserts)} new, {len(updates)} updated, {unchanged} unchanged")
+    return [row[0] for row in inserts], [row[0] for row in updates], rating_changes
+
+def import_players(conn, teams_df, players_processed, similar_index_path=similarplayers.INDEX_PATH):
+    #similar_index_path is where the rebuilt similar players index is saved (the benchmark keeps its own)
+    loadmetrics.track_connection(conn, 'players')
+    # Rows validation set aside go in with the players' commit
+    validation.save_rejects(conn, 'players', commit=False)
+    # Teams first so the players' Team_IDs point at database teams
     print("Importing Teams data...")
-    teams_inserted = 0
-    for index, row in tqdm(teams_df.iterrows(), total=len(teams_df)):
-        # checking if team exists
-        check_query = "SELECT Team_ID FROM Teams WHERE Team_Name = %s"
-        cursor.execute(check_query, (row['Team_Name'],))
-        result = cursor.fetchone()
-        
-        if result is None:  # Team doesn't exist yet
-            query = "INSERT INTO Teams (Team_ID, Team_Name) VALUES (%s, %s)"
-            values = (
-                int(row['Team_ID']),
-                row['Team_Name']
-            )
-            cursor.execute(query, values)
-            teams_inserted += 1
-    
-    # 2. Insert Players data
+    with loadmetrics.stage('players.insert'):
+        teams_df, id_mapping, teams_inserted = sync_teams(conn, teams_df)
+    players_processed = players_processed.assign(
+        Team_ID=players_processed['Team_ID'].map(id_mapping).astype('Int64')
+    )
+
     print("Importing Players data...")
-    players_inserted = 0
-    for index, row in tqdm(players_processed.iterrows(), total=len(players_processed)):
-        # Check if player already exists
-        check_query = "SELECT Player_ID FROM Players WHERE Player_ID = %s"
-        cursor.execute(check_query, (int(row['Player_ID']),))
-        result = cursor.fetchone()
-        
-        if result is None:  # Player doesn't exist yet
-            query = """
-            INSERT INTO Players 
-            (Player_ID, Player_Name, Team_ID, Position, Overall_Rating, 
-             Ball_Control, Stamina, Potential, Short_Passing, Shot_Power, 
-             Agility, Penalties, Free_Kick_Accuracy, Strength)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            values = (
-                int(row['Player_ID']),
-                str(row['Player_Name']) if not pd.isna(row['Player_Name']) else "Unknown Player",
-                int(row['Team_ID']) if not pd.isna(row['Team_ID']) else None,
-                str(row['Position']),
-                int(row['Overall_Rating']),
-                int(row['Ball_Control']),
-                int(row['Stamina']),
-                int(row['Potential']),
-                int(row['Short_Passing']),
-                int(row['Shot_Power']),
-                int(row['Agility']),
-                int(row['Penalties']),
-                int(row['Free_Kick_Accuracy']),
-                int(row['Strength'])
-            )
-            
-            try:
-                cursor.execute(query, values)
-                players_inserted += 1
-            except mysql.connector.Error as err:
-                print(f"Error inserting player {row['Player_ID']}: {err}")
-                print(f"Values: {values}")
-    
+    with loadmetrics.stage('players.insert'):
+        inserted_players, updated_players, rating_changes = sync_players(conn, players_processed)
+    loadmetrics.add_rows('players.insert', len(teams_df) + len(players_processed))
+
     # Final commit to database
-    conn.commit()
-    
-    print(f"Successfully imported {teams_inserted} team records and {players_inserted} player records")
-except mysql.connector.Error as err:
-    print(f"Database error: {err}")
-except Exception as e:
-    print(f"Unexpected error: {e}")
-finally:
-    if 'conn' in locals() and conn.is_connected():
-        cursor.close()
-        conn.close()
-        print("MySQL connection closed")
\ No newline at end of file
+    with loadmetrics.stage('players.commit'):
+        conn.commit()
+    loadmetrics.untrack_connection(conn)
+    queries.invalidate_cache(conn)
+
+    # Followers of the players see rating changes in their feed
+    userfeed.fan_out_rating_changes(conn, rating_changes)
+
+    # Similar players lookups work from a snapshot of Players, so it's rebuilt after every load
+    with loadmetrics.stage('players.similarity'):
+        similarplayers.build_index(conn, similar_index_path)
+
+    # New teams might be what previously unmatched match/stadium team names were missing
+    if teams_inserted > 0:
+        print(f"Cleared {teamresolver.forget_aliases(conn, unresolved_only=True)} unresolved team aliases")
+
+    print(f"Successfully imported {teams_inserted} team records, {len(inserted_players)} new and {len(updated_players)} updated player records")
+    return inserted_players, updated_players
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import teams and players into the soccer database")
+    parser.add_argument("--offline", action="store_true",
+                        help="don't download the players dataset, use the cached copy in data/cache")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.offline:
+        datacache.set_offline()
+    teams_df, players_processed = load_source()
+
+    # Connect to MySQL
+    try:
+        conn = dbconnection.get_connection()
+        import_players(conn, teams_df, players_processed)
+        loadmetrics.write_report('players')
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+    finally:
+        if 'conn' in locals() and conn.is_connected():
+            conn.close()
+            print("MySQL connection closed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict
+import dbconnection
+import loadstate
+
+# Read queries for the application, instead of copying SQL out of the
+# -- @block's in naturaljoin.session.sql.
+# Results are kept in an in-process LRU cache with a TTL. The loaders bump a
+# generation counter in Load_State after they commit, and the cache is dropped
+# as soon as a reader notices the counter moved (checked at most once per
+# GENERATION_CHECK_SECONDS), so repeated page loads don't go to MySQL at all.
+#
+#   import queries
+#   queries.team_matches(12, limit=5)
+#   queries.top_players(limit=10, position='ST')
+
+GENERATION_STATE = "cache.generation"
+
+# Results kept at most
+CACHE_SIZE = 512
+
+# Seconds a result is served from the cache even if nothing was loaded
+CACHE_TTL = 300
+
+# How often readers look at the generation counter
+GENERATION_CHECK_SECONDS = 1.0
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_generation = None
+_generation_checked = 0.0
+
+def invalidate_cache(conn):
+    #Called by the loaders after they commit, every process' cache is dropped within GENERATION_CHECK_SECONDS
+    cursor = conn.cursor()
+    loadstate.ensure_table(cursor)
+    cursor.execute("""
+        INSERT INTO Load_State (State_Key, State_Value) VALUES (%s, '1')
+        ON DUPLICATE KEY UPDATE State_Value = CAST(State_Value AS UNSIGNED) + 1
+    """, (GENERATION_STATE,))
+    cursor.close()
+    conn.commit()
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def check_generation(conn):
+    #Drop the cache when a loader committed since the last look, at most one lookup per interval
+    global _generation, _generation_checked
+    now = time.monotonic()
+    if now - _generation_checked < GENERATION_CHECK_SECONDS:
+        return
+    generation = loadstate.get_state(conn, GENERATION_STATE, '0')
+    with _cache_lock:
+        if generation != _generation:
+            _cache.clear()
+            _generation = generation
+        _generation_checked = now
+
+def fetch(query, params=()):
+    """Rows of a query as a list of dicts, from the cache when possible.
+
+    The cache key is the query text plus its parameters, a pooled connection
+    is only checked out on a miss or when the generation is due for a check.
+    """
+    key = (query, tuple(params))
+    now = time.monotonic()
+    if now - _generation_checked >= GENERATION_CHECK_SECONDS:
+        conn = dbconnection.get_connection()
+        try:
+            check_generation(conn)
+        finally:
+            conn.close()
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and now - entry[0] < CACHE_TTL:
+            _cache.move_to_end(key)
+            return [dict(row) for row in entry[1]]
+
+    conn = dbconnection.get_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+
+    with _cache_lock:
+        _cache[key] = (now, rows)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return [dict(row) for row in rows]
+
+def team_matches(team_id, limit=10):
+    #Latest matches of a team, home and away, with both team names
+    return fetch("""
+        SELECT m.Match_ID, m.Match_Date, m.Match_Tournament, m.Home_Team, home.Team_Name AS Home_Team_Name,
+               m.Away_Team, away.Team_Name AS Away_Team_Name, m.Home_Goals, m.Away_Goals
+        FROM (
+            (SELECT * FROM Matches WHERE Home_Team = %s ORDER BY Match_Date DESC LIMIT %s)
+            UNION ALL
+            (SELECT * FROM Matches WHERE Away_Team = %s ORDER BY Match_Date DESC LIMIT %s)
+        ) AS m
+        JOIN Teams home ON home.Team_ID = m.Home_Team
+        JOIN Teams away ON away.Team_ID = m.Away_Team
+        ORDER BY m.Match_Date DESC, m.Match_ID DESC
+        LIMIT %s
+    """, (team_id, limit, team_id, limit, limit))
+
+def head_to_head(team_a, team_b, limit=10):
+    """Totals and latest matches between two teams.
+
+    Totals come from the Head_To_Head aggregate table (see aggregates.py) and
+    are returned from team_a's point of view, None if they never played.
+    """
+    low, high = sorted((team_a, team_b))
+    totals = fetch("SELECT * FROM Head_To_Head WHERE Team_A = %s AND Team_B = %s", (low, high))
+    summary = None
+    if totals:
+        row = totals[0]
+        flipped = team_a != low
+        summary = {
+            'Played': row['Played'],
+            'Wins': row['Team_B_Wins'] if flipped else row['Team_A_Wins'],
+            'Losses': row['Team_A_Wins'] if flipped else row['Team_B_Wins'],
+            'Draws': row['Draws'],
+            'Goals_For': row['Team_B_Goals'] if flipped else row['Team_A_Goals'],
+            'Goals_Against': row['Team_A_Goals'] if flipped else row['Team_B_Goals'],
+        }
+
+    matches = fetch("""
+        (SELECT * FROM Matches WHERE Home_Team = %s AND Away_Team = %s ORDER BY Match_Date DESC LIMIT %s)
+        UNION ALL
+        (SELECT * FROM Matches WHERE Home_Team = %s AND Away_Team = %s ORDER BY Match_Date DESC LIMIT %s)
+        ORDER BY Match_Date DESC, Match_ID DESC
+        LIMIT %s
+    """, (team_a, team_b, limit, team_b, team_a, limit, limit))
+    return {'summary': summary, 'matches': matches}
+
+def squad(team_id):
+    #Every player of a team, best rated first
+    return fetch("""
+        SELECT * FROM Players WHERE Team_ID = %s
+        ORDER BY Overall_Rating DESC, Player_ID
+    """, (team_id,))
+
+def top_players(limit=10, position=None):
+    #Highest Overall_Rating players, optionally only one Position
+    if position is None:
+        return fetch("""
+            SELECT p.*, t.Team_Name FROM Players p LEFT JOIN Teams t ON t.Team_ID = p.Team_ID
+            ORDER BY p.Overall_Rating DESC, p.Player_ID LIMIT %s
+        """, (limit,))
+    return fetch("""
+        SELECT p.*, t.Team_Name FROM Players p LEFT JOIN Teams t ON t.Team_ID = p.Team_ID
+        WHERE p.Position = %s
+        ORDER BY p.Overall_Rating DESC, p.Player_ID LIMIT %s
+    """, (position, limit))
+
+def team_with_stadium(team_id):
+    #The team row with its Home_Stadium details, None for an unknown Team_ID
+    rows = fetch("""
+        SELECT t.Team_ID, t.Team_Name, t.Home_Stadium, s.Stadium_Name, s.Stadium_Country,
+               s.Stadium_Confederation, s.Stadium_City
+        FROM Teams t LEFT JOIN Stadiums s ON s.Stadium_ID = t.Home_Stadium
+        WHERE t.Team_ID = %s
+    """, (team_id,))
+    return rows[0] if rows else None
+
+def user_feed(user_id, limit=20):
+    #Newest items of a user's feed (matches of their teams, rating changes of their players), one primary key range read
+    return fetch("""
+        SELECT Item_ID, Item_Type, Item_Date, Match_ID, Team_ID, Player_ID, Summary
+        FROM User_Feed WHERE User_ID = %s
+        ORDER BY Item_ID DESC LIMIT %s
+    """, (user_id, limit))
@@ -0,0 +1,214 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import dbconnection
+
+# "Similar players" over the ten numeric attributes of Players. playerteamloader
+# rebuilds the index after every load: the attributes are normalized (z-score per
+# attribute, so Strength doesn't outweigh Penalties just by spread) into one
+# matrix saved to data/similar_players.npz, and lookups are nearest neighbours
+# in that matrix, through a KD-tree when scipy is installed and a plain numpy
+# distance scan otherwise (about the same speed at the real 17k players).
+#
+#   python similarplayers.py build
+#   python similarplayers.py similar 123 -k 5 --position ST
+#
+# From python:
+#   index = similarplayers.load_index()
+#   similarplayers.similar(index, 123, k=5, team_id=7)
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = os.path.join(project_dir, 'data', 'similar_players.npz')
+
+ATTRIBUTE_COLUMNS = [
+    'Overall_Rating', 'Ball_Control', 'Stamina', 'Potential',
+    'Short_Passing', 'Shot_Power', 'Agility', 'Penalties',
+    'Free_Kick_Accuracy', 'Strength'
+]
+
+# Rows per distance block when there's no KD-tree, keeps the batch scan's memory bounded
+SCAN_ROWS = 1024
+
+# Team_ID stored for players without a team (npz arrays can't hold None)
+NO_TEAM = -1
+
+def build_index(conn, path=INDEX_PATH):
+    """Read Players, normalize the attributes and save the index to path, returns the loaded index."""
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT Player_ID, Player_Name, Position, Team_ID, {', '.join(ATTRIBUTE_COLUMNS)} FROM Players ORDER BY Player_ID")
+    rows = cursor.fetchall()
+    cursor.close()
+
+    attributes = np.array([row[4:] for row in rows], dtype=np.float64).reshape(len(rows), len(ATTRIBUTE_COLUMNS))
+    # players with a missing attribute get the average for it
+    mean = np.nanmean(attributes, axis=0) if len(rows) else np.zeros(len(ATTRIBUTE_COLUMNS))
+    attributes = np.where(np.isnan(attributes), mean, attributes)
+    std = attributes.std(axis=0) if len(rows) else np.ones(len(ATTRIBUTE_COLUMNS))
+    std[std == 0] = 1
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(
+        path,
+        player_ids=np.array([row[0] for row in rows], dtype=np.int64),
+        names=np.array([row[1] or '' for row in rows], dtype=str),
+        positions=np.array([row[2] or '' for row in rows], dtype=str),
+        team_ids=np.array([NO_TEAM if row[3] is None else row[3] for row in rows], dtype=np.int64),
+        matrix=((attributes - mean) / std).astype(np.float32),
+        mean=mean,
+        std=std,
+    )
+    print(f"Similar players index: {len(rows)} players in {time.perf_counter() - started:.2f}s, saved to {path}")
+    return load_index(path)
+
+def make_tree(matrix):
+    #KD-tree over the rows, None without scipy
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+    return cKDTree(matrix)
+
+def load_index(path=INDEX_PATH):
+    """Load a saved index as a dict of its arrays plus 'tree' and 'rows' ({Player_ID: row})."""
+    if not os.path.exists(path):
+        raise RuntimeError(f"{path} is missing, run: python similarplayers.py build")
+    with np.load(path) as saved:
+        index = {name: saved[name] for name in saved.files}
+    index['tree'] = make_tree(index['matrix'])
+    index['rows'] = {player_id: row for row, player_id in enumerate(index['player_ids'].tolist())}
+    return index
+
+def player_row(index, player_id):
+    row = index['rows'].get(player_id)
+    if row is None:
+        raise ValueError(f"player {player_id} is not in the similar players index")
+    return row
+
+def nearest(index, vectors, k, candidates=None):
+    """k nearest rows (and distances) for every vector, optionally among the candidate rows only.
+
+    Uses the KD-tree for unfiltered lookups, otherwise a blockwise numpy scan.
+    """
+    matrix = index['matrix'] if candidates is None else index['matrix'][candidates]
+    k = min(k, len(matrix))
+    if k == 0:
+        return np.empty((len(vectors), 0), dtype=np.int64), np.empty((len(vectors), 0))
+
+    if candidates is None and index['tree'] is not None:
+        distances, rows = index['tree'].query(vectors, k=k)
+        return rows.reshape(len(vectors), k), distances.reshape(len(vectors), k)
+
+    all_rows = []
+    all_distances = []
+    for start in range(0, len(vectors), SCAN_ROWS):
+        block = vectors[start:start + SCAN_ROWS]
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab, one matrix product per block
+        squared = (block ** 2).sum(axis=1)[:, None] + (matrix ** 2).sum(axis=1)[None, :] - 2 * block @ matrix.T
+        squared = np.maximum(squared, 0)
+        rows = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        picked = np.take_along_axis(squared, rows, axis=1)
+        order = np.argsort(picked, axis=1, kind='stable')
+        all_rows.append(np.take_along_axis(rows, order, axis=1))
+        all_distances.append(np.sqrt(np.take_along_axis(picked, order, axis=1)))
+    rows = np.vstack(all_rows)
+    if candidates is not None:
+        rows = candidates[rows]
+    return rows, np.vstack(all_distances)
+
+def candidate_rows(index, position=None, team_id=None):
+    #Rows passing the Position/Team_ID filters, None when there are no filters
+    if position is None and team_id is None:
+        return None
+    keep = np.ones(len(index['player_ids']), dtype=bool)
+    if position is not None:
+        keep &= index['positions'] == position
+    if team_id is not None:
+        keep &= index['team_ids'] == team_id
+    return np.flatnonzero(keep)
+
+def without_self(rows, distances, self_rows, k):
+    #Drop each player from its own neighbours and keep k
+    keep = rows != np.asarray(self_rows)[:, None]
+    # every row has at most one self match, so k are left where k + 1 were asked for
+    # (fewer when a filter leaves less players than that)
+    count = min(k, int(keep.sum(axis=1).min())) if len(rows) else 0
+    rows = np.array([row[mask][:count] for row, mask in zip(rows, keep)], dtype=np.int64).reshape(len(keep), count)
+    distances = np.array([distance[mask][:count] for distance, mask in zip(distances, keep)]).reshape(len(keep), count)
+    return rows, distances
+
+def similar(index, player_id, k=10, position=None, team_id=None):
+    """The k players most like player_id, optionally only ones with this Position or Team_ID.
+
+    Returns a list of dicts with Player_ID, Player_Name, Position, Team_ID and
+    Distance (in standard deviations), closest first.
+    """
+    row = player_row(index, player_id)
+    rows, distances = nearest(index, index['matrix'][[row]], k + 1, candidate_rows(index, position, team_id))
+    rows, distances = without_self(rows, distances, [row], k)
+    return [
+        {
+            'Player_ID': int(index['player_ids'][other]),
+            'Player_Name': str(index['names'][other]),
+            'Position': str(index['positions'][other]),
+            'Team_ID': None if index['team_ids'][other] == NO_TEAM else int(index['team_ids'][other]),
+            'Distance': round(float(distance), 4),
+        }
+        for other, distance in zip(rows[0], distances[0])
+    ]
+
+def similar_batch(index, player_ids=None, k=10, position=None, team_id=None):
+    """Top k similar players for many players at once (all of them by default).
+
+    Returns (player_ids, neighbour Player_IDs as an (n, k) array, distances as
+    an (n, k) array). One KD-tree query or one blockwise scan for all of them.
+    """
+    if player_ids is None:
+        player_ids = index['player_ids']
+    self_rows = np.array([player_row(index, int(player_id)) for player_id in player_ids], dtype=np.int64)
+    rows, distances = nearest(index, index['matrix'][self_rows], k + 1, candidate_rows(index, position, team_id))
+    rows, distances = without_self(rows, distances, self_rows, k)
+    return np.asarray(player_ids), index['player_ids'][rows], distances
+
+def run(args):
+    if args.action == "build":
+        conn = dbconnection.get_connection()
+        try:
+            build_index(conn)
+        finally:
+            conn.close()
+        return
+
+    if args.player_id is None:
+        raise ValueError("similar needs a Player_ID")
+    index = load_index()
+    started = time.perf_counter()
+    results = similar(index, args.player_id, args.k, args.position, args.team)
+    elapsed = time.perf_counter() - started
+    row = player_row(index, args.player_id)
+    print(f"Most similar to {index['names'][row]} ({index['positions'][row]}):")
+    for result in results:
+        print(f"  {result['Player_ID']:>6}  {result['Player_Name']:<30} {result['Position']:<5} "
+              f"team {result['Team_ID']}  distance {result['Distance']}")
+    print(f"{len(results)} players in {elapsed * 1000:.1f}ms")
+
+def add_arguments(parser):
+    parser.add_argument("action", choices=["build", "similar"], help="rebuild the index from Players or look up a player")
+    parser.add_argument("player_id", type=int, nargs="?", help="Player_ID to find similar players for")
+    parser.add_argument("-k", type=int, default=10, help="number of similar players (default 10)")
+    parser.add_argument("--position", help="only players with this Position")
+    parser.add_argument("--team", type=int, help="only players of this Team_ID")
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar players by their attributes")
+    add_arguments(parser)
+    try:
+        run(parser.parse_args())
+    except Exception as e:
+        print(f"Similar players error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import argparse
+import datetime
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import mysql.connector
+import dbconnection
+import loadstate
+
+# Snapshots of the whole database for bringing up a dev/CI copy quickly,
+# instead of replaying soccerpopulated.sql statement by statement.
+# Export writes every table as a gzipped tab separated file plus manifest.json
+# (CREATE TABLE, row count and sha256 per table). All tables are read from one
+# consistent snapshot, started under a short global read lock, so a load
+# running during the export doesn't leave Matches, Teams and the aggregates
+# disagreeing. Restore creates the tables under staging names without their
+# secondary indexes and foreign keys, loads all of them at the same time with
+# LOAD DATA LOCAL INFILE and adds the indexes, so each table is indexed once at
+# the end instead of row by row. Only then are the staging tables swapped in
+# with one RENAME TABLE and the foreign keys added, a restore that fails
+# before that leaves the live tables alone.
+#
+#   python snapshot.py export data/snapshot
+#   python snapshot.py restore data/snapshot --workers 4
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SNAPSHOT_DIR = os.path.join(project_dir, 'data', 'snapshot')
+MANIFEST_FILE = 'manifest.json'
+
+# Tables exported/restored at the same time, each one uses its own connection
+# opened next to the pool (the pool has only pool_size connections and raises
+# instead of waiting when they're all checked out)
+DEFAULT_WORKERS = 4
+
+# Rows fetched per round trip while exporting
+FETCH_ROWS = 10000
+
+# Fast compression, the files are written once and read once
+COMPRESS_LEVEL = 1
+
+# MySQL's default LOAD DATA format: tab separated, backslash escapes, \N for NULL
+LOAD_TABLE_QUERY = """
+    LOAD DATA LOCAL INFILE '{path}'
+    INTO TABLE {table}
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+    LINES TERMINATED BY '\\n'
+"""
+
+# Lines of SHOW CREATE TABLE that are added after the data is loaded
+SECONDARY_KEY_PREFIXES = ('KEY ', 'UNIQUE KEY ', 'FULLTEXT KEY ', 'SPATIAL KEY ')
+
+# Restore loads into <table>__restore, the live tables are renamed to <table>__replaced while swapping
+STAGING_SUFFIX = '__restore'
+REPLACED_SUFFIX = '__replaced'
+
+def tsv_value(value):
+    #One field in LOAD DATA's default escaping
+    if value is None:
+        return '\\N'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime.datetime) else value.isoformat()
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def list_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+    tables = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return tables
+
+def split_create_statement(create_statement):
+    """Split SHOW CREATE TABLE output into the bare table and what to add later.
+
+    Returns (CREATE TABLE without secondary keys and foreign keys, secondary
+    key definitions, foreign key definitions). The primary key stays, rows
+    are loaded in primary key order anyway. So does a secondary key starting
+    with an AUTO_INCREMENT column, MySQL doesn't create a table whose
+    AUTO_INCREMENT column isn't first in some key (like User_Feed's Item_ID).
+    """
+    lines = create_statement.splitlines()
+    header, body, footer = lines[0], lines[1:-1], lines[-1]
+    auto_increment = {
+        re.match(r'`([^`]+)`', line.strip()).group(1)
+        for line in body if line.strip().startswith('`') and ' AUTO_INCREMENT' in line
+    }
+    columns, keys, foreign_keys = [], [], []
+    for line in body:
+        definition = line.strip().rstrip(',')
+        if definition.startswith(SECONDARY_KEY_PREFIXES):
+            first_column = re.search(r'\(`([^`]+)`', definition)
+            if first_column is not None and first_column.group(1) in auto_increment:
+                columns.append(definition)
+            else:
+                keys.append(definition)
+        elif definition.startswith('CONSTRAINT ') and ' FOREIGN KEY ' in definition:
+            foreign_keys.append(definition)
+        else:
+            columns.append(definition)
+    bare = header + "\n  " + ",\n  ".join(columns) + "\n" + footer
+    return bare, keys, foreign_keys
+
+def open_export_connections(count):
+    """count connections that all read the same consistent snapshot of the database.
+
+    The snapshots are started while a global read lock holds back every
+    commit, so all of them see the same point in time. The lock needs the
+    RELOAD privilege, without it the snapshots are started back to back and
+    a load committing in between can make the exported tables disagree.
+    """
+    lock_conn = dbconnection.connect()
+    connections = []
+    try:
+        cursor = lock_conn.cursor()
+        try:
+            cursor.execute("FLUSH TABLES WITH READ LOCK")
+            locked = True
+        except mysql.connector.Error as err:
+            print(f"Warning: could not take the global read lock ({err}), "
+                  "tables written during the export may not agree with each other")
+            locked = False
+        try:
+            for _ in range(count):
+                conn = dbconnection.connect()
+                connections.append(conn)
+                conn.start_transaction(consistent_snapshot=True, readonly=True)
+        finally:
+            if locked:
+                cursor.execute("UNLOCK TABLES")
+            cursor.close()
+    except Exception:
+        for conn in connections:
+            conn.close()
+        raise
+    finally:
+        lock_conn.close()
+    return connections
+
+def export_table(table, snapshot_dir, conn):
+    #Stream one table into <table>.tsv.gz on conn's snapshot, returns its manifest entry
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute(f"SHOW CREATE TABLE `{table}`")
+    create_statement = cursor.fetchone()[1]
+    cursor.close()
+
+    file_name = f"{table}.tsv.gz"
+    rows = 0
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM `{table}`")
+    with gzip.open(os.path.join(snapshot_dir, file_name), 'wt', encoding='utf-8',
+                   newline='\n', compresslevel=COMPRESS_LEVEL) as f:
+        while True:
+            batch = cursor.fetchmany(FETCH_ROWS)
+            if not batch:
+                break
+            f.writelines("\t".join(tsv_value(value) for value in row) + "\n" for row in batch)
+            rows += len(batch)
+    cursor.close()
+
+    print(f"Exported {table}: {rows} rows in {time.perf_counter() - started:.1f}s")
+    return {
+        'table': table,
+        'file': file_name,
+        'rows': rows,
+        'sha256': loadstate.file_fingerprint(os.path.join(snapshot_dir, file_name)),
+        'create': create_statement,
+    }
+
+def check_workers(workers):
+    if workers < 1:
+        raise ValueError(f"--workers has to be at least 1, got {workers}")
+
+def export_snapshot(snapshot_dir=DEFAULT_SNAPSHOT_DIR, workers=DEFAULT_WORKERS, tables=None):
+    check_workers(workers)
+    started = time.perf_counter()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    if tables is None:
+        conn = dbconnection.get_connection()
+        try:
+            tables = list_tables(conn)
+        finally:
+            conn.close()
+
+    # Every worker keeps its snapshot connection and takes the next table
+    connections = open_export_connections(max(1, min(workers, len(tables))))
+    idle = queue.Queue()
+    for conn in connections:
+        idle.put(conn)
+
+    def export(table):
+        conn = idle.get()
+        try:
+            return export_table(table, snapshot_dir, conn)
+        finally:
+            idle.put(conn)
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(connections)) as pool:
+            entries = list(pool.map(export, tables))
+    finally:
+        for conn in connections:
+            conn.rollback()
+            conn.close()
+
+    manifest = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'format': 'tsv.gz',
+        'tables': entries,
+    }
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Snapshot of {len(entries)} tables written to {snapshot_dir} in {time.perf_counter() - started:.1f}s")
+    return manifest
+
+def read_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    # check every file before touching the database
+    for entry in manifest['tables']:
+        path = os.path.join(snapshot_dir, entry['file'])
+        if loadstate.file_fingerprint(path) != entry['sha256']:
+            raise ValueError(f"{entry['file']} does not match the sha256 in {MANIFEST_FILE}")
+    return manifest
+
+def run_on_connection(statements):
+    #A few statements on a fresh connection with foreign key checks off
+    conn = dbconnection.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        for statement in statements:
+            cursor.execute(statement)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+def add_definitions(table, definitions):
+    #All deferred keys of a table in one ALTER, so the table is rebuilt once
+    if definitions:
+        run_on_connection([f"ALTER TABLE `{table}` " + ", ".join(f"ADD {definition}" for definition in definitions)])
+
+def staging_create(entry, bare):
+    #The bare CREATE TABLE under the table's staging name
+    name = f"`{entry['table']}`"
+    if name not in bare.splitlines()[0]:
+        raise ValueError(f"unexpected CREATE TABLE for {entry['table']} in {MANIFEST_FILE}")
+    header, rest = bare.split("\n", 1)
+    return header.replace(name, f"`{entry['table']}{STAGING_SUFFIX}`", 1) + "\n" + rest
+
+def load_table(entry, snapshot_dir):
+    #Unpack one table's file and LOAD DATA it into the empty staging table
+    started = time.perf_counter()
+    fd, tsv_path = tempfile.mkstemp(suffix=".tsv")
+    os.close(fd)
+    conn = dbconnection.connect(allow_local_infile=True)
+    try:
+        with gzip.open(os.path.join(snapshot_dir, entry['file']), 'rb') as source, open(tsv_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        cursor = conn.cursor()
+        dbconnection.tune_session_for_bulk(cursor)
+        # forward slashes so the path also works inside the SQL string on Windows
+        cursor.execute(LOAD_TABLE_QUERY.format(path=Path(tsv_path).as_posix(),
+                                               table=f"`{entry['table']}{STAGING_SUFFIX}`"))
+        loaded = cursor.rowcount
+        conn.commit()
+        dbconnection.restore_session(cursor)
+        cursor.close()
+    finally:
+        conn.close()
+        os.remove(tsv_path)
+
+    if loaded != entry['rows']:
+        raise ValueError(f"{entry['table']}: loaded {loaded} rows, manifest says {entry['rows']}")
+    print(f"Loaded {entry['table']}: {loaded} rows in {time.perf_counter() - started:.1f}s")
+
+def swap_tables(names):
+    """Put the staging tables in place of the live ones with one atomic RENAME TABLE, then drop the old ones."""
+    conn = dbconnection.connect()
+    try:
+        existing = set(list_tables(conn))
+    finally:
+        conn.close()
+    renames = []
+    for name in names:
+        if name in existing:
+            renames.append(f"`{name}` TO `{name}{REPLACED_SUFFIX}`")
+        renames.append(f"`{name}{STAGING_SUFFIX}` TO `{name}`")
+    run_on_connection([f"DROP TABLE IF EXISTS `{name}{REPLACED_SUFFIX}`" for name in names] +
+                      ["RENAME TABLE " + ", ".join(renames)] +
+                      [f"DROP TABLE `{name}{REPLACED_SUFFIX}`" for name in names if name in existing])
+
+def restore_snapshot(snapshot_dir=DEFAULT_SNAPSHOT_DIR, workers=DEFAULT_WORKERS):
+    """Replace the tables in the snapshot with its contents.
+
+    1. create every table under its staging name without secondary keys and
+       foreign keys
+    2. LOAD DATA all tables in parallel
+    3. add the secondary keys (one ALTER per table, tables in parallel)
+    4. swap the staging tables in with one RENAME TABLE and drop the old ones
+    5. add the foreign keys, which are checked against the loaded data
+    When a step before the swap fails the staging tables are dropped and the
+    live tables are untouched. Tables that aren't in the snapshot are left
+    alone.
+    """
+    check_workers(workers)
+    started = time.perf_counter()
+    manifest = read_manifest(snapshot_dir)
+    tables = []
+    for entry in manifest['tables']:
+        bare, keys, foreign_keys = split_create_statement(entry['create'])
+        tables.append((entry, bare, keys, foreign_keys))
+
+    names = [entry['table'] for entry, _, _, _ in tables]
+    staging = [name + STAGING_SUFFIX for name in names]
+    drop_staging = [f"DROP TABLE IF EXISTS `{name}`" for name in staging]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            # leftovers of an earlier failed restore go first
+            run_on_connection(drop_staging + [staging_create(entry, bare) for entry, bare, _, _ in tables])
+            list(pool.map(lambda table: load_table(table[0], snapshot_dir), tables))
+            print(f"Data loaded in {time.perf_counter() - started:.1f}s, adding indexes...")
+            list(pool.map(lambda table: add_definitions(table[0]['table'] + STAGING_SUFFIX, table[2]), tables))
+        except Exception:
+            print("Restore failed, dropping the staging tables, the live tables were not touched")
+            run_on_connection(drop_staging)
+            raise
+
+        swap_tables(names)
+        print(f"Tables swapped in after {time.perf_counter() - started:.1f}s, adding foreign keys...")
+        list(pool.map(lambda table: add_definitions(table[0]['table'], table[3]), tables))
+
+    rows = sum(entry['rows'] for entry, _, _, _ in tables)
+    print(f"Restored {len(tables)} tables ({rows} rows) from {snapshot_dir} in {time.perf_counter() - started:.1f}s")
+
+def run(args):
+    if args.action == "export":
+        export_snapshot(args.dir, args.workers, args.tables)
+    else:
+        restore_snapshot(args.dir, args.workers)
+
+def add_arguments(parser):
+    parser.add_argument("action", choices=["export", "restore"])
+    parser.add_argument("dir", nargs="?", default=DEFAULT_SNAPSHOT_DIR,
+                        help="snapshot directory (default data/snapshot)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"tables exported or loaded at the same time (default {DEFAULT_WORKERS})")
+    parser.add_argument("--tables", nargs="+", help="only export these tables (default all)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the database to a snapshot or restore one")
+    add_arguments(parser)
+    try:
+        run(parser.parse_args())
+    except Exception as e:
+        print(f"Snapshot error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import dbconnection
+import playerteamloader
+import stadiumloader
+import matchesloader
+import teamresolver
+import migrate
+import aggregates
+import elo
+import userfeed
+import snapshot
+import datacache
+import loadmetrics
+import analytics
+import similarplayers
+
+# One entry point for loading everything: python -m soccerdb load
+# (and for the schema: python -m soccerdb migrate)
+# The loaders are run as a dependency graph, the downloads and parsing of the three
+# sources have no dependencies so they run at the same time, the database steps
+# follow the order from the README: Teams/Players -> Stadium assignment -> Matches,
+# and the aggregate tables are updated from the new matches at the end.
+
+def run_steps(steps, workers):
+    """Run {name: (function, [dependency names])} as a DAG on a thread pool.
+
+    A step starts as soon as all its dependencies finished and gets their
+    results as a {name: result} dict. Returns every step's result, the first
+    failing step stops the run.
+    """
+    results = {}
+    pending = dict(steps)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for name, (function, dependencies) in list(pending.items()):
+                if all(dependency in results for dependency in dependencies):
+                    del pending[name]
+                    inputs = {dependency: results[dependency] for dependency in dependencies}
+                    running[pool.submit(timed_step, name, function, inputs)] = name
+
+            if not running:
+                raise RuntimeError(f"Steps with missing dependencies: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+def timed_step(name, function, inputs):
+    started = time.perf_counter()
+    print(f"[{name}] started")
+    result = function(inputs)
+    print(f"[{name}] finished in {time.perf_counter() - started:.1f}s")
+    return result
+
+def with_connection(work):
+    #Check a pooled connection out for one database step and always hand it back
+    conn = dbconnection.get_connection()
+    try:
+        return work(conn)
+    finally:
+        conn.close()
+
+def load_steps(args):
+    #The load graph, source steps download and parse, database steps write
+    def matches_source(inputs):
+        parquet_file_path = matchesloader.download_games()
+        # streaming reads the file batch by batch during the insert instead
+        matches_df = None if args.stream else matchesloader.read_matches(parquet_file_path)
+        return parquet_file_path, matches_df
+
+    def teams_players(inputs):
+        teams_df, players_processed = inputs['players_source']
+        return with_connection(lambda conn: playerteamloader.import_players(conn, teams_df, players_processed))
+
+    def stadiums(inputs):
+        stadiums_processed, home_teams_col = inputs['stadiums_source']
+        if stadiums_processed is None:
+            raise RuntimeError("stadium dataset has none of the expected columns")
+        return with_connection(lambda conn: stadiumloader.import_stadiums(conn, stadiums_processed, home_teams_col, args.fallback))
+
+    def matches(inputs):
+        parquet_file_path, matches_df = inputs['matches_source']
+        conn = matchesloader.connect_to_db(allow_local_infile=args.bulk)
+        try:
+            return matchesloader.import_matches(
+                conn, batch_size=args.batch_size, bulk=args.bulk, threshold=args.match_threshold,
+                stream=args.stream, incremental=args.incremental, workers=args.match_workers,
+                parquet_file_path=parquet_file_path, matches_df=matches_df
+            )
+        finally:
+            conn.close()
+
+    return {
+        'players_source': (lambda inputs: playerteamloader.load_source(), []),
+        'stadiums_source': (lambda inputs: stadiumloader.load_source(), []),
+        'matches_source': (matches_source, []),
+        'teams_players': (teams_players, ['players_source']),
+        'stadiums': (stadiums, ['stadiums_source', 'teams_players']),
+        'matches': (matches, ['matches_source', 'stadiums']),
+        'aggregates': (lambda inputs: with_connection(aggregates.update_aggregates), ['matches']),
+        'ratings': (lambda inputs: with_connection(elo.update_ratings), ['matches']),
+        'feed': (lambda inputs: with_connection(userfeed.fan_out_matches), ['matches']),
+    }
+
+def load(args):
+    started = time.perf_counter()
+    if args.offline:
+        datacache.set_offline()
+    run_steps(load_steps(args), args.workers)
+    loadmetrics.write_report('load')
+    print(f"Load complete in {time.perf_counter() - started:.1f}s")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m soccerdb", description="Soccer database tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load_parser = commands.add_parser("load", help="download all datasets and run every loader")
+    load_parser.add_argument("--workers", type=int, default=3,
+                             help="steps allowed to run at the same time (default 3, one per source)")
+    load_parser.add_argument("--batch-size", type=int, default=matchesloader.BATCH_SIZE,
+                             help=f"matches per INSERT statement and commit (default {matchesloader.BATCH_SIZE})")
+    load_parser.add_argument("--bulk", action="store_true",
+                             help="load matches with LOAD DATA LOCAL INFILE (or multi-row INSERT)")
+    load_parser.add_argument("--match-workers", type=int, default=1,
+                             help="worker processes inserting match shards in parallel (default 1)")
+    load_parser.add_argument("--stream", action="store_true",
+                             help="read games.parquet in record batches while inserting")
+    load_parser.add_argument("--incremental", action="store_true",
+                             help="only insert matches past the stored watermark, skip an unchanged games.parquet")
+    load_parser.add_argument("--match-threshold", type=float, default=teamresolver.DEFAULT_THRESHOLD,
+                             help=f"minimum similarity for fuzzy team name matches (default {teamresolver.DEFAULT_THRESHOLD})")
+    load_parser.add_argument("--fallback", choices=stadiumloader.FALLBACK_POLICIES, default=stadiumloader.DEFAULT_FALLBACK,
+                             help=f"Home_Stadium for teams no heuristic matches (default {stadiumloader.DEFAULT_FALLBACK})")
+    load_parser.add_argument("--offline", action="store_true",
+                             help="don't download anything, use the cached datasets in data/cache")
+    load_parser.set_defaults(handler=load)
+
+    migrate_parser = commands.add_parser("migrate", help="apply pending schema migrations")
+    migrate.add_arguments(migrate_parser)
+    migrate_parser.set_defaults(handler=migrate.migrate)
+
+    aggregates_parser = commands.add_parser("aggregates", help="update the standings, head to head and form tables")
+    aggregates.add_arguments(aggregates_parser)
+    aggregates_parser.set_defaults(handler=aggregates.run)
+
+    ratings_parser = commands.add_parser("ratings", help="update the teams' Elo ratings")
+    elo.add_arguments(ratings_parser)
+    ratings_parser.set_defaults(handler=elo.run)
+
+    feed_parser = commands.add_parser("feed", help="add new matches to the users' feeds")
+    userfeed.add_arguments(feed_parser)
+    feed_parser.set_defaults(handler=userfeed.run)
+
+    snapshot_parser = commands.add_parser("snapshot", help="export the database to a snapshot or restore one")
+    snapshot.add_arguments(snapshot_parser)
+    snapshot_parser.set_defaults(handler=snapshot.run)
+
+    analytics_parser = commands.add_parser("analytics", help="run analytical queries on DuckDB instead of MySQL")
+    analytics.add_arguments(analytics_parser)
+    analytics_parser.set_defaults(handler=analytics.run)
+
+    similar_parser = commands.add_parser("similar", help="find players with similar attributes")
+    similarplayers.add_arguments(similar_parser)
+    similar_parser.set_defaults(handler=similarplayers.run)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        args.handler(args)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,288 +1,457 @@
 import os
+import argparse
+import zlib
 import pandas as pd
 import mysql.connector
-from tqdm import tqdm  
-import re  
+from collections import defaultdict, Counter
+import teamresolver
+import dbconnection
+import datacache
+import loadmetrics
+import queries
+import validation
 
 # Direcory setup
 project_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(project_dir, 'data')
 os.makedirs(data_dir, exist_ok=True)
-os.environ['KAGGLE_CONFIG_DIR'] = project_dir 
 
-import kaggle
+# Kaggle dataset with the stadiums and their home teams
+STADIUMS_DATASET = 'imtkaggleteam/football-stadiums'
 
-# Download stadiums dataset
-print("Downloading football stadiums dataset from Kaggle...")
-kaggle.api.dataset_download_files('imtkaggleteam/football-stadiums', path=data_dir, unzip=True)
-print("Files downloaded:")
-for file in os.listdir(data_dir):
-    print(f" - {file}")
-stadium_csv_files = [f for f in os.listdir(data_dir) if f.endswith('.csv') and 'stadium' in f.lower()]
-
-# Using the exact name of the file
-stadium_csv_path = os.path.join(data_dir, "Football Stadiums.csv")
-print(f"Using stadium file: {stadium_csv_path}")
-stadiums_df = pd.read_csv(stadium_csv_path)
-
-# Displaying column names 
-print("Columns in stadiums dataset:", stadiums_df.columns.tolist())
-
-# direct mapping 
+# direct mapping
 column_mapping = {
-    'Stadium': 'Stadium_Name',  
+    'Stadium': 'Stadium_Name',
     'Country': 'Stadium_Country',
     'Confederation': 'Stadium_Confederation',
     'City': 'Stadium_City'
 }
 
-# Checking if HomeTeams column exists
-home_teams_col = None
-for col in stadiums_df.columns:
-    if ('home' in col.lower() and 'team' in col.lower()) or ('club' in col.lower()):
-        home_teams_col = col
-        print(f"Found home teams column: {col}")
-        break
-
-# Create a normalized version of home teams column for better matching
-if home_teams_col:
-    print(f"Sample values from {home_teams_col} column:")
-    print(stadiums_df[home_teams_col].dropna().head(3).tolist())
-
-# Check if expected columns exist and create a new mapping for columns that exist
-actual_mapping = {}
-for original, target in column_mapping.items():
-    if original in stadiums_df.columns:
-        actual_mapping[original] = target
-    else:
-        print(f"Warning: Expected column '{original}' not found in dataset")
-
-# Create the processed dataframe with renamed columns
-available_columns = list(actual_mapping.keys())
-if available_columns:
+stadium_columns = ['Stadium_ID', 'Stadium_Name', 'Stadium_Country', 'Stadium_Confederation', 'Stadium_City']
+
+# Team name words shorter than this are too generic to match stadiums on
+MIN_TOKEN_LENGTH = 4
+
+# What teams no heuristic matched get as Home_Stadium:
+#   none    - NULL
+#   hash    - a stadium picked from a hash of the team name, the same one every run
+#   country - a hashed pick among stadiums in the country the team plays most of its
+#             matches in (from Match_Tournament), hash over all stadiums if unknown
+FALLBACK_POLICIES = ['none', 'hash', 'country']
+DEFAULT_FALLBACK = 'hash'
+
+# Tournament and stadium country spellings of the same country, after country_key
+# normalized them (lowercase, no accents or punctuation, "and"/"of" dropped)
+COUNTRY_ALIASES = {
+    'ireland republic': 'ireland',
+    'republic ireland': 'ireland',
+    'eire': 'ireland',
+    'bosnia': 'bosnia herzegovina',
+    'usa': 'united states',
+    'us': 'united states',
+    'united states america': 'united states',
+    'korea republic': 'south korea',
+    'republic korea': 'south korea',
+    'korea dpr': 'north korea',
+    'czechia': 'czech republic',
+    'macedonia': 'north macedonia',
+    'fyr macedonia': 'north macedonia',
+    'turkiye': 'turkey',
+    'china pr': 'china',
+    'cote d ivoire': 'ivory coast',
+    'uae': 'united arab emirates',
+    'holland': 'netherlands',
+    'russian federation': 'russia',
+    'ir iran': 'iran',
+}
+
+# Teams that got a fallback are listed here after every run
+FALLBACK_REPORT_PATH = os.path.join(data_dir, 'stadium_fallbacks.csv')
+
+def download_stadiums_dataset():
+    # Download stadiums dataset, the cached copy is used when it hasn't changed
+    with loadmetrics.stage('stadiums.download'):
+        dataset_path = datacache.fetch_kaggle(STADIUMS_DATASET)
+    print("Files in dataset:")
+    for file in os.listdir(dataset_path):
+        print(f" - {file}")
+
+    # Using the exact name of the file
+    stadium_csv_path = os.path.join(dataset_path, "Football Stadiums.csv")
+    print(f"Using stadium file: {stadium_csv_path}")
+    return stadium_csv_path
+
+def find_home_teams_column(stadiums_df):
+    # Checking if HomeTeams column exists
+    for col in stadiums_df.columns:
+        if ('home' in col.lower() and 'team' in col.lower()) or ('club' in col.lower()):
+            print(f"Found home teams column: {col}")
+            print(f"Sample values from {col} column:")
+            print(stadiums_df[col].dropna().head(3).tolist())
+            return col
+    return None
+
+def build_stadiums(stadiums_df, home_teams_col):
+    # Check if expected columns exist and create a new mapping for columns that exist
+    actual_mapping = {}
+    for original, target in column_mapping.items():
+        if original in stadiums_df.columns:
+            actual_mapping[original] = target
+        else:
+            print(f"Warning: Expected column '{original}' not found in dataset")
+
+    # Create the processed dataframe with renamed columns
+    available_columns = list(actual_mapping.keys())
+    if not available_columns:
+        print("ERROR found no columns")
+        return None
+
     columns_to_use = available_columns.copy()
     # Add home teams column if found
     if home_teams_col and home_teams_col not in columns_to_use:
         columns_to_use.append(home_teams_col)
-        
+
     stadiums_processed = stadiums_df[columns_to_use].copy()
     # Rename only the mapped columns
     stadiums_processed.rename(columns=actual_mapping, inplace=True)
-    
+
     # Add Stadium_ID
     stadiums_processed['Stadium_ID'] = stadiums_processed.index + 1
-    
-    # Fill NA
-    stadiums_processed['Stadium_Name'] = stadiums_processed['Stadium_Name'].fillna('Unknown Stadium')
-    stadiums_processed['Stadium_Country'] = stadiums_processed['Stadium_Country'].fillna('Unknown')
-    stadiums_processed['Stadium_City'] = stadiums_processed['Stadium_City'].fillna('Unknown')
-    
-    # Confederation default = UNK
-    if 'Stadium_Confederation' not in stadiums_processed.columns:
-        stadiums_processed['Stadium_Confederation'] = 'Unknown'
-    else:
-        stadiums_processed['Stadium_Confederation'] = stadiums_processed['Stadium_Confederation'].fillna('Unknown')
-else:
-    print("ERROR found no columns")
-
-# Display sample of data
-print("\nProcessed stadium data sample:")
-print(stadiums_processed.head(3))
-print(f"Total stadiums: {len(stadiums_processed)}")
-
-# Database connection 
-db_config = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'uiuc',
-    'database': 'soccer'
-}
 
-# Function to normalize team names for comparison
-def normalize_team_name(name):
-    if pd.isna(name):
-        return ""
-    # Convert to lowercase, remove non-alphanumeric chars except spaces
-    name = str(name).lower().strip()
-    name = re.sub(r'[^\w\s]', '', name)
-    # Replace multiple spaces with single space
-    name = re.sub(r'\s+', ' ', name)
-    return name
-
-# Connect to MySQL
-try:
-    conn = mysql.connector.connect(**db_config)
+    # Missing values were filled in by validation, only absent columns are left
+    for col in ['Stadium_Country', 'Stadium_City', 'Stadium_Confederation']:
+        if col not in stadiums_processed.columns:
+            stadiums_processed[col] = 'Unknown'
+
+    # Display sample of data
+    print("\nProcessed stadium data sample:")
+    print(stadiums_processed.head(3))
+    print(f"Total stadiums: {len(stadiums_processed)}")
+    return stadiums_processed
+
+def load_source(stadium_csv_path=None):
+    # Download (unless a local stadiums csv is given) and prepare the stadiums frame
+    if stadium_csv_path is None:
+        stadium_csv_path = download_stadiums_dataset()
+    with loadmetrics.stage('stadiums.parse'):
+        stadiums_df = pd.read_csv(stadium_csv_path)
+    loadmetrics.add_rows('stadiums.parse', len(stadiums_df))
+
+    # Displaying column names
+    print("Columns in stadiums dataset:", stadiums_df.columns.tolist())
+
+    with loadmetrics.stage('stadiums.normalize'):
+        home_teams_col = find_home_teams_column(stadiums_df)
+        # Stadiums without a name are set aside for Load_Rejects
+        stadiums_df, _ = validation.validate(stadiums_df, validation.STADIUMS_SCHEMA, 'stadiums')
+        stadiums_processed = build_stadiums(stadiums_df, home_teams_col)
+    return stadiums_processed, home_teams_col
+
+def sync_stadiums(conn, stadiums_processed):
+    """Insert stadiums that aren't in the database yet.
+
+    Existing stadiums are loaded in one query and matched on name and city,
+    new ones get IDs after the current maximum and are written with
+    prepared multi-row INSERTs. Returns the database Stadium_ID of every row and the number
+    of inserted stadiums.
+    """
     cursor = conn.cursor()
-    
-    # 1. Get all teams from database first
-    cursor.execute("SELECT Team_ID, Team_Name FROM Teams")
-    db_teams = cursor.fetchall()
-    
-    # Create normalized versions of team names for better matching
-    db_teams_dict = {}
-    db_teams_norm = {}
-    
-    for team_id, team_name in db_teams:
-        db_teams_dict[team_id] = team_name
-        # Store normalized team name for better matching
-        db_teams_norm[normalize_team_name(team_name)] = team_id
-    
-    print(f"Loaded {len(db_teams)} teams from database")
-    print("Sample team names:", list(db_teams_dict.values())[:3])
-    
-    # 2. Insert Stadiums data
-    print("Importing Stadiums data...")
-    stadiums_inserted = 0
-    
+    cursor.execute("SELECT Stadium_ID, Stadium_Name, Stadium_City FROM Stadiums")
+    existing = {(name, city): stadium_id for stadium_id, name, city in cursor.fetchall()}
+    next_id = max(existing.values(), default=0) + 1
+
+    stadium_ids = []
+    new_stadiums = []
+    for row in stadiums_processed[stadium_columns].itertuples(index=False):
+        key = (str(row.Stadium_Name), str(row.Stadium_City))
+        if key not in existing:
+            existing[key] = next_id
+            new_stadiums.append((
+                next_id,
+                str(row.Stadium_Name),
+                str(row.Stadium_Country),
+                str(row.Stadium_Confederation),
+                str(row.Stadium_City)
+            ))
+            next_id += 1
+        stadium_ids.append(existing[key])
+
+    cursor.close()
+    cursor = dbconnection.prepared_cursor(conn)
+    dbconnection.insert_rows(cursor, 'Stadiums', stadium_columns, new_stadiums)
+    cursor.close()
+    return stadium_ids, len(new_stadiums)
+
+def stadium_home_teams(stadiums_processed, stadium_ids, home_teams_col):
     # Create a mapping of stadium IDs to home teams
     stadium_teams_map = {}
-    
-    for index, row in tqdm(stadiums_processed.iterrows(), total=len(stadiums_processed)):
-        # First check if the stadium already exists to avoid duplicates
-        check_query = "SELECT Stadium_ID FROM Stadiums WHERE Stadium_Name = %s AND Stadium_City = %s"
-        cursor.execute(check_query, (row['Stadium_Name'], row['Stadium_City']))
-        result = cursor.fetchone()
-        
-        stadium_id = None
-        if result is None:  # Stadium doesn't exist yet
-            query = """
-            INSERT INTO Stadiums (Stadium_ID, Stadium_Name, Stadium_Country, Stadium_Confederation, Stadium_City) 
-            VALUES (%s, %s, %s, %s, %s)
-            """
-            values = (
-                int(row['Stadium_ID']),
-                str(row['Stadium_Name']),
-                str(row['Stadium_Country']),
-                str(row['Stadium_Confederation']),
-                str(row['Stadium_City'])
-            )
-            try:
-                cursor.execute(query, values)
-                stadiums_inserted += 1
-                stadium_id = int(row['Stadium_ID'])
-            except mysql.connector.Error as err:
-                print(f"Error inserting stadium {row['Stadium_ID']}: {err}")
-        else:
-            stadium_id = result[0]
-        
-        # Store mapping of stadium to home teams if the column exists
-        if home_teams_col and stadium_id is not None:
-            home_teams = row.get(home_teams_col)
-            if pd.notna(home_teams) and home_teams:
-                # Split teams by comma
-                for separator in [',']:
-                    if separator in str(home_teams):
-                        teams_list = [team.strip() for team in str(home_teams).split(separator)]
-                        stadium_teams_map[stadium_id] = teams_list
-                        break
-                else:
-                    # If no separator found, treat as a single team
-                    stadium_teams_map[stadium_id] = [str(home_teams).strip()]
-    
-    # 3. Update Teams with Home_Stadium based on the mapping
-    print("Assigning home stadiums to teams...")
-    updates = 0
-    
-    # First: Create a mapping of normalized stadium team names to stadium IDs for better matching
-    stadium_team_to_id = {}
-    if stadium_teams_map:
-        for stadium_id, team_names in stadium_teams_map.items():
-            for team_name in team_names:
-                norm_name = normalize_team_name(team_name)
-                if norm_name:  # Only add if not empty
-                    stadium_team_to_id[norm_name] = stadium_id
-    
-    # Print sample of stadium team names for debugging
-    if stadium_team_to_id:
-        print("Sample normalized stadium team names:", list(stadium_team_to_id.keys())[:3])
-    
-    # First pass: Try direct normalized name matching
-    teams_matched = set()
-    for team_id, team_name in db_teams:
-        norm_team = normalize_team_name(team_name)
-        
-        # Try exact match with normalized names
-        if norm_team in stadium_team_to_id:
-            stadium_id = stadium_team_to_id[norm_team]
-            cursor.execute("""
-                UPDATE Teams SET Home_Stadium = %s
-                WHERE Team_ID = %s
-            """, (stadium_id, team_id))
-            updates += 1
-            teams_matched.add(team_id)
+    if not home_teams_col:
+        return stadium_teams_map
+
+    for stadium_id, home_teams in zip(stadium_ids, stadiums_processed[home_teams_col].tolist()):
+        if pd.notna(home_teams) and home_teams:
+            # Split teams by comma, if no separator found this is a single team
+            stadium_teams_map[stadium_id] = [team.strip() for team in str(home_teams).split(',')]
+    return stadium_teams_map
+
+def build_stadium_token_index(stadiums):
+    """Token inverted index over stadium names and cities.
+
+    Returns two dicts, normalized token -> Stadium_IDs for stadium names only,
+    and for names and cities together. IDs are kept in ascending order so the
+    lowest ID wins ties, like the LIMIT 1 queries this replaces.
+    """
+    name_index = defaultdict(list)
+    any_index = defaultdict(list)
+    for stadium_id, stadium_name, stadium_city in sorted(stadiums):
+        name_tokens = set(teamresolver.normalize_team_name(stadium_name).split())
+        city_tokens = set(teamresolver.normalize_team_name(stadium_city).split())
+        for token in name_tokens:
+            name_index[token].append(stadium_id)
+        for token in name_tokens | city_tokens:
+            any_index[token].append(stadium_id)
+    return name_index, any_index
+
+def match_by_stadium_tokens(team_name, name_index, any_index):
+    # Stadium whose name contains every word of the team name
+    tokens = teamresolver.normalize_team_name(team_name).split()
+    if tokens:
+        candidates = set(name_index.get(tokens[0], ()))
+        for token in tokens[1:]:
+            candidates &= set(name_index.get(token, ()))
+        if candidates:
+            return min(candidates)
+
+    # Try to find if any stadium is in the same city as might be in the team name
+    for token in tokens:
+        if len(token) >= MIN_TOKEN_LENGTH and token in any_index:
+            return any_index[token][0]
+    return None
+
+def apply_assignments(conn, assignments):
+    #Set Home_Stadium for all teams at once through a temporary mapping table
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TEMPORARY TABLE Stadium_Assignments (
+            Team_ID INT PRIMARY KEY,
+            Stadium_ID INT
+        )
+    """)
+    dbconnection.insert_rows(cursor, 'Stadium_Assignments', ['Team_ID', 'Stadium_ID'], list(assignments.items()))
+    cursor.execute("""
+        UPDATE Teams t
+        JOIN Stadium_Assignments a ON a.Team_ID = t.Team_ID
+        SET t.Home_Stadium = a.Stadium_ID
+    """)
+    updated = cursor.rowcount
+    cursor.execute("DROP TEMPORARY TABLE Stadium_Assignments")
+    cursor.close()
+    return updated
+
+def hashed_pick(team_name, stadium_ids):
+    #Same team name and stadium list always give the same stadium
+    if not stadium_ids:
+        return None
+    key = teamresolver.normalize_team_name(team_name).encode('utf-8')
+    return stadium_ids[zlib.crc32(key) % len(stadium_ids)]
+
+def country_key(name):
+    #One spelling per country for tournament ("ireland-republic", "england-2") and stadium country names
+    words = [word for word in teamresolver.normalize_team_name(name).split() if not word.isdigit()]
+    key = " ".join(words)
+    return COUNTRY_ALIASES.get(key, key)
+
+def team_countries(conn):
+    """The country each team played most matches in, read with one grouped query.
+
+    Returns {team_id: (country_key, tournament)}, tournament is the name as it
+    is in Matches, for reporting the ones no stadium country matches.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT Team_ID, Match_Tournament, COUNT(*) FROM (
+            SELECT Home_Team AS Team_ID, Match_Tournament FROM Matches
+            UNION ALL
+            SELECT Away_Team AS Team_ID, Match_Tournament FROM Matches
+        ) team_matches
+        GROUP BY Team_ID, Match_Tournament
+    """)
+    counts = defaultdict(Counter)
+    tournaments = {}
+    for team_id, tournament, matches in cursor.fetchall():
+        key = country_key(tournament)
+        if not key:
             continue
-        
-        # Try substring matching
-        for stadium_team, stadium_id in stadium_team_to_id.items():
-            # Check if database team name is a substring of stadium team name
-            if len(norm_team) > 3 and norm_team in stadium_team:
-                cursor.execute("""
-                    UPDATE Teams SET Home_Stadium = %s
-                    WHERE Team_ID = %s
-                """, (stadium_id, team_id))
-                updates += 1
-                teams_matched.add(team_id)
-                break
-            
-            # Check if stadium team name is a substring of database team name
-            if len(stadium_team) > 3 and stadium_team in norm_team:
-                cursor.execute("""
-                    UPDATE Teams SET Home_Stadium = %s
-                    WHERE Team_ID = %s
-                """, (stadium_id, team_id))
-                updates += 1
-                teams_matched.add(team_id)
-                break
-    
-    # Second pass: For teams without a stadium, try stadium name matching
-    for team_id in set(db_teams_dict.keys()) - teams_matched:
+        counts[team_id][key] += matches
+        tournaments[key] = min(tournaments.get(key, str(tournament)), str(tournament))
+    cursor.close()
+    # ties go to the alphabetically first country so the result is stable
+    countries = {}
+    for team_id, c in counts.items():
+        key = min(c.items(), key=lambda item: (-item[1], item[0]))[0]
+        countries[team_id] = (key, tournaments[key])
+    return countries
+
+def fallback_stadiums(conn, db_teams_dict, unmatched, stadiums, policy):
+    """Pick Home_Stadium for every unmatched team at once.
+
+    Returns {team_id: (stadium_id, how it was picked, tournament)}, stadium_id
+    is None with the 'none' policy. tournament is set for teams the 'country'
+    policy couldn't place because no stadium country matches their tournament.
+    """
+    if policy == 'none':
+        return {team_id: (None, 'none', None) for team_id in unmatched}
+
+    all_ids = sorted(stadium_id for stadium_id, stadium_name, stadium_city in stadiums)
+    by_country = defaultdict(list)
+    if policy == 'country':
+        cursor = conn.cursor()
+        cursor.execute("SELECT Stadium_ID, Stadium_Country FROM Stadiums")
+        for stadium_id, country in sorted(cursor.fetchall()):
+            if country_key(country):
+                by_country[country_key(country)].append(stadium_id)
+        cursor.close()
+        countries = team_countries(conn)
+
+    fallbacks = {}
+    for team_id in unmatched:
         team_name = db_teams_dict[team_id]
-        
-        # Try to match team with stadium based on name
-        cursor.execute("""
-            SELECT Stadium_ID FROM Stadiums 
-            WHERE Stadium_Name LIKE %s 
-            LIMIT 1
-        """, (f"%{team_name}%",))
-        stadium = cursor.fetchone()
-        
-        if not stadium:
-            # Try to find if any stadium is in the same city as might be in the team name
-            team_parts = team_name.split()
-            for part in team_parts:
-                if len(part) > 3:  # Only try with meaningful parts
-                    cursor.execute("""
-                        SELECT Stadium_ID FROM Stadiums 
-                        WHERE Stadium_City LIKE %s OR Stadium_Name LIKE %s
-                        LIMIT 1
-                    """, (f"%{part}%", f"%{part}%"))
-                    stadium = cursor.fetchone()
-                    if stadium:
-                        break
-        
-        # If still no match, assign a random stadium
-        if not stadium:
-            cursor.execute("SELECT Stadium_ID FROM Stadiums ORDER BY RAND() LIMIT 1")
-            stadium = cursor.fetchone()
-        
-        # Update the team with the home stadium
-        if stadium:
-            cursor.execute("""
-                UPDATE Teams SET Home_Stadium = %s
-                WHERE Team_ID = %s
-            """, (stadium[0], team_id))
-            updates += 1
-    
-    # Commit changes and close connection
-    conn.commit()
-    
+        country, tournament = countries.get(team_id, (None, None)) if policy == 'country' else (None, None)
+        if by_country.get(country):
+            fallbacks[team_id] = (hashed_pick(team_name, by_country[country]), 'country', None)
+        else:
+            fallbacks[team_id] = (hashed_pick(team_name, all_ids), 'hash', tournament)
+    if policy == 'country':
+        unmapped = sorted({tournament for _, _, tournament in fallbacks.values() if tournament is not None})
+        if unmapped:
+            print(f"{len(unmapped)} tournaments match no stadium country (add them to COUNTRY_ALIASES): {', '.join(unmapped)}")
+    return fallbacks
+
+def write_fallback_report(db_teams_dict, fallbacks):
+    #CSV of the teams that got a fallback stadium, sorted so runs can be diffed
+    report = pd.DataFrame(
+        [(team_id, db_teams_dict[team_id], source, stadium_id, tournament)
+         for team_id, (stadium_id, source, tournament) in sorted(fallbacks.items())],
+        columns=['Team_ID', 'Team_Name', 'Fallback', 'Stadium_ID', 'Unmapped_Tournament']
+    )
+    report['Stadium_ID'] = report['Stadium_ID'].astype('Int64')
+    report.to_csv(FALLBACK_REPORT_PATH, index=False)
+    print(f"{len(report)} teams got a fallback stadium, see {FALLBACK_REPORT_PATH}")
+
+def assign_home_stadiums(conn, stadium_teams_map, resolved_names, policy=DEFAULT_FALLBACK):
+    """Work out every team's home stadium in memory and apply them in one UPDATE.
+
+    First pass: stadium home team names, resolved_names is
+    teamresolver.resolve_cached's result for them. Second pass,
+    for the rest: stadium names containing the team name, then stadiums whose
+    name or city shares a meaningful word with the team name. Teams still
+    unmatched get the fallback policy's stadium.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT Team_ID, Team_Name FROM Teams")
+    db_teams_dict = dict(cursor.fetchall())
+    cursor.execute("SELECT Stadium_ID, Stadium_Name, Stadium_City FROM Stadiums")
+    stadiums = cursor.fetchall()
+    cursor.close()
+
+    print(f"Loaded {len(db_teams_dict)} teams from database")
+    print("Sample team names:", list(db_teams_dict.values())[:3])
+
+    # First pass: the stadium home team names resolved against the database teams,
+    # when several stadiums resolve to the same team the best scoring one wins
+    team_to_stadium = {}
+    for stadium_id, team_names in stadium_teams_map.items():
+        for team_name in team_names:
+            team_id, score = resolved_names.get(team_name, (None, 0.0))
+            if team_id is not None and score > team_to_stadium.get(team_id, (0.0, None))[0]:
+                team_to_stadium[team_id] = (score, stadium_id)
+
+    assignments = {team_id: stadium_id for team_id, (score, stadium_id) in team_to_stadium.items()}
+    print(f"Matched {len(assignments)} teams to stadiums by home team name")
+
+    # Second pass: For teams without a stadium, try stadium name and city matching
+    name_index, any_index = build_stadium_token_index(stadiums)
+    unmatched = []
+    for team_id in sorted(set(db_teams_dict) - set(assignments)):
+        stadium_id = match_by_stadium_tokens(db_teams_dict[team_id], name_index, any_index)
+        if stadium_id is None:
+            unmatched.append(team_id)
+        else:
+            assignments[team_id] = stadium_id
+    print(f"Matched {len(db_teams_dict) - len(unmatched)} teams in total, {len(unmatched)} without a match")
+
+    # If still no match, use the deterministic fallback policy
+    fallbacks = fallback_stadiums(conn, db_teams_dict, unmatched, stadiums, policy)
+    assignments.update({team_id: fallback[0] for team_id, fallback in fallbacks.items()})
+    write_fallback_report(db_teams_dict, fallbacks)
+
+    return apply_assignments(conn, assignments)
+
+def import_stadiums(conn, stadiums_processed, home_teams_col, fallback=DEFAULT_FALLBACK):
+    loadmetrics.track_connection(conn, 'stadiums')
+    # Everything below is one transaction, so the tables are created first
+    # (CREATE TABLE commits implicitly) and nothing commits before the end
+    cursor = conn.cursor()
+    teamresolver.ensure_table(cursor)
+    validation.ensure_table(cursor)
+    cursor.close()
+
+    # Home team names resolved through the Team_Aliases cache, new aliases go in with the same commit
+    rows_home_teams = stadium_home_teams(stadiums_processed, range(len(stadiums_processed)), home_teams_col)
+    home_team_names = [team_name for team_names in rows_home_teams.values() for team_name in team_names]
+    resolved_names = teamresolver.resolve_cached(conn, home_team_names, 'stadiums', commit=False)
+
+    # 1. Insert Stadiums data, and the rows validation set aside
+    validation.save_rejects(conn, 'stadiums', commit=False)
+    print("Importing Stadiums data...")
+    with loadmetrics.stage('stadiums.insert'):
+        stadium_ids, stadiums_inserted = sync_stadiums(conn, stadiums_processed)
+    loadmetrics.add_rows('stadiums.insert', len(stadiums_processed))
+    stadium_teams_map = stadium_home_teams(stadiums_processed, stadium_ids, home_teams_col)
+
+    # 2. Update Teams with Home_Stadium based on the mapping
+    print("Assigning home stadiums to teams...")
+    with loadmetrics.stage('stadiums.assignment'):
+        updates = assign_home_stadiums(conn, stadium_teams_map, resolved_names, fallback)
+    loadmetrics.add_rows('stadiums.assignment', updates)
+
+    # Commit changes
+    with loadmetrics.stage('stadiums.commit'):
+        conn.commit()
+    loadmetrics.untrack_connection(conn)
+    queries.invalidate_cache(conn)
+
     print(f"Successfully imported {stadiums_inserted} stadium records and updated {updates} team records")
-except mysql.connector.Error as err:
-    print(f"Database error: {err}")
-except Exception as e:
-    print(f"Unexpected error: {e}")
-finally:
-    if 'conn' in locals() and conn.is_connected():
-        cursor.close()
-        conn.close()
-        print("MySQL connection closed")
\ No newline at end of file
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import stadiums and assign home stadiums to teams")
+    parser.add_argument("--fallback", choices=FALLBACK_POLICIES, default=DEFAULT_FALLBACK,
+                        help=f"Home_Stadium for teams no heuristic matches (default {DEFAULT_FALLBACK})")
+    parser.add_argument("--offline", action="store_true",
+                        help="don't download the stadiums dataset, use the cached copy in data/cache")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.offline:
+        datacache.set_offline()
+    stadiums_processed, home_teams_col = load_source()
+    if stadiums_processed is None:
+        return
+
+    # Connect to MySQL
+    try:
+        conn = dbconnection.get_connection()
+        import_stadiums(conn, stadiums_processed, home_teams_col, args.fallback)
+        loadmetrics.write_report('stadiums')
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+    finally:
+        if 'conn' in locals() and conn.is_connected():
+            conn.close()
+            print("MySQL connection closed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Synthetic source files shaped like the real datasets, for benchmarking the
+# loaders at bigger sizes and without network access:
+#   FullData.csv           like antoinekrajnc/soccer-players-statistics
+#   Football Stadiums.csv  like imtkaggleteam/football-stadiums
+#   games.parquet          like football-data's data/results/games.parquet
+# Scale 1 has the size of the real player and stadium files, every scale gets
+# MATCHES_PER_SCALE matches. Stadium home teams and match team names are
+# sometimes written differently than in FullData.csv (dropped "FC", "Utd",
+# accents, other case) and some match teams don't exist at all, like in the
+# real data, so the team name resolution does real work.
+#
+#   python synthdata.py --scale 10 --out data/synthetic/10x
+
+project_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUT_DIR = os.path.join(project_dir, 'data', 'synthetic')
+
+# Rows per scale step, the real datasets have about this many
+TEAMS_PER_SCALE = 634
+PLAYERS_PER_SCALE = 17588
+STADIUMS_PER_SCALE = 1800
+MATCHES_PER_SCALE = 100000
+
+# Share of names in the stadium/match files written as a variant, and of match
+# teams that aren't in FullData.csv at all
+VARIANT_RATE = 0.3
+UNKNOWN_TEAM_RATE = 0.05
+
+# Share of stadiums that list home teams
+STADIUMS_WITH_TEAMS = 0.6
+
+SYLLABLES = ['ar', 'ber', 'ca', 'do', 'el', 'fra', 'gi', 'ha', 'in', 'ju', 'ka', 'lo', 'ma', 'no',
+             'or', 'pa', 'qui', 'ro', 'sa', 'to', 'ul', 'va', 'wes', 'xa', 'yor', 'za', 'ton', 'burg',
+             'ville', 'mont']
+PATTERNS = ['{city} FC', 'FC {city}', 'Real {city}', 'Sporting {city}', '{city} United', 'Athletic {city}',
+            'AC {city}', '{city} City', 'Dynamo {city}', 'Saint {city}', '{city} Wanderers', 'Inter {city}']
+ACCENTED = {'a': 'á', 'e': 'é', 'o': 'ö', 'u': 'ü', 'i': 'í'}
+COUNTRIES = ['England', 'Spain', 'Germany', 'Italy', 'France', 'Netherlands', 'Portugal', 'Brazil',
+             'Argentina', 'Mexico', 'Japan', 'Turkey', 'Belgium', 'Scotland', 'Sweden', 'Norway']
+CONFEDERATIONS = ['UEFA', 'CONMEBOL', 'CONCACAF', 'AFC', 'CAF']
+POSITIONS = ['GK', 'CB', 'LB', 'RB', 'CDM', 'CM', 'CAM', 'LM', 'RM', 'LW', 'RW', 'CF', 'ST']
+FIRST_NAMES = ['Luis', 'Marco', 'Jan', 'Ali', 'Kenji', 'Pedro', 'Tom', 'Ivan', 'Samuel', 'Noah', 'Leo', 'Omar']
+LAST_NAMES = ['Silva', 'Müller', 'Rossi', 'García', 'Smith', 'Novak', 'Yilmaz', 'Jansen', 'Dubois', 'Sato']
+
+def city_names(rng, count):
+    #Unique made up city names from 2-4 syllables
+    names = set()
+    while len(names) < count:
+        parts = rng.choice(SYLLABLES, size=(count, 4))
+        lengths = rng.integers(2, 5, size=count)
+        names.update("".join(row[:length]).capitalize() for row, length in zip(parts, lengths))
+    return sorted(names)[:count]
+
+def team_names(rng, count):
+    #Unique club names, e.g. "Real Valmora", "Dokaton United"
+    cities = city_names(rng, count)
+    patterns = rng.choice(PATTERNS, size=count)
+    return [pattern.format(city=city) for pattern, city in zip(patterns, cities)]
+
+def name_variant(rng, name):
+    #The same club written the way another source might write it
+    kind = rng.integers(0, 5)
+    if kind == 0:
+        return " ".join(word for word in name.split() if word not in ('FC', 'AC')) or name
+    if kind == 1:
+        return name.replace('United', 'Utd').replace('Saint', 'St.')
+    if kind == 2:
+        return "".join(ACCENTED.get(ch, ch) if i % 4 == 1 else ch for i, ch in enumerate(name))
+    if kind == 3:
+        return name.upper()
+    return name + " FC" if not name.endswith('FC') else name[:-3]
+
+def with_variants(rng, names, rate=VARIANT_RATE):
+    names = np.asarray(names, dtype=object)
+    varied = rng.random(len(names)) < rate
+    names[varied] = [name_variant(rng, name) for name in names[varied]]
+    return names
+
+def generate_players(rng, teams, count):
+    ratings = rng.normal(66, 7, size=(count, 10)).clip(30, 99).astype(int)
+    first = rng.choice(FIRST_NAMES, size=count)
+    last = rng.choice(LAST_NAMES, size=count)
+    return pd.DataFrame({
+        'Name': [f"{a} {b}" for a, b in zip(first, last)],
+        'Nationality': rng.choice(COUNTRIES, size=count),
+        'Club': rng.choice(teams, size=count),
+        'Preffered_Position': rng.choice(POSITIONS, size=count),
+        'Rating': ratings[:, 0],
+        'Ball_Control': ratings[:, 1],
+        'Stamina': ratings[:, 2],
+        'Composure': ratings[:, 3],
+        'Short_Pass': ratings[:, 4],
+        'Shot_Power': ratings[:, 5],
+        'Agility': ratings[:, 6],
+        'Penalties': ratings[:, 7],
+        'Freekick_Accuracy': ratings[:, 8],
+        'Strength': ratings[:, 9],
+    })
+
+def generate_stadiums(rng, teams, count):
+    #Each team is listed as home team of at most one stadium, some stadiums list none
+    cities = city_names(rng, count)
+    home_teams = np.full(count, None, dtype=object)
+    with_teams = np.flatnonzero(rng.random(count) < STADIUMS_WITH_TEAMS)
+    listed = with_variants(rng, rng.permutation(teams)[:len(with_teams)])
+    home_teams[with_teams[:len(listed)]] = listed
+    return pd.DataFrame({
+        'Confederation': rng.choice(CONFEDERATIONS, size=count),
+        'Stadium': [f"{city} Arena" for city in cities],
+        'City': cities,
+        'HomeTeams': home_teams,
+        'Capacity': rng.integers(2000, 90000, size=count),
+        'Country': rng.choice(COUNTRIES, size=count),
+    })
+
+def generate_matches(rng, teams, count):
+    #Random fixtures between 1990 and 2024, a few names varied or unknown
+    unknown = [f"{name} Reserves" for name in team_names(rng, max(1, int(len(teams) * UNKNOWN_TEAM_RATE)))]
+    pool = np.concatenate([np.asarray(teams, dtype=object), np.asarray(unknown, dtype=object)])
+    home = rng.integers(0, len(pool), size=count)
+    away = (home + rng.integers(1, len(pool), size=count)) % len(pool)
+    days = rng.integers(0, 35 * 365, size=count)
+    dates = (np.datetime64('1990-01-01') + days.astype('timedelta64[D]')).astype(str)
+    return pd.DataFrame({
+        'home': with_variants(rng, pool[home]),
+        'away': with_variants(rng, pool[away]),
+        'date': dates,
+        'competition': np.char.lower(rng.choice(COUNTRIES, size=count)),
+        'gh': rng.poisson(1.5, size=count),
+        'ga': rng.poisson(1.1, size=count),
+    }).sort_values('date', kind='stable').reset_index(drop=True)
+
+def generate(out_dir=DEFAULT_OUT_DIR, scale=1, seed=0, matches=None):
+    """Write the three source files for one scale into out_dir, returns their paths.
+
+    The same scale and seed always give the same files.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    teams = team_names(rng, TEAMS_PER_SCALE * scale)
+
+    paths = {
+        'players': os.path.join(out_dir, 'FullData.csv'),
+        'stadiums': os.path.join(out_dir, 'Football Stadiums.csv'),
+        'matches': os.path.join(out_dir, 'games.parquet'),
+    }
+    generate_players(rng, teams, PLAYERS_PER_SCALE * scale).to_csv(paths['players'], index=False)
+    generate_stadiums(rng, teams, STADIUMS_PER_SCALE * scale).to_csv(paths['stadiums'], index=False)
+    match_count = MATCHES_PER_SCALE * scale if matches is None else matches
+    generate_matches(rng, teams, match_count).to_parquet(paths['matches'], index=False)
+
+    print(f"Wrote {len(teams)} teams, {PLAYERS_PER_SCALE * scale} players, {STADIUMS_PER_SCALE * scale} stadiums "
+          f"and {match_count} matches to {out_dir}")
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic players, stadiums and matches source files")
+    parser.add_argument("--scale", type=int, default=1, help="size relative to the real datasets (default 1)")
+    parser.add_argument("--matches", type=int, help=f"number of matches (default {MATCHES_PER_SCALE} per scale)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="output directory (default data/synthetic/<scale>x)")
+    args = parser.parse_args()
+    generate(args.out or os.path.join(DEFAULT_OUT_DIR, f"{args.scale}x"), args.scale, args.seed, args.matches)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import re
+import unicodedata
+from collections import defaultdict
+import dbconnection
+
+# Shared team name matching for matchesloader and stadiumloader.
+# Names are normalized the same way everywhere, the database teams are put in a
+# character trigram inverted index, and a source name is only scored against the
+# teams it shares trigrams with instead of against every team. A team only
+# matches when both names have the same words (up to spelling and dotted
+# abbreviations like "Bor."), so reserve, women's and other clubs sharing most
+# of a name ("Real Madrid B", "Chelsea Women", "Inter Baku") stay unresolved.
+# Every decision is stored in the Team_Aliases table, so later runs only need a
+# dictionary lookup and only names never seen before go through the index.
+
+# Minimum similarity (Dice coefficient over trigrams) to accept a fuzzy match
+DEFAULT_THRESHOLD = 0.6
+
+# Two words count as the same when their trigram similarity reaches this ("villareal", "villarreal")
+WORD_THRESHOLD = 0.75
+
+# The best candidate has to beat the runner up by this much, otherwise
+# "manchester city" vs "manchester united" style ties are left unresolved
+AMBIGUITY_MARGIN = 0.05
+
+# Words that don't tell clubs apart, dropped before comparing
+STOP_WORDS = {
+    'fc', 'cf', 'afc', 'sc', 'ac', 'as', 'ss', 'us', 'fk', 'sk', 'cd', 'cs', 'sv', 'vfb', 'vfl',
+    'club', 'calcio', 'the', 'de', 'of', 'and'
+}
+
+# Common short forms in the source datasets
+ABBREVIATIONS = {
+    'utd': 'united',
+    'st': 'saint',
+    'ath': 'athletic',
+    'atl': 'atletico',
+}
+
+def name_tokens(name):
+    """Normalized words of a name as (word, abbreviated) pairs.
+
+    Lowercase, accents and punctuation stripped, known short forms expanded
+    and filler words dropped. abbreviated marks words written with a dot in
+    the name, like "Bor." in "Bor. Dortmund".
+    """
+    if name is None or name != name:  # None or NaN
+        return []
+
+    try:
+        name = unicodedata.normalize('NFKD', str(name))
+        name = "".join(ch for ch in name if not unicodedata.combining(ch))
+        name = name.lower().replace('&', ' and ')
+        abbreviated = set(re.findall(r'(\w+)\.', name))
+        name = re.sub(r'[^\w\s]', ' ', name)
+        words = [(ABBREVIATIONS.get(word, word), word in abbreviated and word not in ABBREVIATIONS)
+                 for word in name.split()]
+        kept = [(word, short) for word, short in words if word not in STOP_WORDS]
+        # a name made only of filler words ("AC", "FC") keeps them
+        return kept or words
+    except Exception as e:
+        print(f"Error normalizing team name '{name}': {e}")
+        return []
+
+def normalize_team_name(name):
+    #Lowercase, strip accents and punctuation, expand abbreviations and drop filler words
+    return " ".join(word for word, _ in name_tokens(name))
+
+def trigrams(normalized_name):
+    #Character trigrams of a normalized name, padded so word starts count too
+    padded = f"  {normalized_name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def words_match(word, other, other_short):
+    #Same word, a spelling variant of it, or other is a dotted abbreviation of it
+    if word == other or (other_short and word.startswith(other)):
+        return True
+    grams, other_grams = trigrams(word), trigrams(other)
+    return 2.0 * len(grams & other_grams) / (len(grams) + len(other_grams)) >= WORD_THRESHOLD
+
+def tokens_covered(tokens, other_tokens):
+    #Whether every word of tokens has a matching word in other_tokens
+    return all(
+        any(words_match(word, other, other_short) or words_match(other, word, short)
+            for other, other_short in other_tokens)
+        for word, short in tokens
+    )
+
+def same_words(tokens, team_tokens):
+    """Whether a source name and a team name have the same words, up to spelling and abbreviations.
+
+    A word only one side has tells clubs apart ("Real Madrid B", "Chelsea
+    Women", "Inter Turku", "Manchester" vs "Manchester City"), so the trigram
+    score alone can't accept those.
+    """
+    return tokens_covered(tokens, team_tokens) and tokens_covered(team_tokens, tokens)
+
+def build_index(team_mapping):
+    """Build the lookup index from a {team name: team id} mapping.
+
+    The index is a plain dict: exact normalized names, and for fuzzy lookups
+    the distinct normalized names with their ids, words, trigram counts and
+    a trigram -> positions inverted index.
+    """
+    exact = {}
+    words = {}
+    for team_name, team_id in team_mapping.items():
+        tokens = name_tokens(team_name)
+        normalized = " ".join(word for word, _ in tokens)
+        if normalized and normalized not in exact:
+            exact[normalized] = team_id
+            words[normalized] = tokens
+
+    names = list(exact.keys())
+    ids = [exact[name] for name in names]
+    tokens = [words[name] for name in names]
+    sizes = []
+    postings = defaultdict(list)
+    for position, name in enumerate(names):
+        grams = trigrams(name)
+        sizes.append(len(grams))
+        for gram in grams:
+            postings[gram].append(position)
+
+    return {
+        'exact': exact,
+        'names': names,
+        'ids': ids,
+        'tokens': tokens,
+        'sizes': sizes,
+        'postings': dict(postings),
+    }
+
+def resolve(team_name, index, threshold=DEFAULT_THRESHOLD):
+    """Return (team_id, score) for the best match, or (None, best score).
+
+    Only teams with the same words as the name (see same_words) can match.
+    """
+    tokens = name_tokens(team_name)
+    normalized = " ".join(word for word, _ in tokens)
+    if not normalized:
+        return None, 0.0
+
+    if normalized in index['exact']:
+        return index['exact'][normalized], 1.0
+
+    # Candidate blocking: count shared trigrams only for teams in the same posting lists
+    grams = trigrams(normalized)
+    shared = defaultdict(int)
+    for gram in grams:
+        for position in index['postings'].get(gram, ()):
+            shared[position] += 1
+
+    best_position, best_score, runner_up = None, 0.0, 0.0
+    for position, count in shared.items():
+        score = 2.0 * count / (len(grams) + index['sizes'][position])
+        if score <= runner_up or not same_words(tokens, index['tokens'][position]):
+            continue
+        if score > best_score:
+            best_position, runner_up, best_score = position, best_score, score
+        elif score > runner_up:
+            runner_up = score
+
+    if best_position is None or best_score < threshold or best_score - runner_up < AMBIGUITY_MARGIN:
+        return None, best_score
+    return index['ids'][best_position], best_score
+
+def resolve_names(names, index, threshold=DEFAULT_THRESHOLD):
+    #Resolve each distinct name once, returns {name: (team_id, score)}
+    return {name: resolve(name, index, threshold) for name in set(names)}
+
+# Alias_Name is binary so names that only differ by accents or case get their own row,
+# unresolved names are stored with a NULL Team_ID so they aren't retried every run
+ALIAS_TABLE_QUERY = """
+    CREATE TABLE IF NOT EXISTS Team_Aliases (
+        Alias_Name VARCHAR(255) COLLATE utf8mb4_bin PRIMARY KEY,
+        Team_ID INT NULL,
+        Score FLOAT,
+        Source VARCHAR(64),
+        Is_Manual BOOLEAN NOT NULL DEFAULT FALSE,
+        FOREIGN KEY (Team_ID) REFERENCES Teams(Team_ID)
+    )
+"""
+
+# CREATE TABLE commits implicitly, so only the first time per process (like loadstate)
+_table_ready = False
+
+def ensure_table(cursor):
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(ALIAS_TABLE_QUERY)
+        _table_ready = True
+
+def get_team_mapping(conn):
+    """Create a mapping of team names to team IDs from the database"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT Team_ID, Team_Name FROM Teams")
+    team_mapping = {team_name: team_id for team_id, team_name in cursor.fetchall()}
+    cursor.close()
+    return team_mapping
+
+def load_aliases(conn):
+    #Load every stored alias in one query, returns {alias name: (team_id, score)}
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.execute("SELECT Alias_Name, Team_ID, Score FROM Team_Aliases")
+    # manual overrides don't need a score, they count as certain
+    aliases = {name: (team_id, 1.0 if score is None else score) for name, team_id, score in cursor.fetchall()}
+    cursor.close()
+    return aliases
+
+def save_aliases(conn, resolved, source, commit=True):
+    #Store newly resolved names, an existing row (like a manual override) is never replaced, commit=False leaves the commit to the caller
+    if not resolved:
+        return
+    cursor = dbconnection.prepared_cursor(conn)
+    dbconnection.insert_rows(
+        cursor, 'Team_Aliases', ['Alias_Name', 'Team_ID', 'Score', 'Source'],
+        [(name, team_id, float(score), source) for name, (team_id, score) in resolved.items()],
+        "ON DUPLICATE KEY UPDATE Alias_Name = Alias_Name"
+    )
+    cursor.close()
+    if commit:
+        conn.commit()
+
+def forget_aliases(conn, unresolved_only=False):
+    #Drop automatic aliases so they get resolved again, manual ones are kept
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    if unresolved_only:
+        cursor.execute("DELETE FROM Team_Aliases WHERE Is_Manual = FALSE AND Team_ID IS NULL")
+    else:
+        cursor.execute("DELETE FROM Team_Aliases WHERE Is_Manual = FALSE")
+    removed = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return removed
+
+def resolve_cached(conn, names, source, threshold=DEFAULT_THRESHOLD, aliases=None, commit=True):
+    """Resolve names through the Team_Aliases cache.
+
+    Known names are plain dictionary lookups. Only names not in the cache are
+    resolved against Teams (the index is built only when there are any) and
+    then stored with their score and source dataset. Callers resolving in
+    several rounds can pass the dict from load_aliases, it is extended in
+    place instead of being reloaded. With commit=False the new aliases are
+    part of the caller's transaction, which then has to create Team_Aliases
+    (ensure_table) before its first write. Returns {name: (team_id, score)}
+    for every distinct name.
+    """
+    if aliases is None:
+        aliases = load_aliases(conn)
+    names = {name for name in names if name is not None and name == name and name != ""}
+    new_names = [name for name in names if name not in aliases]
+
+    if new_names:
+        index = build_index(get_team_mapping(conn))
+        resolved = resolve_names(new_names, index, threshold)
+        save_aliases(conn, resolved, source, commit)
+        aliases.update(resolved)
+
+    print(f"Team names: {len(names) - len(new_names)} from alias cache, {len(new_names)} newly resolved")
+    return {name: aliases[name] for name in names}
@@ -0,0 +1,86 @@
+import loadjournal
+import matchesloader
+
+def fold(conn, last_id, folded):
+    #What the watermark folds do: take every match in (last_id, committed_until], return the new watermark
+    until = loadjournal.committed_until(conn)
+    if until > last_id:
+        new = {match_id for match_id in conn.db.match_ids if last_id < match_id <= until}
+        assert not new & folded, "match folded twice"
+        folded |= new
+        return until
+    return last_id
+
+def test_safe_match_id():
+    assert loadjournal.safe_match_id(500, []) == 500
+    assert loadjournal.safe_match_id(500, [101, 301]) == 100
+    assert loadjournal.safe_match_id(50, [101]) == 50
+
+def test_reserve_journals_the_range_in_the_same_commit(fake_db):
+    conn = fake_db.connect()
+    journal = loadjournal.start(conn, 'matches', 'abc')
+    fake_db.match_ids.update(range(1, 11))
+
+    first_id = matchesloader.reserve_match_ids(conn, 5, journal)
+    assert first_id == 11
+    assert fake_db.state[matchesloader.NEXT_MATCH_ID_STATE] == '16'
+    assert fake_db.journal[journal['Load_ID']]['Next_Match_ID'] == 11
+    assert fake_db.journal[journal['Load_ID']]['Range_End'] == 16
+    assert loadjournal.MATCH_ID_LOCK not in fake_db.locks
+
+    # the next range starts after the reserved one even though none of it is inserted
+    assert matchesloader.reserve_match_ids(conn, 3) == 16
+
+def test_ranges_committed_out_of_order_are_folded_once(fake_db):
+    first, second, folder = fake_db.connect(), fake_db.connect(), fake_db.connect()
+    journal_a = loadjournal.start(first, 'matches', 'a')
+    # the first import is alive, so the second one doesn't abandon its entry
+    journal_b = loadjournal.start(second, 'matches', 'b')
+    assert fake_db.journal[journal_a['Load_ID']]['Status'] == 'running'
+
+    a = matchesloader.reserve_match_ids(first, 100, journal_a)
+    b = matchesloader.reserve_match_ids(second, 100, journal_b)
+    assert (a, b) == (1, 101)
+
+    # the higher range commits first
+    second.insert_matches(range(b, b + 100))
+    loadjournal.advance(second, journal_b, 100, b + 100)
+    second.commit()
+
+    folded = set()
+    watermark = fold(folder, 0, folded)
+    assert watermark == 0 and not folded
+
+    first.insert_matches(range(a, a + 100))
+    loadjournal.advance(first, journal_a, 100, a + 100)
+    first.commit()
+
+    watermark = fold(folder, watermark, folded)
+    assert watermark == 200
+    assert folded == set(range(1, 201))
+
+def test_uncommitted_shards_are_not_folded(fake_db):
+    conn, worker, folder = fake_db.connect(), fake_db.connect(), fake_db.connect()
+    journal = loadjournal.start(conn, 'matches', 'a')
+    first_id = matchesloader.reserve_match_ids(conn, 300, journal)
+    # a later shard commits on its own connection while the first one is still running
+    worker.insert_matches(range(first_id + 200, first_id + 300))
+    worker.commit()
+
+    folded = set()
+    assert fold(folder, 0, folded) == 0
+    assert not folded
+
+def test_only_dead_imports_are_abandoned_or_resumed(fake_db):
+    alive, dead, new = fake_db.connect(), fake_db.connect(), fake_db.connect()
+    running = loadjournal.start(alive, 'matches', 'a')
+    crashed = loadjournal.start(dead, 'matches', 'b')
+    dead.close()
+
+    assert loadjournal.unfinished(new, 'matches')['Load_ID'] == crashed['Load_ID']
+    loadjournal.start(new, 'matches', 'c')
+    assert fake_db.journal[crashed['Load_ID']]['Status'] == 'abandoned'
+    assert fake_db.journal[running['Load_ID']]['Status'] == 'running'
+
+    loadjournal.finish(alive, running)
+    assert loadjournal.entry_lock(running['Load_ID']) not in fake_db.locks
@@ -0,0 +1,100 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+import loadjournal
+import matchesloader
+import validation
+
+def resolved_frame(first_id, count, first_row=0):
+    #Resolved matches as import_matches hands them to the insert functions
+    return pd.DataFrame({
+        'Match_ID': range(first_id, first_id + count),
+        'Match_Date': ['2020-01-01'] * count,
+        'Match_Tournament': ['league'] * count,
+        'Home_Goals': [1] * count,
+        'Away_Goals': [0] * count,
+        'Home_Team': [1] * count,
+        'Away_Team': [2] * count,
+        'Source_Row': range(first_row, first_row + count),
+    })
+
+@pytest.fixture
+def shards(monkeypatch):
+    #insert_shard replaced by one that commits shards later the earlier they start, failing the ones in fail
+    fail = set()
+    committed = []
+
+    def insert_shard(rows, attempt=0):
+        time.sleep(0.05 if rows[0][0] == 1 else 0.01)
+        if rows[0][0] in fail:
+            raise RuntimeError("lost connection")
+        committed.append(rows[0][0])
+        return len(rows)
+
+    monkeypatch.setattr(matchesloader, 'insert_shard', insert_shard)
+    monkeypatch.setattr(matchesloader, 'SHARD_RETRIES', 0)
+    return fail, committed
+
+def test_journal_follows_committed_shards(fake_db, shards):
+    _, committed = shards
+    conn = fake_db.connect()
+    journal = loadjournal.start(conn, 'matches', 'a')
+    loadjournal.reserve(conn, journal, 1, 31)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        inserted, skipped = matchesloader.parallel_insert_matches(pool, resolved_frame(1, 30, 100), 10, conn, journal)
+
+    assert (inserted, skipped) == (30, 0)
+    # the first shard committed last, the journal only moved once it had
+    assert committed[-1] == 1
+    assert fake_db.journal[journal['Load_ID']]['Next_Match_ID'] == 31
+    assert fake_db.journal[journal['Load_ID']]['Rows_Done'] == 130
+
+def test_journal_stops_before_a_failed_shard(fake_db, shards):
+    fail, _ = shards
+    fail.add(11)
+    conn = fake_db.connect()
+    journal = loadjournal.start(conn, 'matches', 'a')
+    loadjournal.reserve(conn, journal, 1, 31)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        inserted, skipped = matchesloader.parallel_insert_matches(pool, resolved_frame(1, 30), 10, conn, journal)
+
+    assert (inserted, skipped) == (20, 10)
+    # shard 21-30 committed, but the journal stays before the failed one
+    assert fake_db.journal[journal['Load_ID']]['Next_Match_ID'] == 11
+    assert fake_db.journal[journal['Load_ID']]['Rows_Done'] == 10
+    assert loadjournal.in_flight(journal)
+
+def test_rejects_commit_with_the_batch_past_them(fake_db, monkeypatch):
+    monkeypatch.setattr(validation, '_pending', {})
+    raw = pd.DataFrame({'home': ['a'] * 30, 'away': ['b'] * 30, 'gh': [1] * 30, 'ga': [0] * 30})
+    raw.loc[[5, 25], 'gh'] = 500
+    _, rejected = validation.validate(raw, validation.MATCHES_SCHEMA, 'matches')
+    assert rejected == 2
+    fake_db.fail_match_ids.add(11)
+    conn = fake_db.connect()
+    journal = loadjournal.start(conn, 'matches', 'a')
+    loadjournal.reserve(conn, journal, 1, 31)
+
+    inserted, skipped = matchesloader.insert_matches(conn, resolved_frame(1, 30), 10, journal)
+
+    assert (inserted, skipped) == (10, 20)
+    # row 5 is behind the journal and saved, row 25 is left for --resume to find again
+    assert fake_db.rejects == [5]
+    assert fake_db.journal[journal['Load_ID']]['Rows_Done'] == 10
+    assert validation.pending_count('matches') == 1
+
+def test_after_watermark_keeps_new_matches_on_the_boundary_date():
+    resolved = resolved_frame(1, 4).drop(columns='Match_ID')
+    resolved['Match_Date'] = ['2020-01-01', '2020-01-02', '2020-01-02', '2020-01-03']
+    resolved['Home_Team'] = [1, 1, 3, 1]
+    # the boundary match as it reads back from Matches, Match_Date a DATE
+    loaded = resolved.iloc[[1]][matchesloader.NATURAL_KEY_COLUMNS].copy()
+    loaded['Match_Date'] = [datetime.date(2020, 1, 2)]
+    watermark = {'date': '2020-01-02', 'keys': set(matchesloader.natural_keys(loaded).tolist())}
+
+    new, already_loaded = matchesloader.after_watermark(resolved, watermark)
+
+    assert already_loaded == 2
+    assert new['Source_Row'].tolist() == [2, 3]
@@ -0,0 +1,60 @@
+import snapshot
+
+# SHOW CREATE TABLE output as MySQL 8 prints it
+USER_FEED = """CREATE TABLE `User_Feed` (
+  `User_ID` int NOT NULL,
+  `Item_ID` bigint NOT NULL AUTO_INCREMENT,
+  `Item_Type` varchar(16) DEFAULT NULL,
+  `Item_Date` date DEFAULT NULL,
+  PRIMARY KEY (`User_ID`,`Item_ID`),
+  KEY `User_Feed_Item` (`Item_ID`),
+  KEY `User_Feed_Date` (`Item_Date`,`Item_ID`),
+  CONSTRAINT `user_feed_ibfk_1` FOREIGN KEY (`User_ID`) REFERENCES `users` (`User_ID`)
+) ENGINE=InnoDB AUTO_INCREMENT=12 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"""
+
+MATCHES = """CREATE TABLE `matches` (
+  `Match_ID` int NOT NULL,
+  `Match_Date` date DEFAULT NULL,
+  `Home_Team` int DEFAULT NULL,
+  `Away_Team` int DEFAULT NULL,
+  PRIMARY KEY (`Match_ID`),
+  UNIQUE KEY `Matches_Natural` (`Match_Date`,`Home_Team`,`Away_Team`),
+  KEY `Matches_Home_Date` (`Home_Team`,`Match_Date`),
+  CONSTRAINT `matches_ibfk_1` FOREIGN KEY (`Home_Team`) REFERENCES `teams` (`Team_ID`),
+  CONSTRAINT `matches_ibfk_2` FOREIGN KEY (`Away_Team`) REFERENCES `teams` (`Team_ID`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"""
+
+def test_split_defers_secondary_and_foreign_keys():
+    bare, keys, foreign_keys = snapshot.split_create_statement(MATCHES)
+    assert keys == [
+        "UNIQUE KEY `Matches_Natural` (`Match_Date`,`Home_Team`,`Away_Team`)",
+        "KEY `Matches_Home_Date` (`Home_Team`,`Match_Date`)",
+    ]
+    assert foreign_keys == [
+        "CONSTRAINT `matches_ibfk_1` FOREIGN KEY (`Home_Team`) REFERENCES `teams` (`Team_ID`)",
+        "CONSTRAINT `matches_ibfk_2` FOREIGN KEY (`Away_Team`) REFERENCES `teams` (`Team_ID`)",
+    ]
+    assert bare.splitlines()[0] == "CREATE TABLE `matches` ("
+    assert "PRIMARY KEY (`Match_ID`)" in bare
+    assert "KEY `Matches" not in bare and "CONSTRAINT" not in bare
+    assert bare.splitlines()[-1].startswith(") ENGINE=InnoDB")
+    # no dangling comma before the closing line
+    assert not bare.splitlines()[-2].endswith(",")
+
+def test_split_keeps_key_of_auto_increment_column():
+    bare, keys, foreign_keys = snapshot.split_create_statement(USER_FEED)
+    # MySQL refuses the table without a key starting with Item_ID (error 1075)
+    assert "KEY `User_Feed_Item` (`Item_ID`)" in bare
+    assert keys == ["KEY `User_Feed_Date` (`Item_Date`,`Item_ID`)"]
+    assert len(foreign_keys) == 1
+
+def test_staging_create_renames_only_the_table():
+    entry = {'table': 'matches'}
+    bare, _, _ = snapshot.split_create_statement(MATCHES)
+    staged = snapshot.staging_create(entry, bare)
+    assert staged.splitlines()[0] == "CREATE TABLE `matches__restore` ("
+    assert staged.splitlines()[1:] == bare.splitlines()[1:]
+
+def test_tsv_value_escaping():
+    assert snapshot.tsv_value(None) == '\\N'
+    assert snapshot.tsv_value('a\tb\nc\\d') == 'a\\tb\\nc\\\\d'
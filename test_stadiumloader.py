@@ -0,0 +1,50 @@
+import pytest
+import stadiumloader
+
+@pytest.mark.parametrize('tournament, stadium_country', [
+    ('england', 'England'),
+    ('england-2', 'England'),
+    ('ireland-republic', 'Republic of Ireland'),
+    ('bosnia-herzegovina', 'Bosnia and Herzegovina'),
+    ('usa', 'United States'),
+    ('korea-republic', 'South Korea'),
+    ('ivory-coast', "C\u00f4te d'Ivoire"),
+])
+def test_tournament_matches_stadium_country(tournament, stadium_country):
+    assert stadiumloader.country_key(tournament) == stadiumloader.country_key(stadium_country)
+
+class FakeCursor:
+    #The two queries the country fallback reads
+    def __init__(self, rows):
+        self.rows, self.result = rows, []
+
+    def execute(self, query, params=()):
+        self.result = self.rows['Stadium_Country' if 'Stadium_Country' in query else 'Match_Tournament']
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+def test_country_fallback_reports_unmapped_tournaments():
+    conn = FakeConnection({
+        'Stadium_Country': [(1, 'Republic of Ireland'), (2, 'England'), (3, None)],
+        'Match_Tournament': [(10, 'ireland-republic', 30), (11, 'atlantis', 30), (12, None, 5)],
+    })
+    teams = {10: 'Shamrock Rovers', 11: 'Atlantis FC', 12: 'Nowhere United'}
+    stadiums = [(1, 'Tallaght Stadium', 'Dublin'), (2, 'Wembley', 'London'), (3, 'Unknown', None)]
+
+    fallbacks = stadiumloader.fallback_stadiums(conn, teams, [10, 11, 12], stadiums, 'country')
+
+    assert fallbacks[10] == (1, 'country', None)
+    assert fallbacks[11][1:] == ('hash', 'atlantis')
+    # no tournament at all is not an unmapped one, and doesn't pick the stadiums without a country
+    assert fallbacks[12][1:] == ('hash', None)
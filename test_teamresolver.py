@@ -0,0 +1,89 @@
+import pytest
+import teamresolver
+
+# Some of the real Teams rows, with their Team_IDs
+TEAMS = {
+    'Real Madrid': 1,
+    'FC Barcelona': 2,
+    'Manchester Utd': 4,
+    'Chelsea': 5,
+    'Arsenal': 6,
+    'Manchester City': 9,
+    'Atlético Madrid': 10,
+    'Bor. Dortmund': 11,
+    'Inter': 13,
+    'Olym. Lyonnais': 17,
+    'AS Saint-Étienne': 21,
+    'Villarreal CF': 25,
+    'Eint. Frankfurt': 69,
+    'Independiente': 152,
+    'Ind. Santa Fe': 193,
+}
+
+@pytest.fixture(scope='module')
+def index():
+    return teamresolver.build_index(TEAMS)
+
+@pytest.mark.parametrize('name, normalized', [
+    ('FC Barcelona', 'barcelona'),
+    ('Atlético Madrid', 'atletico madrid'),
+    ('Manchester Utd', 'manchester united'),
+    ('AS Saint-Étienne', 'saint etienne'),
+    ('Brighton & Hove Albion', 'brighton hove albion'),
+    ('AC', 'ac'),
+    (None, ''),
+    (float('nan'), ''),
+])
+def test_normalize_team_name(name, normalized):
+    assert teamresolver.normalize_team_name(name) == normalized
+
+def test_name_tokens_marks_dotted_abbreviations():
+    assert teamresolver.name_tokens('Bor. Dortmund') == [('bor', True), ('dortmund', False)]
+    # "St." is expanded, so it's a full word afterwards
+    assert teamresolver.name_tokens('FC St. Pauli') == [('saint', False), ('pauli', False)]
+
+@pytest.mark.parametrize('name, team_id', [
+    ('Barcelona', 2),
+    ('Manchester United', 4),
+    ('Atletico Madrid', 10),
+    ('Saint Etienne', 21),
+    ('Borussia Dortmund', 11),
+    ('Olympique Lyonnais', 17),
+    ('Eintracht Frankfurt', 69),
+    ('Villareal', 25),
+    ('Independiente Santa Fe', 193),
+])
+def test_resolves(index, name, team_id):
+    assert teamresolver.resolve(name, index)[0] == team_id
+
+@pytest.mark.parametrize('name', [
+    'Barcelona B',
+    'Real Madrid B',
+    'Real Madrid Castilla',
+    'Real Madrid U19',
+    'Borussia Dortmund II',
+    'Inter Turku',
+    'Inter Baku',
+    'Arsenal Kyiv',
+    'Chelsea Women',
+    'Manchester',
+])
+def test_distinguishing_words_are_not_matched(index, name):
+    assert teamresolver.resolve(name, index)[0] is None
+
+def test_below_threshold(index):
+    team_id, score = teamresolver.resolve('Villareal', index, threshold=0.9)
+    assert team_id is None
+    assert score < 0.9
+
+def test_ambiguous_names_stay_unresolved():
+    index = teamresolver.build_index({'Sporting Lisboa': 1, 'Sporting Lisbon': 2})
+    team_id, score = teamresolver.resolve('Sporting Lisbo', index)
+    assert team_id is None
+    assert score >= teamresolver.DEFAULT_THRESHOLD
+
+def test_resolve_names(index):
+    resolved = teamresolver.resolve_names(['Chelsea', 'Chelsea', 'Chelsea Women', None], index)
+    assert resolved['Chelsea'] == (5, 1.0)
+    assert resolved['Chelsea Women'][0] is None
+    assert resolved[None] == (None, 0.0)
@@ -0,0 +1,42 @@
+import json
+import pandas as pd
+import pytest
+import validation
+
+@pytest.fixture(autouse=True)
+def pending(monkeypatch):
+    monkeypatch.setattr(validation, '_pending', {})
+
+def matches(**columns):
+    #A games.parquet style frame, every column given overrides the valid default
+    frame = pd.DataFrame({'home': ['A', 'C'], 'away': ['B', 'D'], 'date': ['2020-01-02', '2020-01-03'],
+                          'competition': ['england', 'spain'], 'gh': [2, 1], 'ga': [0, 3]})
+    for column, values in columns.items():
+        frame[column] = values
+    return frame
+
+def test_valid_rows_are_coerced_and_defaulted():
+    valid, rejected = validation.validate(matches(competition=['england', None], gh=['2', None]),
+                                          validation.MATCHES_SCHEMA, 'matches')
+
+    assert rejected == 0
+    assert valid['gh'].tolist() == [2, 0]
+    assert valid['competition'].tolist() == ['england', '']
+    assert validation.pending_count('matches') == 0
+
+@pytest.mark.parametrize('column, values, reason', [
+    ('home', [None, 'C'], 'missing_home'),
+    ('date', ['2016-02-30', '2020-01-03'], 'bad_date'),
+    ('gh', [500, 1], 'out_of_range_gh'),
+])
+def test_failing_rows_are_set_aside(column, values, reason):
+    valid, rejected = validation.validate(matches(**{column: values}), validation.MATCHES_SCHEMA, 'matches', 100)
+
+    assert rejected == 1
+    # the original index is kept, it is the row number in the file
+    assert valid.index.tolist() == [1]
+    rejects = validation._pending['matches'][0]
+    assert rejects['Source_Row'].tolist() == [100]
+    assert rejects['Reason'].tolist() == [reason]
+    # the raw row as it was in the file
+    assert json.loads(rejects['Raw_Row'][0])[column] == values[0]
@@ -0,0 +1,286 @@
+import argparse
+import datetime
+import sys
+import time
+import pandas as pd
+import dbconnection
+import loadstate
+import loadjournal
+import aggregates
+import queries
+import loadmetrics
+
+# Precomputed "what's new for me" feed. When the loaders commit, new matches are
+# fanned out to the users who have one of the teams in Favorite_Teams and
+# player rating changes to the users who have the player in Favorite_Players.
+# Every user keeps at most FEED_LENGTH items in User_Feed, newest first by
+# Item_ID, so reading a feed is one range read on the primary key however many
+# favorites the user has:
+#
+#   queries.user_feed(user_id, limit=20)
+#
+# Users only get items from after they picked a favorite, refill_user() fills
+# a feed from the latest matches of the user's teams (e.g. right after sign up).
+
+LAST_MATCH_STATE = "feed.last_match_id"
+
+# Items kept per user
+FEED_LENGTH = 100
+
+# Users per query when trimming feeds and looking up favorites
+USERS_PER_QUERY = 1000
+
+USER_FEED_QUERY = """
+    CREATE TABLE IF NOT EXISTS User_Feed (
+        User_ID INT,
+        Item_ID BIGINT AUTO_INCREMENT,
+        Item_Type VARCHAR(16),
+        Item_Date DATE,
+        Match_ID INT NULL,
+        Team_ID INT NULL,
+        Player_ID INT NULL,
+        Summary VARCHAR(255),
+        PRIMARY KEY (User_ID, Item_ID),
+        INDEX User_Feed_Item (Item_ID),
+        FOREIGN KEY (User_ID) REFERENCES Users(User_ID)
+    )
+"""
+
+FEED_COLUMNS = ['User_ID', 'Item_Type', 'Item_Date', 'Match_ID', 'Team_ID', 'Player_ID', 'Summary']
+
+# CREATE TABLE commits implicitly, so only the first time per process (like loadstate)
+_table_ready = False
+
+def ensure_table(cursor):
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(USER_FEED_QUERY)
+        _table_ready = True
+
+def chunks(values, size=USERS_PER_QUERY):
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def favorites(conn, table, column, ids):
+    #(User_ID, id) pairs of the users who have one of ids as a favorite
+    cursor = conn.cursor()
+    pairs = []
+    for chunk in chunks(ids):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT User_ID, {column} FROM {table} WHERE {column} IN ({placeholders})", chunk)
+        pairs.extend(cursor.fetchall())
+    cursor.close()
+    return pd.DataFrame(pairs, columns=['User_ID', column])
+
+def team_names(conn, team_ids):
+    cursor = conn.cursor()
+    names = {}
+    for chunk in chunks(team_ids):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT Team_ID, Team_Name FROM Teams WHERE Team_ID IN ({placeholders})", chunk)
+        names.update(cursor.fetchall())
+    cursor.close()
+    return names
+
+def match_items(conn, matches, followers=None):
+    """Feed items for the users following either team of the matches, at most FEED_LENGTH per user.
+
+    followers are (User_ID, Team_ID) pairs, by default everyone in
+    Favorite_Teams following one of the teams. A user following both teams
+    of a match gets it once.
+    """
+    if followers is None:
+        teams = set(matches['Home_Team'].tolist()) | set(matches['Away_Team'].tolist())
+        followers = favorites(conn, 'Favorite_Teams', 'Team_ID', teams)
+    if followers.empty:
+        return pd.DataFrame(columns=FEED_COLUMNS)
+
+    sides = pd.concat([
+        matches.rename(columns={'Home_Team': 'Team_ID'}).assign(Home_Team=matches['Home_Team']),
+        matches.rename(columns={'Away_Team': 'Team_ID'}).assign(Away_Team=matches['Away_Team']),
+    ], ignore_index=True)
+    items = sides.merge(followers, on='Team_ID').drop_duplicates(['User_ID', 'Match_ID'])
+    # newest matches of every user, oldest of those first so the newest gets the highest Item_ID
+    items = items.sort_values(['Match_Date', 'Match_ID'], ascending=False, na_position='last', kind='stable')
+    items = items.groupby('User_ID', sort=False).head(FEED_LENGTH).iloc[::-1]
+
+    names = team_names(conn, set(items['Home_Team'].tolist()) | set(items['Away_Team'].tolist()))
+    summaries = [
+        f"{names.get(home, home)} {home_goals}-{away_goals} {names.get(away, away)} ({tournament}, {date})"
+        for home, away, home_goals, away_goals, tournament, date in zip(
+            items['Home_Team'], items['Away_Team'], items['Home_Goals'], items['Away_Goals'],
+            items['Match_Tournament'], items['Match_Date'])
+    ]
+    return pd.DataFrame({
+        'User_ID': items['User_ID'], 'Item_Type': 'match', 'Item_Date': items['Match_Date'],
+        'Match_ID': items['Match_ID'], 'Team_ID': items['Team_ID'], 'Player_ID': None,
+        'Summary': [summary[:255] for summary in summaries],
+    })
+
+def rating_items(conn, changes):
+    #Feed items for the followers of players whose Overall_Rating changed, changes is [(Player_ID, name, Team_ID, old, new)]
+    changes = pd.DataFrame(changes, columns=['Player_ID', 'Player_Name', 'Team_ID', 'Old_Rating', 'New_Rating'])
+    changes['Team_ID'] = changes['Team_ID'].astype('Int64')
+    followers = favorites(conn, 'Favorite_Players', 'Player_ID', set(changes['Player_ID'].tolist()))
+    if followers.empty:
+        return pd.DataFrame(columns=FEED_COLUMNS)
+    items = changes.merge(followers, on='Player_ID')
+    return pd.DataFrame({
+        'User_ID': items['User_ID'], 'Item_Type': 'rating', 'Item_Date': datetime.date.today(),
+        'Match_ID': None, 'Team_ID': items['Team_ID'], 'Player_ID': items['Player_ID'],
+        'Summary': [f"{name}: overall rating {old} -> {new}"[:255]
+                    for name, old, new in zip(items['Player_Name'], items['Old_Rating'], items['New_Rating'])],
+    })
+
+def trim_feeds(cursor, user_ids):
+    #Drop everything but the newest FEED_LENGTH items of the given users
+    for chunk in chunks(user_ids):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"""
+            DELETE f FROM User_Feed f
+            JOIN (
+                SELECT User_ID, Item_ID FROM (
+                    SELECT User_ID, Item_ID, ROW_NUMBER() OVER (PARTITION BY User_ID ORDER BY Item_ID DESC) AS Recent
+                    FROM User_Feed WHERE User_ID IN ({placeholders})
+                ) AS Ranked
+                WHERE Recent > %s
+            ) AS Old ON Old.User_ID = f.User_ID AND Old.Item_ID = f.Item_ID
+        """, chunk + [FEED_LENGTH])
+
+def add_items(conn, items, commit=True):
+    """Insert feed items and trim the feeds they went to, returns the number of items.
+
+    Pass commit=False to make them part of the caller's transaction.
+    """
+    if items.empty:
+        return 0
+    write_cursor = dbconnection.prepared_cursor(conn)
+    dbconnection.insert_rows(write_cursor, 'User_Feed', FEED_COLUMNS, dbconnection.frame_rows(items, FEED_COLUMNS))
+    write_cursor.close()
+    cursor = conn.cursor()
+    trim_feeds(cursor, set(items['User_ID'].tolist()))
+    cursor.close()
+    if commit:
+        conn.commit()
+        queries.invalidate_cache(conn)
+    return len(items)
+
+def fan_out_matches(conn):
+    """Add the matches inserted since the last run to their teams' followers' feeds.
+
+    The feed items and the watermark are committed together. Returns the
+    number of feed items added.
+    """
+    with loadmetrics.stage('feed.matches'):
+        added = add_new_matches(conn)
+    loadmetrics.add_rows('feed.matches', added)
+    return added
+
+def add_new_matches(conn):
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.close()
+    last_id = int(loadstate.get_state(conn, LAST_MATCH_STATE, 0))
+
+    # Match_ID ranges commit out of order, so only up to the first one still being inserted
+    # (matchesloader --resume may also delete parts of an interrupted one)
+    max_id = loadjournal.committed_until(conn)
+    if max_id <= last_id:
+        print("User feeds are up to date.")
+        return 0
+
+    added = 0
+    try:
+        for matches in aggregates.read_new_matches(conn, last_id, max_id):
+            added += add_items(conn, match_items(conn, matches), commit=False)
+        loadstate.set_state(conn, LAST_MATCH_STATE, max_id, commit=False)
+        conn.commit()
+        queries.invalidate_cache(conn)
+    except Exception:
+        conn.rollback()
+        raise
+
+    print(f"User feeds: {added} match items added in {time.perf_counter() - started:.1f}s")
+    return added
+
+def fan_out_rating_changes(conn, changes):
+    #Add player rating changes to their followers' feeds, changes as in rating_items
+    if not changes:
+        return 0
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.close()
+    with loadmetrics.stage('feed.ratings'):
+        added = add_items(conn, rating_items(conn, changes))
+    loadmetrics.add_rows('feed.ratings', added)
+    print(f"User feeds: {added} rating change items added")
+    return added
+
+def refill_user(conn, user_id):
+    #Fill a user's feed from the latest FEED_LENGTH matches of their favorite teams
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.execute("SELECT Team_ID FROM Favorite_Teams WHERE User_ID = %s", (user_id,))
+    teams = [row[0] for row in cursor.fetchall()]
+    if not teams:
+        cursor.close()
+        return 0
+    placeholders = ", ".join(["%s"] * len(teams))
+    # the (Home_Team, Match_Date) and (Away_Team, Match_Date) indexes serve both halves
+    cursor.execute(f"""
+        SELECT Match_ID, Match_Date, Match_Tournament, Home_Goals, Away_Goals, Home_Team, Away_Team FROM (
+            (SELECT * FROM Matches WHERE Home_Team IN ({placeholders}) ORDER BY Match_Date DESC LIMIT %s)
+            UNION
+            (SELECT * FROM Matches WHERE Away_Team IN ({placeholders}) ORDER BY Match_Date DESC LIMIT %s)
+        ) AS Recent
+    """, teams + [FEED_LENGTH] + teams + [FEED_LENGTH])
+    matches = pd.DataFrame(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+    cursor.execute("DELETE FROM User_Feed WHERE User_ID = %s AND Item_Type = 'match'", (user_id,))
+    cursor.close()
+    if matches.empty:
+        conn.commit()
+        return 0
+    followers = pd.DataFrame({'User_ID': user_id, 'Team_ID': teams})
+    return add_items(conn, match_items(conn, matches, followers))
+
+def rebuild_feeds(conn):
+    #Empty User_Feed and fan out every match again (rating change items can't be recreated)
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.execute("DELETE FROM User_Feed")
+    cursor.close()
+    loadstate.set_state(conn, LAST_MATCH_STATE, 0, commit=False)
+    conn.commit()
+    return fan_out_matches(conn)
+
+def run(args):
+    conn = dbconnection.get_connection()
+    try:
+        if args.refill is not None:
+            print(f"User {args.refill}: {refill_user(conn, args.refill)} feed items")
+        elif args.rebuild:
+            rebuild_feeds(conn)
+        else:
+            fan_out_matches(conn)
+    finally:
+        conn.close()
+
+def add_arguments(parser):
+    parser.add_argument("--rebuild", action="store_true",
+                        help="empty User_Feed and fan out all of Matches again")
+    parser.add_argument("--refill", type=int, metavar="USER_ID",
+                        help="fill one user's feed from the latest matches of their favorite teams")
+
+def main():
+    parser = argparse.ArgumentParser(description="Add new matches to the feeds of the users following the teams")
+    add_arguments(parser)
+    try:
+        run(parser.parse_args())
+    except Exception as e:
+        print(f"Error updating user feeds: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import json
+import threading
+import pandas as pd
+import dbconnection
+import loadmetrics
+
+# Column-wise validation and type coercion for the source files, run right after
+# parsing. Every source has a schema, each column is coerced in one vectorized
+# pass and rows that fail are set aside with a reason code (the first check they
+# failed) instead of raising per row. Rejected rows are written in bulk to the
+# Load_Rejects table together with the raw values, so they can be looked at and
+# fixed at the source. Reject counts also show up in the run metrics as skipped
+# rows, with the reason code (e.g. missing_home, out_of_range_gh, bad_date).
+#
+# Column rules:
+#   type      'str', 'int' or 'date' (YYYY-MM-DD)
+#   required  missing/empty values reject the row (otherwise default is used)
+#   default   value for missing cells, None keeps them missing
+#   min, max  range for int columns, values outside reject the row
+
+MATCHES_SCHEMA = {
+    'home': {'type': 'str', 'required': True},
+    'away': {'type': 'str', 'required': True},
+    'date': {'type': 'date'},
+    'competition': {'type': 'str', 'default': ''},
+    'gh': {'type': 'int', 'default': 0, 'min': 0, 'max': 99},
+    'ga': {'type': 'int', 'default': 0, 'min': 0, 'max': 99},
+}
+
+RATING = {'type': 'int', 'default': 50, 'min': 0, 'max': 99}
+PLAYERS_SCHEMA = {
+    'Name': {'type': 'str', 'default': 'Unknown Player'},
+    'Preffered_Position': {'type': 'str', 'default': 'Unknown'},
+    'Rating': RATING,
+    'Ball_Control': RATING,
+    'Stamina': RATING,
+    'Composure': RATING,
+    'Short_Pass': RATING,
+    'Shot_Power': RATING,
+    'Agility': RATING,
+    'Penalties': RATING,
+    'Freekick_Accuracy': RATING,
+    'Strength': RATING,
+}
+
+STADIUMS_SCHEMA = {
+    'Stadium': {'type': 'str', 'required': True},
+    'Country': {'type': 'str', 'default': 'Unknown'},
+    'City': {'type': 'str', 'default': 'Unknown'},
+    'Confederation': {'type': 'str', 'default': 'Unknown'},
+}
+
+LOAD_REJECTS_QUERY = """
+    CREATE TABLE IF NOT EXISTS Load_Rejects (
+        Reject_ID INT PRIMARY KEY AUTO_INCREMENT,
+        Source VARCHAR(64),
+        Source_Row INT,
+        Reason VARCHAR(64),
+        Raw_Row TEXT,
+        Rejected_At TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX Load_Rejects_Source_Reason (Source, Reason)
+    )
+"""
+
+REJECT_COLUMNS = ['Source', 'Source_Row', 'Reason', 'Raw_Row']
+
+# Rejects found while parsing, kept per source until the import step writes them
+_pending = {}
+_pending_lock = threading.Lock()
+
+# CREATE TABLE commits implicitly, so only the first time per process (like loadstate)
+_table_ready = False
+
+def coerce_column(values, rule):
+    """Coerce one column, returns (coerced values, [(failed mask, reason suffix)])."""
+    kind = rule['type']
+    failures = []
+    if kind == 'str':
+        missing = values.isna() | (values.astype(str).str.strip() == '')
+        coerced = values.astype(object).where(~missing, None)
+        coerced = coerced.where(missing, values.astype(str))
+    elif kind == 'int':
+        numbers = pd.to_numeric(values, errors='coerce')
+        missing = values.isna() | (values.astype(str).str.strip() == '')
+        failures.append((numbers.isna() & ~missing, 'bad'))
+        if 'min' in rule:
+            failures.append((numbers < rule['min'], 'out_of_range'))
+        if 'max' in rule:
+            failures.append((numbers > rule['max'], 'out_of_range'))
+        failures.append((numbers.notna() & (numbers != numbers.round()), 'bad'))
+        coerced = numbers.round().astype('Int64')
+    elif kind == 'date':
+        if pd.api.types.is_datetime64_any_dtype(values):
+            parsed = values
+        else:
+            parsed = pd.to_datetime(values.astype(str).str.slice(0, 10), format='%Y-%m-%d', errors='coerce')
+        missing = values.isna() | (values.astype(str).str.strip() == '')
+        failures.append((parsed.isna() & ~missing, 'bad'))
+        coerced = parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None)
+    else:
+        raise ValueError(f"unknown column type {kind}")
+
+    if rule.get('required'):
+        failures.insert(0, (missing, 'missing'))
+    elif rule.get('default') is not None:
+        coerced = coerced.where(~missing, rule['default'])
+    return coerced, failures
+
+def validate(frame, schema, source, row_offset=0):
+    """Coerce the schema's columns of a frame and set failing rows aside.
+
+    Columns of the schema that the frame doesn't have are skipped, the
+    loaders fill those in themselves. Returns the valid rows (original index
+    kept) and the number of rejects, the rejects are kept until
+    save_rejects(conn, source) writes them.
+    """
+    original = frame
+    frame = frame.copy()
+    reasons = pd.Series(None, index=frame.index, dtype=object)
+    for column, rule in schema.items():
+        if column not in frame.columns:
+            continue
+        coerced, failures = coerce_column(frame[column], rule)
+        for failed, reason in failures:
+            failed = failed.fillna(False).astype(bool)
+            reasons = reasons.mask(failed & reasons.isna(), f"{reason}_{column}")
+        frame[column] = coerced
+
+    rejected = reasons.notna()
+    if rejected.any():
+        # the values as they were in the file, before coercion
+        raw = original.loc[rejected]
+        rejects = pd.DataFrame({
+            'Source': source,
+            'Source_Row': [row_offset + position for position in (rejected.to_numpy().nonzero()[0])],
+            'Reason': reasons[rejected].tolist(),
+            'Raw_Row': [json.dumps(row, default=str) for row in raw.astype(object).where(raw.notna(), None).to_dict('records')],
+        })
+        with _pending_lock:
+            _pending.setdefault(source, []).append(rejects)
+        summary = rejects['Reason'].value_counts()
+        for reason, count in summary.items():
+            loadmetrics.skip(source, reason, count)
+        print(f"Rejected {int(rejected.sum())} {source} rows: " + ", ".join(f"{reason} {count}" for reason, count in summary.items()))
+    return frame[~rejected], int(rejected.sum())
+
+def ensure_table(cursor):
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(LOAD_REJECTS_QUERY)
+        _table_ready = True
+
+def pending_count(source):
+    #How many rejects of a source are waiting to be saved
+    with _pending_lock:
+        return sum(len(frame) for frame in _pending.get(source, []))
+
+def discard_rejects(source):
+    #Drop the pending rejects of a source, for an import that stops before saving them
+    with _pending_lock:
+        _pending.pop(source, None)
+
+def save_rejects(conn, source, commit=True, before_row=None):
+    """Write the pending rejects of a source to Load_Rejects in bulk, returns how many.
+
+    Pass commit=False to make them part of the caller's transaction, call
+    ensure_table before the transaction's first write then (the CREATE TABLE
+    commits implicitly). With before_row only the rejects of source rows before
+    it are written, the rest stay pending for a later call.
+    """
+    with _pending_lock:
+        frames = _pending.pop(source, [])
+        if frames and before_row is not None:
+            rejects = pd.concat(frames, ignore_index=True)
+            later = rejects['Source_Row'] >= before_row
+            if later.any():
+                _pending[source] = [rejects[later]]
+            frames = [rejects[~later]]
+    rejects = pd.concat(frames, ignore_index=True) if frames else None
+    if rejects is None or rejects.empty:
+        return 0
+    cursor = conn.cursor()
+    ensure_table(cursor)
+    cursor.close()
+    cursor = dbconnection.prepared_cursor(conn)
+    dbconnection.insert_rows(cursor, 'Load_Rejects', REJECT_COLUMNS,
+                             list(zip(*(rejects[col].tolist() for col in REJECT_COLUMNS))))
+    cursor.close()
+    if commit:
+        conn.commit()
+    print(f"Saved {len(rejects)} rejected {source} rows to Load_Rejects")
+    return len(rejects)